@@ -0,0 +1,185 @@
+"""
+Локальные заглушки Telegram Bot API и OpenAI-совместимого API (OpenRouter)
+для нагрузочного тестирования.
+
+Заглушка LLM отвечает с задаваемой задержкой и долей ошибок, в том числе
+потоково (SSE). Заглушка Telegram принимает sendMessage/editMessageText и
+прочие методы и сразу отвечает успехом.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from typing import Dict, Tuple
+
+from aiohttp import web
+
+# Usage ответа: часть промпта (системный префикс) провайдер взял из кеша
+FAKE_USAGE = {"prompt_tokens": 500, "completion_tokens": 120, "total_tokens": 620,
+              "prompt_tokens_details": {"cached_tokens": 384}}
+
+# Ответ заглушки LLM: ~60 слов, отдается потоково по словам
+FAKE_ANSWER = " ".join(["Консультант ПрофЭксперт подробно отвечает на вопрос клиента."] * 8)
+
+
+class FakeOpenRouter:
+    """OpenAI-совместимый /v1/chat/completions с задержкой и ошибками (и /v1/models для прогрева)."""
+
+    def __init__(self, latency: float = 0.5, jitter: float = 0.2, error_rate: float = 0.0,
+                 stream_chunks: int = 20, chunk_interval: float = 0.01):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.stream_chunks = stream_chunks
+        self.chunk_interval = chunk_interval
+        self.requests = 0
+        self.errors = 0
+
+    def create_app(self) -> web.Application:
+        """aiohttp приложение заглушки."""
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.handle_completion)
+        app.router.add_get('/v1/models', self.handle_models)
+        return app
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        """Список моделей (запрос прогрева соединения при запуске бота)."""
+        return web.json_response({"object": "list", "data": [
+            {"id": "fake-model", "object": "model", "created": 0, "owned_by": "bench"}
+        ]})
+
+    async def handle_completion(self, request: web.Request) -> web.StreamResponse:
+        """Ответить как chat.completions: JSON или поток SSE."""
+        body = await request.json()
+        self.requests += 1
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        if random.random() < self.error_rate:
+            self.errors += 1
+            status = random.choice([429, 500, 502])
+            return web.json_response({"error": {"message": "fake upstream error", "code": status}}, status=status)
+
+        model = body.get("model", "fake-model")
+        if body.get("stream"):
+            return await self._stream(request, model)
+
+        return web.json_response({
+            "id": f"fake-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": FAKE_ANSWER}, "finish_reason": "stop"}],
+            "usage": FAKE_USAGE
+        })
+
+    async def _stream(self, request: web.Request, model: str) -> web.StreamResponse:
+        """Поток chat.completion.chunk в формате SSE."""
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        words = FAKE_ANSWER.split(" ")
+        size = max(1, len(words) // self.stream_chunks)
+        for start in range(0, len(words), size):
+            text = " ".join(words[start:start + size]) + " "
+            await response.write(self._event(model, [{"index": 0, "delta": {"content": text}, "finish_reason": None}]))
+            await asyncio.sleep(self.chunk_interval)
+
+        await response.write(self._event(model, [], FAKE_USAGE))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    def _event(self, model: str, choices: list, usage: dict = None) -> bytes:
+        """Одно событие SSE."""
+        chunk = {
+            "id": f"fake-{self.requests}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": choices,
+            "usage": usage
+        }
+        return f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class FakeTelegram:
+    """Bot API: /bot<token>/<method> отвечает успехом без задержки."""
+
+    def __init__(self):
+        self._message_ids = itertools.count(1)
+        self.calls: Dict[str, int] = {}
+
+    def create_app(self) -> web.Application:
+        """aiohttp приложение заглушки."""
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle_method)
+        return app
+
+    async def handle_method(self, request: web.Request) -> web.Response:
+        """Ответить на вызов метода Bot API."""
+        method = request.match_info['method']
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if request.content_type == 'application/json':
+            params = await request.json()
+        else:
+            params = dict(await request.post())
+
+        if method in ('sendMessage', 'editMessageText'):
+            chat_id = int(params.get('chat_id', 0))
+            message_id = int(params['message_id']) if method == 'editMessageText' else next(self._message_ids)
+            result = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "Bench"},
+                "text": params.get('text', '')
+            }
+        elif method == 'getMe':
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+
+async def start_fake_servers(host: str = "127.0.0.1", llm_options: Dict = None) -> Tuple[web.AppRunner, str, str, FakeOpenRouter, FakeTelegram]:
+    """
+    Запустить обе заглушки в текущем event loop на свободных портах.
+
+    Returns:
+        Runner (для остановки), адрес Telegram API, адрес LLM API и сами заглушки
+    """
+    fake_llm = FakeOpenRouter(**(llm_options or {}))
+    fake_telegram = FakeTelegram()
+
+    app = web.Application()
+    app.add_subapp('/llm/', fake_llm.create_app())
+    app.add_subapp('/telegram/', fake_telegram.create_app())
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=host, port=0)
+    await site.start()
+    port = runner.addresses[0][1]
+    base = f"http://{host}:{port}"
+    return runner, f"{base}/telegram", f"{base}/llm/v1", fake_llm, fake_telegram
+
+
+def run_fake_servers_process(llm_options: Dict, addresses) -> None:
+    """
+    Точка входа отдельного процесса с заглушками: нагрузка на заглушки
+    не должна влиять на измерения бота (event loop, CPU).
+    """
+    async def serve() -> None:
+        runner, telegram_url, llm_url, _, _ = await start_fake_servers(llm_options=llm_options)
+        addresses.put((telegram_url, llm_url))
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await runner.cleanup()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,316 @@
+"""
+Нагрузочный тест бота на локальных заглушках Telegram и OpenRouter.
+
+Виртуальные пользователи отправляют синтетические обновления в диспетчер
+aiogram (llm_handler -> UserDispatcher -> process_user_batch -> LLMClient),
+каждый ждет ответа на свое сообщение и только потом отправляет следующее.
+Бот ходит по HTTP в заглушки, поэтому измеряется весь путь: очередь,
+планировщик, пул соединений, потоковая выдача и запись логов.
+
+Время ответа считается до доставки в заглушку Telegram (а не до постановки
+в очередь отправки). Лимиты отправки Telegram по умолчанию сняты, чтобы
+измерять бота, а не ограничитель; --telegram-limits включает рабочие.
+
+Отчет: сообщений в секунду, p50/p95/p99 времени ответа, RSS процесса и
+задержка event loop.
+
+Запуск:
+    python bench/run_bench.py --users 200 --messages 5 --llm-latency 0.8
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiogram import Bot, Dispatcher, types
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config import config_store
+from handlers import llm_handler, process_user_batch
+from llm_client import LLMClient
+from logger import start_log_writer, stop_log_writer
+from outbound import configure_outbound, outbound_sender
+from user_dispatcher import UserBatch, UserDispatcher
+
+from fake_servers import run_fake_servers_process, start_fake_servers
+
+# Токен в формате Telegram (aiogram проверяет формат), запросы уходят в заглушку
+BENCH_TOKEN = "123456:BENCH-token"
+
+# Лимиты отправки, которые заглушка Telegram никогда не исчерпает
+UNLIMITED_OUTBOUND = {'global_rate': 1_000_000, 'global_burst': 1_000_000,
+                      'chat_rate': 1_000_000, 'chat_burst': 1_000_000}
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Перцентиль (0..1) по списку значений или None, если значений нет."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def current_rss_mb() -> float:
+    """Текущий RSS процесса в MB (где /proc недоступен - максимальный)."""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024, 1)
+    except (OSError, ValueError):
+        return max_rss_mb()
+
+
+def max_rss_mb() -> float:
+    """Максимальный RSS процесса в MB."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает KB, macOS - байты
+    return round(maxrss / 1024 / (1024 if sys.platform == 'darwin' else 1), 1)
+
+
+async def sample_loop_lag(samples: List[float], interval: float = 0.05) -> None:
+    """Замерять, на сколько позже запланированного просыпается event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+def configure_for_bench(llm_url: str, stream: bool, debounce: float, cache: bool,
+                        telegram_limits: bool = False) -> None:
+    """
+    Настроить бота на заглушки поверх settings.yaml.
+
+    История хранится только в памяти, лимит запросов пользователя снят
+    (виртуальные пользователи шлют сообщения чаще живых), лимиты отправки
+    в Telegram сняты, если не задан telegram_limits, остальное - как в
+    рабочей конфигурации.
+    """
+    config_store.reload()
+    settings = config_store.config
+    settings.setdefault('llm', {}).update({'base_url': llm_url, 'stream': stream})
+    settings.setdefault('memory', {})['backend'] = 'memory'
+    settings.setdefault('scheduler', {}).update({'user_rate_per_minute': 1_000_000, 'user_burst': 1_000_000})
+    settings.setdefault('user_dispatcher', {})['debounce_seconds'] = debounce
+    settings.setdefault('response_cache', {})['enabled'] = cache
+    if not telegram_limits:
+        settings.setdefault('outbound', {}).update(UNLIMITED_OUTBOUND)
+    configure_outbound()
+
+
+def make_update(update_id: int, user_id: int, text: str, bot: Bot) -> types.Update:
+    """Синтетическое обновление с текстовым сообщением пользователя."""
+    raw = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"},
+            "text": text
+        }
+    }
+    # Сразу привязываем к боту, чтобы диспетчер не пересоздавал обновление
+    return types.Update.model_validate(raw, context={"bot": bot})
+
+
+async def run_benchmark(users: int = 50, messages_per_user: int = 5, think_time: float = 0.0,
+                        llm_latency: float = 0.5, llm_jitter: float = 0.2, error_rate: float = 0.0,
+                        stream: bool = True, debounce: float = 0.0, cache: bool = False,
+                        response_timeout: float = 120.0, separate_process: bool = False,
+                        telegram_limits: bool = False) -> Dict[str, Any]:
+    """
+    Прогнать нагрузку и вернуть метрики.
+
+    Args:
+        users: Число одновременных виртуальных пользователей
+        messages_per_user: Сколько сообщений отправляет каждый
+        think_time: Пауза пользователя между ответом и следующим сообщением
+        llm_latency, llm_jitter, error_rate: Поведение заглушки OpenRouter
+        separate_process: Запустить заглушки в отдельном процессе, чтобы
+            они не делили event loop и CPU с ботом
+        telegram_limits: Оставить рабочие лимиты отправки в Telegram
+
+    Returns:
+        Словарь с пропускной способностью, перцентилями, RSS и задержкой loop
+    """
+    llm_options = {'latency': llm_latency, 'jitter': llm_jitter, 'error_rate': error_rate}
+    runner = fake_llm = fake_telegram = server_process = None
+    if separate_process:
+        context = multiprocessing.get_context("spawn")
+        addresses = context.Queue()
+        server_process = context.Process(target=run_fake_servers_process, args=(llm_options, addresses), daemon=True)
+        server_process.start()
+        telegram_url, llm_url = await asyncio.get_running_loop().run_in_executor(None, addresses.get, True, 30)
+    else:
+        runner, telegram_url, llm_url, fake_llm, fake_telegram = await start_fake_servers(llm_options=llm_options)
+
+    configure_for_bench(llm_url, stream, debounce, cache, telegram_limits)
+    start_log_writer()
+
+    bot = Bot(token=BENCH_TOKEN, session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_url)))
+    llm_client = LLMClient()
+    latencies: List[float] = []
+    waiters: Dict[int, asyncio.Future] = {}
+    failed = 0
+
+    async def process(batch: UserBatch) -> None:
+        nonlocal failed
+        try:
+            await process_user_batch(batch, llm_client)
+            # Ответ пока только в очереди отправки - время считаем до доставки
+            if await outbound_sender.wait_sent(batch.last_message.chat.id):
+                latencies.append(time.time() - batch.received_at)
+            else:
+                failed += 1
+        finally:
+            waiter = waiters.pop(batch.user_id, None)
+            if waiter is not None and not waiter.done():
+                waiter.set_result(None)
+
+    user_dispatcher = UserDispatcher(process, debounce_seconds=debounce)
+    # Только обработчик текстовых сообщений - как в боте, но без общего роутера
+    dp = Dispatcher(llm_client=llm_client, user_dispatcher=user_dispatcher)
+    dp.message.register(llm_handler)
+
+    update_ids = iter(range(1, 1 << 62))
+    timeouts = 0
+
+    async def virtual_user(user_id: int) -> None:
+        nonlocal timeouts
+        loop = asyncio.get_running_loop()
+        for n in range(messages_per_user):
+            waiter = loop.create_future()
+            waiters[user_id] = waiter
+            await dp.feed_update(bot, make_update(next(update_ids), user_id, f"Вопрос {n} про услуги компании", bot))
+            try:
+                await asyncio.wait_for(waiter, response_timeout)
+            except asyncio.TimeoutError:
+                timeouts += 1
+            if think_time:
+                await asyncio.sleep(think_time)
+
+    lag_samples: List[float] = []
+    lag_sampler = asyncio.create_task(sample_loop_lag(lag_samples))
+    rss_before = current_rss_mb()
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(virtual_user(1000 + index) for index in range(users)))
+        elapsed = time.monotonic() - started
+    finally:
+        lag_sampler.cancel()
+        await user_dispatcher.close(timeout=response_timeout)
+        # Не отправленные за время ожидания ответы отменяются и считаются недоставленными
+        failed += await outbound_sender.close(timeout=response_timeout)
+        await llm_client.close()
+        await bot.session.close()
+        stop_log_writer()
+        if runner is not None:
+            await runner.cleanup()
+        if server_process is not None:
+            server_process.terminate()
+            server_process.join(5)
+
+    result = {
+        "users": users,
+        "messages": users * messages_per_user,
+        "answered": len(latencies),
+        "timeouts": timeouts,
+        "failed": failed,
+        "elapsed_seconds": round(elapsed, 3),
+        "messages_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "latency_p50": percentile(latencies, 0.50),
+        "latency_p95": percentile(latencies, 0.95),
+        "latency_p99": percentile(latencies, 0.99),
+        "rss_start_mb": rss_before,
+        "rss_end_mb": current_rss_mb(),
+        "max_rss_mb": max_rss_mb(),
+        "loop_lag_p50": percentile(lag_samples, 0.50),
+        "loop_lag_p99": percentile(lag_samples, 0.99),
+        "loop_lag_max": max(lag_samples, default=None),
+        "models": llm_client.router.get_stats()
+    }
+    if fake_llm is not None:
+        result["llm_requests"] = fake_llm.requests
+        result["llm_errors"] = fake_llm.errors
+        result["telegram_calls"] = dict(fake_telegram.calls)
+    return result
+
+
+def format_report(result: Dict[str, Any]) -> str:
+    """Отчет для вывода в консоль."""
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value * 1000:.0f}ms"
+
+    lines = [
+        f"Пользователей: {result['users']}, сообщений: {result['messages']}, "
+        f"отвечено: {result['answered']}, без ответа: {result['timeouts']}, не доставлено: {result['failed']}",
+        f"Время: {result['elapsed_seconds']}s, пропускная способность: {result['messages_per_second']} msg/s",
+        f"Время ответа: p50 {ms(result['latency_p50'])}, p95 {ms(result['latency_p95'])}, p99 {ms(result['latency_p99'])}",
+        f"RSS: {result['rss_start_mb']} -> {result['rss_end_mb']} MB (max {result['max_rss_mb']} MB)",
+        f"Задержка event loop: p50 {ms(result['loop_lag_p50'])}, p99 {ms(result['loop_lag_p99'])}, "
+        f"max {ms(result['loop_lag_max'])}"
+    ]
+    if 'llm_requests' in result:
+        lines.append(f"Запросов к LLM: {result['llm_requests']} (ошибок заглушки: {result['llm_errors']}), "
+                     f"вызовы Telegram: {result['telegram_calls']}")
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Аргументы командной строки."""
+    parser = argparse.ArgumentParser(description="Нагрузочный тест бота на локальных заглушках")
+    parser.add_argument('--users', type=int, default=50, help="одновременных виртуальных пользователей")
+    parser.add_argument('--messages', type=int, default=5, help="сообщений от каждого пользователя")
+    parser.add_argument('--think-time', type=float, default=0.0, help="пауза пользователя между сообщениями, s")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="средняя задержка заглушки LLM, s")
+    parser.add_argument('--llm-jitter', type=float, default=0.2, help="разброс задержки заглушки LLM, s")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов LLM с ошибкой (429/5xx)")
+    parser.add_argument('--no-stream', action='store_true', help="ответ целиком вместо потоковой выдачи")
+    parser.add_argument('--debounce', type=float, default=0.0, help="debounce очереди сообщений пользователя, s")
+    parser.add_argument('--cache', action='store_true', help="включить кеш ответов")
+    parser.add_argument('--separate-process', action='store_true', help="заглушки в отдельном процессе")
+    parser.add_argument('--telegram-limits', action='store_true',
+                        help="рабочие лимиты отправки в Telegram (outbound) вместо снятых")
+    parser.add_argument('--json', action='store_true', help="вывести результат в JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа CLI."""
+    args = parse_args(argv)
+    # Логи приложения в консоли мешают отчету
+    logging.basicConfig(level=logging.WARNING)
+    os.environ.setdefault("OPENROUTER_API_KEY", "bench")
+    result = asyncio.run(run_benchmark(
+        users=args.users,
+        messages_per_user=args.messages,
+        think_time=args.think_time,
+        llm_latency=args.llm_latency,
+        llm_jitter=args.llm_jitter,
+        error_rate=args.error_rate,
+        stream=not args.no_stream,
+        debounce=args.debounce,
+        cache=args.cache,
+        separate_process=args.separate_process,
+        telegram_limits=args.telegram_limits
+    ))
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Отчет по JSON логам бота за период.
+
+Читает logs/llm_requests_*, conversations_* и errors_* (в том числе
+сжатые .gz и файлы воркеров *-w<N>_*) построчно, не загружая файлы в
+память целиком. Каждый день обрабатывается в отдельном процессе, итоги
+дней объединяются.
+
+Время ответа копится в логарифмической гистограмме (точность ~1%), поэтому
+перцентили считаются по всему периоду без хранения всех значений.
+
+Запуск:
+    python src/analytics.py                       # за вчера
+    python src/analytics.py --from 2024-05-01 --to 2024-05-31 --json
+"""
+
+import argparse
+import gzip
+import json
+import math
+import os
+import sys
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, IO, Iterator, List, Optional
+
+from config import get_section
+from logger import LOG_FILE_PATTERN, get_logs_dir
+
+# Типы JSON логов, которые разбирает отчет
+LOG_KINDS = ('llm_requests', 'conversations', 'errors')
+
+# Основание логарифмических корзин гистограммы: соседние корзины отличаются на 1%
+_BUCKET_BASE = 1.01
+_LOG_BASE = math.log(_BUCKET_BASE)
+
+
+class LatencyHistogram:
+    """Гистограмма времени ответа (мс) с логарифмическими корзинами."""
+
+    __slots__ = ("buckets", "count")
+
+    def __init__(self):
+        self.buckets: Counter = Counter()
+        self.count = 0
+
+    def add(self, value_ms: float) -> None:
+        """Учесть значение."""
+        self.buckets[int(math.log(max(value_ms, 1)) / _LOG_BASE)] += 1
+        self.count += 1
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        """Добавить значения другой гистограммы."""
+        self.buckets.update(other.buckets)
+        self.count += other.count
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Перцентиль (0..1) в мс или None, если значений нет."""
+        if not self.count:
+            return None
+        rank = min(self.count - 1, int(q * self.count))
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen > rank:
+                # Середина корзины
+                return round(_BUCKET_BASE ** (bucket + 0.5))
+        return None
+
+
+class ModelUsage:
+    """Запросы, токены и время ответа одной модели."""
+
+    __slots__ = ("requests", "statuses", "prompt_tokens", "completion_tokens", "cached_tokens", "latency")
+
+    def __init__(self):
+        self.requests = 0
+        self.statuses: Counter = Counter()
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.latency = LatencyHistogram()
+
+    def merge(self, other: "ModelUsage") -> None:
+        """Добавить данные другого периода."""
+        self.requests += other.requests
+        self.statuses.update(other.statuses)
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.cached_tokens += other.cached_tokens
+        self.latency.merge(other.latency)
+
+    def cost(self, pricing: Dict[str, Any]) -> Optional[float]:
+        """
+        Стоимость по цене за миллион токенов (None, если цена не задана).
+
+        Токены промпта из кеша провайдера считаются по cached_prompt_per_million
+        (если цена не задана - как обычные).
+        """
+        if not pricing:
+            return None
+        prompt_price = pricing.get('prompt_per_million', 0)
+        cached_price = pricing.get('cached_prompt_per_million', prompt_price)
+        return ((self.prompt_tokens - self.cached_tokens) * prompt_price
+                + self.cached_tokens * cached_price
+                + self.completion_tokens * pricing.get('completion_per_million', 0)) / 1_000_000
+
+
+class LogStats:
+    """Итоги разбора логов за день или за весь период."""
+
+    def __init__(self):
+        self.days: List[str] = []
+        self.models: Dict[str, ModelUsage] = defaultdict(ModelUsage)
+        self.conversations = 0
+        self.response_latency = LatencyHistogram()
+        self.errors: Counter = Counter()
+        self.user_messages: Counter = Counter()
+        self.user_tokens: Counter = Counter()
+        self.intents: Counter = Counter()
+        self.bad_lines = 0
+
+    def merge(self, other: "LogStats") -> None:
+        """Добавить итоги другого дня."""
+        self.days.extend(other.days)
+        for model, usage in other.models.items():
+            self.models[model].merge(usage)
+        self.conversations += other.conversations
+        self.response_latency.merge(other.response_latency)
+        self.errors.update(other.errors)
+        self.user_messages.update(other.user_messages)
+        self.user_tokens.update(other.user_tokens)
+        self.intents.update(other.intents)
+        self.bad_lines += other.bad_lines
+
+    def add_llm_request(self, entry: Dict[str, Any]) -> None:
+        """Учесть запись llm_requests."""
+        usage = self.models[entry.get('model') or 'unknown']
+        status = entry.get('status') or 'unknown'
+        usage.requests += 1
+        usage.statuses[status] += 1
+        prompt_tokens = entry.get('prompt_tokens') or 0
+        completion_tokens = entry.get('completion_tokens') or 0
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+        usage.cached_tokens += entry.get('cached_tokens') or 0
+        if prompt_tokens or completion_tokens:
+            self.user_tokens[entry.get('user_id')] += prompt_tokens + completion_tokens
+        # Перцентили - по ответам модели; кеш и отказы считаются отдельно в статусах
+        if status == 'success' and entry.get('response_time_ms') is not None:
+            usage.latency.add(entry['response_time_ms'])
+
+    def add_conversation(self, entry: Dict[str, Any]) -> None:
+        """Учесть запись conversations."""
+        self.conversations += 1
+        self.user_messages[entry.get('user_id')] += 1
+        if entry.get('intent'):
+            self.intents[entry['intent']] += 1
+        if entry.get('response_time_ms') is not None:
+            self.response_latency.add(entry['response_time_ms'])
+
+    def add_error(self, entry: Dict[str, Any]) -> None:
+        """Учесть запись errors."""
+        self.errors[entry.get('error_type') or 'unknown'] += 1
+
+
+def find_log_files(logs_dir: str, start: date, end: date) -> Dict[str, List[str]]:
+    """
+    JSON логи за период, сгруппированные по дням.
+
+    Returns:
+        День (YYYY-MM-DD) -> пути к файлам всех типов и воркеров за этот день
+    """
+    files: Dict[str, List[str]] = defaultdict(list)
+    for name in sorted(os.listdir(logs_dir)):
+        match = LOG_FILE_PATTERN.match(name)
+        if not match or match.group(1) not in LOG_KINDS or match.group(4) != 'json':
+            continue
+        if start <= date.fromisoformat(match.group(2)) <= end:
+            files[match.group(2)].append(os.path.join(logs_dir, name))
+    return dict(sorted(files.items()))
+
+
+def _open_log(path: str) -> IO[str]:
+    """Открыть лог на чтение (gzip распаковывается на лету)."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+
+def _read_entries(path: str, stats: LogStats) -> Iterator[Dict[str, Any]]:
+    """Записи файла по одной строке (битые строки пропускаются и считаются)."""
+    with _open_log(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Например, строка, оборванная при аварийной остановке
+                stats.bad_lines += 1
+                continue
+            if isinstance(entry, dict):
+                yield entry
+
+
+def analyze_day(day: str, paths: List[str]) -> LogStats:
+    """Разобрать все логи одного дня (выполняется в процессе пула)."""
+    stats = LogStats()
+    stats.days.append(day)
+    for path in paths:
+        kind = LOG_FILE_PATTERN.match(os.path.basename(path)).group(1)
+        add = {
+            'llm_requests': stats.add_llm_request,
+            'conversations': stats.add_conversation,
+            'errors': stats.add_error
+        }[kind]
+        for entry in _read_entries(path, stats):
+            add(entry)
+    return stats
+
+
+def analyze_logs(logs_dir: str, start: date, end: date, workers: Optional[int] = None) -> LogStats:
+    """Разобрать логи за период, по процессу на день."""
+    files = find_log_files(logs_dir, start, end)
+    total = LogStats()
+    if not files:
+        return total
+
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    if workers == 1:
+        for day, paths in files.items():
+            total.merge(analyze_day(day, paths))
+        return total
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for stats in pool.map(analyze_day, files.keys(), files.values()):
+            total.merge(stats)
+    return total
+
+
+def build_report(stats: LogStats, pricing: Dict[str, Dict[str, float]], top: int = 10) -> Dict[str, Any]:
+    """Отчет в виде словаря (для вывода и --json)."""
+    models = {}
+    for model, usage in sorted(stats.models.items()):
+        models[model] = {
+            "requests": usage.requests,
+            "statuses": dict(usage.statuses),
+            "prompt_tokens": usage.prompt_tokens,
+            "completion_tokens": usage.completion_tokens,
+            "cached_tokens": usage.cached_tokens,
+            "cost": usage.cost(pricing.get(model)),
+            "p50_ms": usage.latency.percentile(0.50),
+            "p95_ms": usage.latency.percentile(0.95),
+            "p99_ms": usage.latency.percentile(0.99)
+        }
+    costs = [model["cost"] for model in models.values() if model["cost"] is not None]
+    return {
+        "days": sorted(stats.days),
+        "conversations": stats.conversations,
+        "response_p50_ms": stats.response_latency.percentile(0.50),
+        "response_p95_ms": stats.response_latency.percentile(0.95),
+        "response_p99_ms": stats.response_latency.percentile(0.99),
+        "models": models,
+        "total_cost": round(sum(costs), 4) if costs else None,
+        "intents": dict(stats.intents.most_common()),
+        "errors": dict(stats.errors.most_common()),
+        "top_users_by_messages": stats.user_messages.most_common(top),
+        "top_users_by_tokens": stats.user_tokens.most_common(top),
+        "bad_lines": stats.bad_lines
+    }
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    """Отчет для вывода в консоль."""
+    def ms(value: Optional[float]) -> str:
+        return "-" if value is None else f"{value:.0f}ms"
+
+    if not report["days"]:
+        return "Логов за период не найдено"
+
+    lines = [
+        f"Период: {report['days'][0]} - {report['days'][-1]} ({len(report['days'])} дн.)",
+        f"Диалогов: {report['conversations']}, время ответа: p50 {ms(report['response_p50_ms'])}, "
+        f"p95 {ms(report['response_p95_ms'])}, p99 {ms(report['response_p99_ms'])}",
+        "",
+        "Модели:"
+    ]
+    for model, usage in report["models"].items():
+        cost = "-" if usage["cost"] is None else f"${usage['cost']:.4f}"
+        statuses = ", ".join(f"{status}: {count}" for status, count in sorted(usage["statuses"].items()))
+        lines.append(
+            f"  {model}: запросов {usage['requests']} ({statuses}), токены {usage['prompt_tokens']} "
+            f"(из кеша {usage['cached_tokens']}) + {usage['completion_tokens']}, стоимость {cost}, p50 {ms(usage['p50_ms'])}, "
+            f"p95 {ms(usage['p95_ms'])}, p99 {ms(usage['p99_ms'])}"
+        )
+    if report["total_cost"] is not None:
+        lines.append(f"  Итого стоимость: ${report['total_cost']:.4f}")
+
+    if report["intents"]:
+        answered = sum(report["intents"].values())
+        lines.extend(["", f"Ответы без LLM: {answered} из {report['conversations']}"])
+        lines.extend(f"  {intent}: {count}" for intent, count in report["intents"].items())
+
+    lines.extend(["", "Ошибки:"])
+    lines.extend(f"  {error_type}: {count}" for error_type, count in report["errors"].items())
+    if not report["errors"]:
+        lines.append("  нет")
+
+    lines.extend(["", "Самые активные пользователи (сообщений):"])
+    lines.extend(f"  {user_id}: {count}" for user_id, count in report["top_users_by_messages"])
+    lines.extend(["", "Больше всего токенов:"])
+    lines.extend(f"  {user_id}: {count}" for user_id, count in report["top_users_by_tokens"])
+
+    if report["bad_lines"]:
+        lines.extend(["", f"Пропущено битых строк: {report['bad_lines']}"])
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Аргументы командной строки."""
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    parser = argparse.ArgumentParser(description="Отчет по JSON логам бота за период")
+    parser.add_argument('--from', dest='start', default=yesterday, help="первый день (YYYY-MM-DD), по умолчанию вчера")
+    parser.add_argument('--to', dest='end', default=None, help="последний день (YYYY-MM-DD), по умолчанию --from")
+    parser.add_argument('--logs-dir', default=get_logs_dir(), help="папка с логами")
+    parser.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию - по числу ядер)")
+    parser.add_argument('--top', type=int, default=10, help="сколько пользователей показать")
+    parser.add_argument('--json', action='store_true', help="вывести отчет в JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Точка входа CLI."""
+    args = parse_args(argv)
+    start = date.fromisoformat(args.start)
+    end = date.fromisoformat(args.end) if args.end else start
+    if end < start:
+        sys.exit("--to раньше --from")
+
+    stats = analyze_logs(args.logs_dir, start, end, args.workers)
+    # Цены моделей за миллион токенов из секции analytics
+    pricing = get_section('analytics').get('pricing') or {}
+    report = build_report(stats, pricing, args.top)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
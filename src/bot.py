@@ -8,13 +8,31 @@ import asyncio
 import logging
 import os
 import sys
-from aiogram import Bot, Dispatcher
+import time
 from dotenv import load_dotenv
 
-from handlers import setup_handlers
+import metrics
+from config import get_section
 from logger import setup_logging
 
 
+def process_age() -> float:
+    """Сколько секунд назад запущен процесс (по /proc; где его нет - 0)."""
+    try:
+        with open('/proc/self/stat') as f:
+            # Поле 22 - время запуска в тиках с загрузки системы (после имени процесса в скобках)
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        return max(0.0, uptime - start_ticks / os.sysconf('SC_CLK_TCK'))
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+# Отсчет времени до готовности - от запуска процесса, включая импорты
+STARTED_AT = time.monotonic() - process_age()
+
+
 async def main():
     """Основная функция запуска бота."""
     # Настройка логирования в файлы
@@ -33,28 +51,44 @@ async def main():
     
     logging.info("LLM Consultant Bot starting...")
     
-    # Создаем бота и диспетчер
-    bot = Bot(token=bot_token)
-    dp = Dispatcher()
+    # Несколько процессов: этот процесс только раздает обновления воркерам
+    if get_section('workers').get('count', 1) > 1:
+        # Модуль нужен только в этом режиме
+        from supervisor import run_supervisor
+        await run_supervisor(bot_token)
+        return
     
-    # Настраиваем обработчики
-    setup_handlers(dp)
+    # Один процесс: бот, LLM клиент, очередь сообщений и диспетчер здесь же.
+    # aiogram, aiohttp и openai импортируются только сейчас, когда режим известен
+    from runtime import BotRuntime
+    imported = time.monotonic()
+    runtime = BotRuntime(bot_token)
     
     try:
-        logging.info("Бот запущен и готов к работе")
-        await dp.start_polling(bot)
+        started = time.monotonic()
+        await runtime.start()
+        warm_up_started = time.monotonic()
+        # Соединения открываются до приема обновлений - первые сообщения после деплоя их не ждут
+        await runtime.warm_up()
+        ready = time.monotonic()
+        metrics.time_to_ready_seconds.set(ready - STARTED_AT)
+        logging.info(f"Бот запущен и готов к работе за {ready - STARTED_AT:.2f}s "
+                     f"(запуск и импорты {imported - STARTED_AT:.2f}s, компоненты {warm_up_started - started:.2f}s, "
+                     f"прогрев {ready - warm_up_started:.2f}s)")
+        # Режим получения обновлений: webhook (если включен) или long polling
+        if get_section('webhook').get('enabled', False):
+            from webhook import get_webhook_config, run_webhook
+            await run_webhook(runtime.bot, runtime.dp, get_webhook_config())
+        else:
+            await runtime.dp.start_polling(runtime.bot)
     except KeyboardInterrupt:
         logging.info("Получен сигнал остановки")
     except Exception as e:
         logging.error(f"Критическая ошибка при работе бота: {e}")
         raise
     finally:
-        try:
-            await bot.session.close()
-            logging.info("Бот остановлен")
-        except Exception as e:
-            logging.error(f"Ошибка при закрытии сессии бота: {e}")
+        await runtime.stop()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    asyncio.run(main())
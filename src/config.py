@@ -1,12 +1,19 @@
 """
 Загрузка конфигурации из YAML файлов.
 Простая загрузка без валидации согласно convention.md.
+
+Файлы читаются один раз и хранятся в памяти (config_store). Повторное
+чтение происходит только при изменении файла (mtime) или по SIGHUP.
+Если при перечитывании файл не разбирается (например, сохранен не до
+конца), остается прежняя конфигурация.
 """
 
+import asyncio
 import yaml
 import os
 import logging
-from typing import Dict, Any
+import signal
+from typing import Dict, Any, Optional
 
 
 def get_project_root() -> str:
@@ -150,19 +157,143 @@ def load_prompts() -> Dict[str, str]:
         }
 
 
+def _read_yaml(name: str) -> Dict[str, Any]:
+    """Прочитать config/<name>; ошибки (в т.ч. пустой файл) не подменяются значениями по умолчанию."""
+    path = os.path.join(get_project_root(), 'config', name)
+    with open(path, 'r', encoding='utf-8') as f:
+        data = yaml.safe_load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"{path}: ожидается словарь, получено {type(data).__name__}")
+    return data
+
+
+class ConfigStore:
+    """Настройки и промпты в памяти с перезагрузкой при изменении файлов."""
+    
+    def __init__(self):
+        self._config: Optional[Dict[str, Any]] = None
+        self._prompts: Optional[Dict[str, str]] = None
+        self._mtimes: Dict[str, Optional[float]] = {}
+        # Номер успешной загрузки - по нему компоненты замечают перезагрузку
+        self.version = 0
+    
+    @property
+    def config(self) -> Dict[str, Any]:
+        """Текущие настройки (читаются с диска только при первом обращении)."""
+        if self._config is None:
+            self.reload()
+        return self._config
+    
+    @property
+    def prompts(self) -> Dict[str, str]:
+        """Текущие промпты (читаются с диска только при первом обращении)."""
+        if self._prompts is None:
+            self.reload()
+        return self._prompts
+    
+    def reload(self) -> bool:
+        """
+        Перечитать оба файла конфигурации.
+        
+        При первой загрузке ошибки заменяются настройками по умолчанию
+        (load_config/load_prompts). При перезагрузке файлы разбираются во
+        временные словари, и текущая конфигурация заменяется, только если
+        оба файла прочитаны без ошибок.
+        
+        Returns:
+            True если конфигурация заменена
+        """
+        mtimes = self._read_mtimes()
+        if self._config is None or self._prompts is None:
+            self._mtimes = mtimes
+            self._config = load_config() or {}
+            self._prompts = load_prompts() or {}
+            self.version += 1
+            return True
+        
+        # mtimes запоминаем и при ошибке: повторная попытка - при следующем изменении файла
+        self._mtimes = mtimes
+        try:
+            config = _read_yaml('settings.yaml')
+            prompts = _read_yaml('prompts.yaml')
+        except Exception as e:
+            logging.error(f"Конфигурация не перезагружена, действуют прежние настройки: {e}")
+            return False
+        self._config = config
+        self._prompts = prompts
+        self.version += 1
+        logging.info("Конфигурация перезагружена")
+        return True
+    
+    def reload_if_changed(self) -> bool:
+        """
+        Перечитать конфигурацию, если файлы изменились.
+        
+        Returns:
+            True если конфигурация была перезагружена
+        """
+        if self._read_mtimes() == self._mtimes:
+            return False
+        logging.info("Файлы конфигурации изменились, перезагружаем")
+        return self.reload()
+    
+    async def watch(self, interval_seconds: float) -> None:
+        """Фоновая проверка изменений файлов конфигурации."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                logging.error(f"Ошибка при перезагрузке конфигурации: {e}")
+    
+    def install_sighup_handler(self) -> None:
+        """Перезагружать конфигурацию по SIGHUP (вызывать внутри event loop)."""
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGHUP, self._on_sighup)
+        except (AttributeError, NotImplementedError, RuntimeError):
+            logging.warning("SIGHUP не поддерживается, перезагрузка только по изменению файлов")
+    
+    def _on_sighup(self) -> None:
+        """Обработчик SIGHUP."""
+        logging.info("Получен SIGHUP, перезагружаем конфигурацию")
+        self.reload()
+    
+    def _read_mtimes(self) -> Dict[str, Optional[float]]:
+        """Время изменения файлов конфигурации (None если файла нет)."""
+        project_root = get_project_root()
+        mtimes = {}
+        for name in ('settings.yaml', 'prompts.yaml'):
+            try:
+                mtimes[name] = os.stat(os.path.join(project_root, 'config', name)).st_mtime
+            except OSError:
+                mtimes[name] = None
+        return mtimes
+
+
+# Глобальное хранилище конфигурации
+config_store = ConfigStore()
+
+
 def get_bot_config() -> Dict[str, Any]:
     """Получить конфигурацию бота."""
-    config = load_config()
-    return config.get('bot', {})
+    return config_store.config.get('bot', {})
 
 
 def get_llm_config() -> Dict[str, Any]:
     """Получить конфигурацию LLM."""
-    config = load_config()
-    return config.get('llm', {})
+    return config_store.config.get('llm', {})
 
 
 def get_logging_config() -> Dict[str, Any]:
     """Получить конфигурацию логирования."""
-    config = load_config()
-    return config.get('logging', {})
\ No newline at end of file
+    return config_store.config.get('logging', {})
+
+
+def get_section(name: str) -> Dict[str, Any]:
+    """Получить произвольную секцию настроек (пустой словарь если ее нет)."""
+    return config_store.config.get(name) or {}
+
+
+def get_prompt(name: str, default: str = "") -> str:
+    """Получить текст промпта по имени из кеша."""
+    return config_store.prompts.get(name) or default
\ No newline at end of file
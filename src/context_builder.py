@@ -0,0 +1,115 @@
+"""
+Сборка контекста запроса к LLM с учетом бюджета токенов.
+Вместо фиксированного числа сообщений история заполняет окно до
+max_prompt_tokens, самые старые реплики отбрасываются первыми.
+
+Системный промпт собирается один раз в неизменяемый префикс (SystemPrefix):
+каждый запрос начинается с одного и того же объекта сообщения, а его
+размер в токенах уже посчитан. Одинаковое начало запросов позволяет
+провайдеру кешировать префикс (prompt caching); для моделей, которым
+кеширование нужно указать явно, есть вариант с cache_control.
+"""
+
+from functools import lru_cache
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+# Служебные токены на каждое сообщение (роль, разделители)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def count_tokens(text: str) -> int:
+    """
+    Оценить число токенов в тексте.
+
+    Точный токенизатор зависит от модели, поэтому используем оценку
+    ~4 байта UTF-8 на токен (для кириллицы это ~2 символа на токен).
+    Сообщения истории считаются один раз при добавлении в память
+    (ConversationMemory хранит число токенов рядом с сообщением).
+    """
+    return (len(text.encode("utf-8")) + 3) // 4
+
+
+def count_message_tokens(message: Dict[str, str]) -> int:
+    """Оценить число токенов сообщения вместе со служебными."""
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class _FrozenDict(dict):
+    """Словарь, который нельзя изменить (общий для всех запросов)."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("Системный префикс неизменяем")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _readonly
+
+
+class SystemPrefix(NamedTuple):
+    """Неизменяемый системный префикс запроса."""
+
+    text: str
+    tokens: int
+    # Сообщение для всех моделей
+    message: Dict[str, Any]
+    # То же сообщение с пометкой cache_control (OpenRouter: Anthropic, Gemini)
+    cached_message: Dict[str, Any]
+
+
+@lru_cache(maxsize=8)
+def get_system_prefix(system_prompt: str) -> SystemPrefix:
+    """
+    Префикс для текста системного промпта.
+
+    Создается один раз на текст: при горячей перезагрузке промптов новый
+    текст дает новый префикс, а запросы со старым текстом не пересобираются.
+    """
+    cached_content = (_FrozenDict(type="text", text=system_prompt, cache_control=_FrozenDict(type="ephemeral")),)
+    return SystemPrefix(
+        text=system_prompt,
+        tokens=count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS,
+        message=_FrozenDict(role="system", content=system_prompt),
+        cached_message=_FrozenDict(role="system", content=cached_content)
+    )
+
+
+def build_messages(system_prompt: Union[str, SystemPrefix], history: List[Dict[str, str]], current_message: str, max_prompt_tokens: int, summary: str = "", knowledge: str = "",
+                   history_tokens: Optional[List[int]] = None) -> List[Dict[str, str]]:
+    """
+    Сформировать сообщения для LLM в пределах бюджета токенов.
+
+    Args:
+        system_prompt: Системный промпт или готовый префикс (всегда включается первым)
+        history: История диалога от старых к новым
+        current_message: Текущее сообщение пользователя (всегда включается)
+        max_prompt_tokens: Бюджет токенов на весь промпт
+        summary: Краткое содержание ранней части диалога (включается, если задано)
+        knowledge: Фрагменты базы знаний к вопросу (включаются, если заданы)
+        history_tokens: Уже посчитанные токены сообщений history (иначе считаются здесь)
+
+    Returns:
+        Список сообщений: системный промпт + summary + база знаний + уместившаяся история + текущее
+    """
+    prefix = system_prompt if isinstance(system_prompt, SystemPrefix) else get_system_prefix(system_prompt)
+    system = [prefix.message]
+    budget = max_prompt_tokens - prefix.tokens
+    # Переменные части идут после префикса, чтобы не мешать его кешированию
+    for extra in (summary, knowledge):
+        if extra:
+            system.append({"role": "system", "content": extra})
+            budget -= count_message_tokens(system[-1])
+    current = {"role": "user", "content": current_message}
+    budget -= count_message_tokens(current)
+
+    # Идем от новых сообщений к старым, пока помещаемся в бюджет
+    start = len(history)
+    for i in range(len(history) - 1, -1, -1):
+        tokens = history_tokens[i] if history_tokens is not None else count_message_tokens(history[i])
+        if tokens > budget:
+            break
+        budget -= tokens
+        start = i
+
+    # Не начинаем контекст с ответа ассистента без вопроса к нему
+    while start < len(history) and history[start]["role"] == "assistant":
+        start += 1
+
+    return system + history[start:] + [current]
@@ -1,73 +1,302 @@
 """
 Простое хранилище истории диалогов в памяти.
 Синглтон для сохранения состояния между запросами.
+
+Объем памяти ограничен: у каждого пользователя кольцевой буфер последних
+сообщений, неактивные пользователи удаляются по TTL, а общее число
+пользователей и суммарный размер истории ограничены (вытесняются давно
+неактивные - LRU).
+
+Старые сообщения длинного диалога можно сжать в краткое содержание
+(summary): снимок берется через get_summary_snapshot, а результат
+применяется через apply_summary - без блокировки обработки сообщений.
+
+Если подключено постоянное хранилище (memory_storage), память работает как
+кеш поверх него: сообщения дописываются в хранилище в фоне, а история
+пользователя, которого нет в памяти, подгружается из хранилища.
 """
 
-from typing import Dict, List, Any
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Deque, Dict, List, Any, NamedTuple, Optional, Tuple
+
+from config import get_section
+from context_builder import count_message_tokens
+from memory_storage import MemoryStorage, create_storage
+
+
+class _UserHistory:
+    """История одного пользователя: кольцевой буфер сообщений и его размер."""
+
+    __slots__ = ("messages", "tokens", "last_access", "size_bytes", "summary", "appended_total")
+
+    def __init__(self, max_messages: int):
+        self.messages: Deque[Dict[str, str]] = deque(maxlen=max_messages)
+        # Токены каждого сообщения (считаются один раз при добавлении), параллельно messages
+        self.tokens: Deque[int] = deque(maxlen=max_messages)
+        self.last_access = time.monotonic()
+        self.size_bytes = 0
+        # Краткое содержание более ранней части диалога (см. get_summary_snapshot)
+        self.summary = ""
+        # Сколько сообщений было добавлено за все время - позиция для снимков
+        self.appended_total = 0
+
+
+class SummarySnapshot(NamedTuple):
+    """Снимок старых сообщений пользователя для фонового сжатия в summary."""
+
+    history: _UserHistory
+    summary: str
+    messages: List[Dict[str, str]]
+    first_index: int
+
+
+def _message_size(message: Dict[str, str]) -> int:
+    """Примерный размер сообщения в байтах."""
+    return len(message["content"].encode("utf-8")) + len(message["role"])
 
 
 class ConversationMemory:
     """Простое хранилище истории диалогов в памяти."""
-    
+
     _instance = None
-    _conversations: Dict[int, List[Dict[str, str]]] = {}
-    
+    # Порядок ключей - от давно неактивных к недавно активным (LRU)
+    _conversations: "OrderedDict[int, _UserHistory]" = OrderedDict()
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ConversationMemory, cls).__new__(cls)
+            cls._instance._configure()
         return cls._instance
-    
+
+    def _configure(self) -> None:
+        """Загрузить ограничения хранилища из секции memory в settings.yaml."""
+        memory_config = get_section('memory')
+        self.max_messages_per_user = memory_config.get('max_messages_per_user', 20)
+        self.idle_ttl_seconds = memory_config.get('idle_ttl_seconds', 86400)
+        self.max_users = memory_config.get('max_users', 10000)
+        self.max_total_bytes = memory_config.get('max_total_bytes', 50 * 1024 * 1024)
+        self.total_bytes = 0
+        self.storage: Optional[MemoryStorage] = None
+
+    def open_storage(self, shard: Optional[int] = None) -> None:
+        """Подключить постоянное хранилище согласно settings.yaml (shard - номер воркера)."""
+        self.storage = create_storage(get_section('memory'), shard)
+
+    def close(self) -> None:
+        """Дописать отложенные изменения в хранилище и закрыть его."""
+        if self.storage is not None:
+            self.storage.close()
+            self.storage = None
+
     def get_history(self, user_id: int, limit: int = 6) -> List[Dict[str, str]]:
         """
         Получить историю диалога для пользователя.
-        
+
         Args:
             user_id: ID пользователя
             limit: Максимальное количество сообщений
-            
+
         Returns:
             Список последних сообщений
         """
-        if user_id not in self._conversations:
-            self._conversations[user_id] = []
-        
+        return self.get_history_with_tokens(user_id, limit)[0]
+
+    def get_history_with_tokens(self, user_id: int, limit: int = 6) -> Tuple[List[Dict[str, str]], List[int]]:
+        """
+        Последние сообщения пользователя и число токенов каждого из них.
+
+        Токены посчитаны при добавлении сообщения, поэтому сборка контекста
+        не пересчитывает всю историю на каждый запрос.
+        """
+        history = self._conversations.get(user_id)
+        if history is not None and time.monotonic() - history.last_access > self.idle_ttl_seconds:
+            self._remove(user_id)
+            history = None
+
+        if history is None:
+            history = self._load_from_storage(user_id)
+            if history is None:
+                return [], []
+
+        history.last_access = time.monotonic()
+        self._conversations.move_to_end(user_id)
+
         # Возвращаем последние N сообщений
-        return self._conversations[user_id][-limit:]
-    
+        start = max(len(history.messages) - limit, 0)
+        return list(islice(history.messages, start, None)), list(islice(history.tokens, start, None))
+
     def add_message(self, user_id: int, role: str, content: str) -> None:
         """
         Добавить сообщение в историю диалога.
-        
+
         Args:
             user_id: ID пользователя
             role: Роль (user/assistant)
             content: Содержимое сообщения
         """
-        if user_id not in self._conversations:
-            self._conversations[user_id] = []
-        
-        self._conversations[user_id].append({
-            "role": role,
-            "content": content
-        })
-        
-        # Ограничиваем историю (оставляем последние 20 сообщений)
-        if len(self._conversations[user_id]) > 20:
-            self._conversations[user_id] = self._conversations[user_id][-20:]
-    
+        history = self._conversations.get(user_id)
+        if history is None:
+            history = self._load_from_storage(user_id) or _UserHistory(self.max_messages_per_user)
+            self._conversations[user_id] = history
+
+        message = {"role": role, "content": content}
+        self._append(history, message)
+        history.last_access = time.monotonic()
+        self._conversations.move_to_end(user_id)
+
+        if self.storage is not None:
+            self.storage.append(user_id, role, content)
+
+        self._evict()
+
+    def get_summary(self, user_id: int) -> str:
+        """Краткое содержание ранней части диалога (пустая строка если его нет)."""
+        history = self._conversations.get(user_id)
+        if history is None:
+            # После перезапуска summary лежит в хранилище вместе с историей
+            history = self._load_from_storage(user_id)
+        return history.summary if history is not None else ""
+
+    def get_summary_snapshot(self, user_id: int, threshold: int, keep_recent: int) -> Optional[SummarySnapshot]:
+        """
+        Снимок старых сообщений для сжатия, если история достигла порога.
+
+        Args:
+            user_id: ID пользователя
+            threshold: Минимальное число сообщений в истории для сжатия
+            keep_recent: Сколько последних сообщений оставить как есть
+
+        Returns:
+            Снимок или None, если сжимать пока нечего
+        """
+        history = self._conversations.get(user_id)
+        if history is None or len(history.messages) < threshold:
+            return None
+
+        count = len(history.messages) - keep_recent
+        if count <= 0:
+            return None
+
+        return SummarySnapshot(
+            history=history,
+            summary=history.summary,
+            messages=list(islice(history.messages, 0, count)),
+            first_index=history.appended_total - len(history.messages)
+        )
+
+    def apply_summary(self, user_id: int, snapshot: SummarySnapshot, summary: str) -> bool:
+        """
+        Заменить сжатые сообщения кратким содержанием.
+
+        Пока summary готовилось, в историю могли добавиться новые сообщения,
+        поэтому удаляются ровно те сообщения из снимка, что еще остались.
+
+        Returns:
+            False если история за это время была очищена
+        """
+        history = self._conversations.get(user_id)
+        if history is not snapshot.history:
+            return False
+
+        current_first = history.appended_total - len(history.messages)
+        drop = min(snapshot.first_index + len(snapshot.messages) - current_first, len(history.messages))
+        for _ in range(max(drop, 0)):
+            history.tokens.popleft()
+            removed = _message_size(history.messages.popleft())
+            history.size_bytes -= removed
+            self.total_bytes -= removed
+
+        size_change = len(summary.encode("utf-8")) - len(history.summary.encode("utf-8"))
+        history.summary = summary
+        history.size_bytes += size_change
+        self.total_bytes += size_change
+
+        if self.storage is not None:
+            self.storage.save_summary(user_id, summary, keep_last=len(history.messages))
+        return True
+
     def clear_history(self, user_id: int) -> None:
         """Очистить историю диалога для пользователя."""
         if user_id in self._conversations:
-            del self._conversations[user_id]
-    
+            self._remove(user_id)
+        if self.storage is not None:
+            self.storage.clear(user_id)
+
+    @property
+    def total_users(self) -> int:
+        """Число пользователей с историей в памяти."""
+        return len(self._conversations)
+
     def get_stats(self) -> Dict[str, Any]:
         """Получить статистику по диалогам."""
         return {
             "total_users": len(self._conversations),
-            "total_messages": sum(len(history) for history in self._conversations.values()),
-            "users_with_history": [user_id for user_id, history in self._conversations.items() if len(history) > 0]
+            "total_messages": sum(len(history.messages) for history in self._conversations.values()),
+            "total_bytes": self.total_bytes,
+            "storage": type(self.storage).__name__ if self.storage is not None else "memory",
+            "users_with_history": [user_id for user_id, history in self._conversations.items() if len(history.messages) > 0]
         }
 
+    def _load_from_storage(self, user_id: int) -> Optional[_UserHistory]:
+        """Подгрузить историю пользователя из постоянного хранилища в память."""
+        if self.storage is None:
+            return None
+
+        messages = self.storage.load_history(user_id, self.max_messages_per_user)
+        if not messages:
+            return None
+
+        history = _UserHistory(self.max_messages_per_user)
+        for message in messages:
+            self._append(history, message)
+        history.summary = self.storage.load_summary(user_id)
+        history.size_bytes += len(history.summary.encode("utf-8"))
+        self.total_bytes += len(history.summary.encode("utf-8"))
+        self._conversations[user_id] = history
+        self._evict()
+        return history
+
+    def _append(self, history: _UserHistory, message: Dict[str, str]) -> None:
+        """Добавить сообщение в кольцевой буфер с учетом размера."""
+        size = _message_size(message)
+
+        # deque с maxlen сам вытеснит самое старое сообщение - учитываем его размер
+        if len(history.messages) == history.messages.maxlen:
+            removed = _message_size(history.messages[0])
+            history.size_bytes -= removed
+            self.total_bytes -= removed
+
+        history.messages.append(message)
+        history.tokens.append(count_message_tokens(message))
+        history.appended_total += 1
+        history.size_bytes += size
+        self.total_bytes += size
+
+    def _remove(self, user_id: int) -> None:
+        """Удалить пользователя из хранилища."""
+        history = self._conversations.pop(user_id)
+        self.total_bytes -= history.size_bytes
+
+    def _evict(self) -> None:
+        """Удалить неактивных по TTL и самых давних пользователей сверх лимитов."""
+        now = time.monotonic()
+
+        # Давно неактивные всегда в начале OrderedDict
+        while self._conversations:
+            user_id, history = next(iter(self._conversations.items()))
+            if now - history.last_access <= self.idle_ttl_seconds:
+                break
+            self._remove(user_id)
+
+        # Последнего (текущего) пользователя не вытесняем
+        while len(self._conversations) > 1 and (
+            len(self._conversations) > self.max_users or self.total_bytes > self.max_total_bytes
+        ):
+            user_id = next(iter(self._conversations))
+            self._remove(user_id)
+
 
 # Создаем глобальный экземпляр
-conversation_memory = ConversationMemory()
\ No newline at end of file
+conversation_memory = ConversationMemory()
@@ -1,17 +1,25 @@
 """
 Обработчики сообщений для Telegram бота.
 Простые функции для обработки команд и текстовых сообщений.
+Ответы не отправляются напрямую, а ставятся в очередь outbound_sender.
 """
 
+import asyncio
 import logging
 import time
+from typing import Callable, Optional, Tuple
 from aiogram import Router, Dispatcher, types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import Command
 
-from llm_client import create_llm_client
+from llm_client import LLMClient
 from logger import log_conversation
-from config import load_prompts
+from config import get_prompt
 from conversation_memory import conversation_memory
+from intent_router import IntentRouter
+from outbound import outbound_sender, split_message
+from response_cache import DEFAULT_USER_NAME
+from user_dispatcher import UserBatch, UserDispatcher
 
 
 # Создаем роутер для обработчиков
@@ -22,42 +30,39 @@ router = Router()
 async def start_handler(message: types.Message):
     """Обработчик команды /start - приветствие пользователя."""
     try:
-        prompts = load_prompts()
-        welcome_text = prompts.get('welcome_message', 'Добро пожаловать!')
+        welcome_text = get_prompt('welcome_message', 'Добро пожаловать!')
         
         logging.info(f"Пользователь {message.from_user.id} ({message.from_user.username}) запустил бота")
-        await message.answer(welcome_text)
+        outbound_sender.answer(message, welcome_text)
     except Exception as e:
         logging.error(f"Ошибка в обработчике /start: {e}")
-        await message.answer("Добро пожаловать! Я консультант компании. Напишите ваш вопрос.")
+        outbound_sender.answer(message, "Добро пожаловать! Я консультант компании. Напишите ваш вопрос.")
 
 
 @router.message(Command("help"))
 async def help_handler(message: types.Message):
     """Обработчик команды /help - справка по командам."""
     try:
-        prompts = load_prompts()
-        help_text = prompts.get('help_message', 'Справка временно недоступна.')
+        help_text = get_prompt('help_message', 'Справка временно недоступна.')
         
         logging.info(f"Пользователь {message.from_user.id} запросил справку")
-        await message.answer(help_text)
+        outbound_sender.answer(message, help_text)
     except Exception as e:
         logging.error(f"Ошибка в обработчике /help: {e}")
-        await message.answer("Доступные команды:\n/start - начало работы\n/help - справка\n/contact - контакты")
+        outbound_sender.answer(message, "Доступные команды:\n/start - начало работы\n/help - справка\n/contact - контакты")
 
 
 @router.message(Command("contact"))
 async def contact_handler(message: types.Message):
     """Обработчик команды /contact - контактная информация."""
     try:
-        prompts = load_prompts()
-        contact_text = prompts.get('contact_message', 'Контактная информация временно недоступна.')
+        contact_text = get_prompt('contact_message', 'Контактная информация временно недоступна.')
         
         logging.info(f"Пользователь {message.from_user.id} запросил контакты")
-        await message.answer(contact_text)
+        outbound_sender.answer(message, contact_text)
     except Exception as e:
         logging.error(f"Ошибка в обработчике /contact: {e}")
-        await message.answer("Для связи с нами обратитесь к менеджеру.")
+        outbound_sender.answer(message, "Для связи с нами обратитесь к менеджеру.")
 
 
 @router.message(Command("clear"))
@@ -68,10 +73,10 @@ async def clear_handler(message: types.Message):
         conversation_memory.clear_history(user_id)
         
         logging.info(f"Пользователь {user_id} очистил историю диалога")
-        await message.answer("✅ История диалога очищена. Я забыл все наши предыдущие сообщения.")
+        outbound_sender.answer(message, "✅ История диалога очищена. Я забыл все наши предыдущие сообщения.")
     except Exception as e:
         logging.error(f"Ошибка в обработчике /clear: {e}")
-        await message.answer("Произошла ошибка при очистке истории.")
+        outbound_sender.answer(message, "Произошла ошибка при очистке истории.")
 
 
 @router.message(Command("memory"))
@@ -82,7 +87,7 @@ async def memory_handler(message: types.Message):
         history = conversation_memory.get_history(user_id, 20)  # Показываем больше для отладки
         
         if not history:
-            await message.answer("📝 История диалога пуста.")
+            outbound_sender.answer(message, "📝 История диалога пуста.")
             return
         
         # Формируем сообщение с историей
@@ -99,34 +104,101 @@ async def memory_handler(message: types.Message):
         memory_text += "Используйте /clear для очистки истории."
         
         logging.info(f"Пользователь {user_id} запросил состояние памяти")
-        await message.answer(memory_text)
+        outbound_sender.answer(message, memory_text)
     except Exception as e:
         logging.error(f"Ошибка в обработчике /memory: {e}")
-        await message.answer("Произошла ошибка при получении истории.")
+        outbound_sender.answer(message, "Произошла ошибка при получении истории.")
 
 
 @router.message()
-async def llm_handler(message: types.Message):
-    """Обработчик текстовых сообщений - отправляет запрос к LLM."""
-    start_time = time.time()
+async def llm_handler(message: types.Message, user_dispatcher: UserDispatcher):
+    """
+    Обработчик текстовых сообщений - ставит сообщение в очередь пользователя.
     
-    user_text = message.text or "сообщение без текста"
-    user_name = message.from_user.first_name or "клиент"
+    Сообщения одного пользователя обрабатываются по очереди в process_user_batch,
+    быстрые серии сообщений объединяются в один запрос к LLM.
+    """
     user_id = message.from_user.id
-    username = message.from_user.username
+    logging.info(f"Получено сообщение от {user_id} ({message.from_user.first_name}): {message.text}")
+    
+    user_dispatcher.submit(user_id, message)
+
+
+def answer_intent(batch: UserBatch, intent_router: IntentRouter) -> bool:
+    """
+    Ответить готовым текстом, если пакет из одного сообщения совпал с намерением.
+    
+    Вызывается из очереди пользователя, поэтому готовый ответ не обгоняет
+    ответ LLM на предыдущие сообщения.
     
-    logging.info(f"Получено сообщение от {user_id} ({user_name}): {user_text}")
+    Returns:
+        True если ответ поставлен в очередь отправки
+    """
+    if len(batch.messages) != 1:
+        return False
+    message = batch.last_message
     
-    # Показываем что бот "печатает"
-    await message.bot.send_chat_action(message.chat.id, "typing")
+    start_time = time.perf_counter()
+    intent = intent_router.match(message.text)
+    if intent is None:
+        return False
+    
+    response_text = get_prompt(intent.prompt)
+    if not response_text:
+        logging.warning(f"Нет промпта {intent.prompt} для намерения {intent.name}")
+        return False
+    match_us = int((time.perf_counter() - start_time) * 1_000_000)
+    
+    batch.commit()
+    outbound_sender.answer(message, response_text)
+    
+    log_conversation(
+        user_id=message.from_user.id,
+        username=message.from_user.username,
+        user_message=message.text,
+        bot_response=response_text,
+        response_time_ms=int((time.time() - batch.received_at) * 1000),
+        intent=intent.name
+    )
+    logging.info(f"Ответ без LLM пользователю {message.from_user.id}: {intent.name} ({intent.method}, {intent.score:.2f}), распознано за {match_us}us")
+    return True
+
+
+async def process_user_batch(batch: UserBatch, llm_client: LLMClient,
+                             intent_router: Optional[IntentRouter] = None) -> None:
+    """
+    Обработать пакет сообщений пользователя - отправить запрос к LLM и ответить.
+    
+    llm_client и intent_router создаются один раз в bot.main. На типовые
+    сообщения (приветствие, контакты) intent_router отвечает без LLM.
+    """
+    if intent_router is not None and answer_intent(batch, intent_router):
+        return
+    
+    start_time = batch.received_at
+    message = batch.last_message
+    
+    user_text = batch.text
+    user_name = message.from_user.first_name or DEFAULT_USER_NAME
+    user_id = message.from_user.id
+    username = message.from_user.username
     
     try:
-        # Создаем LLM клиент и получаем ответ
-        llm_client = create_llm_client()
-        response_text = await llm_client.get_response(user_text, user_id, user_name)
-        
-        # Отправляем ответ
-        await message.answer(response_text)
+        # Настройки могли измениться после перезагрузки конфигурации (stream и др.)
+        llm_client.refresh_settings()
+        if llm_client.stream:
+            # Показываем ответ по мере генерации
+            response_text = await answer_streaming(message, llm_client, user_text, user_id, user_name, batch.commit)
+        else:
+            # Показываем что бот "печатает"
+            await message.bot.send_chat_action(message.chat.id, "typing")
+            
+            # Получаем ответ через общий LLM клиент
+            response_text = await llm_client.get_response(user_text, user_id, user_name)
+            
+            # Ставим ответ в очередь отправки (с учетом лимитов Telegram)
+            batch.commit()
+            outbound_sender.answer(message, response_text)
         
         # Вычисляем время ответа
         response_time_ms = int((time.time() - start_time) * 1000)
@@ -143,9 +215,8 @@ async def llm_handler(message: types.Message):
         logging.info(f"Ответ отправлен пользователю {user_id}, время: {response_time_ms}ms")
         
     except Exception as e:
-        prompts = load_prompts()
-        error_message = prompts.get('error_message', 'Извините, произошла ошибка. Попробуйте позже.')
-        await message.answer(error_message)
+        error_message = get_prompt('error_message', 'Извините, произошла ошибка. Попробуйте позже.')
+        outbound_sender.answer(message, error_message)
         
         response_time_ms = int((time.time() - start_time) * 1000)
         
@@ -161,6 +232,98 @@ async def llm_handler(message: types.Message):
         logging.error(f"Ошибка при обработке сообщения от {user_id}: {e}")
 
 
+async def answer_streaming(message: types.Message, llm_client: LLMClient, user_text: str, user_id: int, user_name: str,
+                           commit: Optional[Callable[[], None]] = None) -> str:
+    """
+    Отправить ответ LLM потоково: заглушка, затем редактирование по мере генерации.
+    
+    Редактирования идут не чаще stream_edit_interval секунд, чтобы не упираться
+    в лимиты Telegram на edit_message_text.
+    
+    Args:
+        commit: Вызывается с первым фрагментом ответа - после этого
+            обработку уже нельзя отменить новым сообщением
+    
+    Returns:
+        Полный текст ответа
+    """
+    placeholder_text = get_prompt('thinking_message', '💭 Думаю...')
+    # Ждем отправки заглушки - ее нужно редактировать
+    placeholder, = await outbound_sender.answer(message, placeholder_text)
+    
+    response_text = ""
+    shown_text = placeholder_text
+    next_edit_at = time.monotonic() + llm_client.stream_edit_interval
+    
+    try:
+        async for delta in llm_client.stream_response(user_text, user_id, user_name):
+            if not response_text and commit is not None:
+                commit()
+            response_text += delta
+            if time.monotonic() >= next_edit_at:
+                shown_text, delay = await _edit_stream_message(message.chat.id, placeholder, response_text, shown_text)
+                next_edit_at = time.monotonic() + max(llm_client.stream_edit_interval, delay)
+    except asyncio.CancelledError:
+        # Ответ заменяется ответом на объединенные сообщения - убираем заглушку
+        if not response_text:
+            await _delete_quietly(placeholder)
+        raise
+    
+    if not response_text:
+        response_text = get_prompt('error_message', 'Извините, произошла ошибка. Попробуйте позже.')
+    
+    # Финальное редактирование с полным текстом; хвост длиннее лимита - отдельными сообщениями
+    parts = split_message(response_text)
+    shown_text, delay = await _edit_stream_message(message.chat.id, placeholder, parts[0], shown_text)
+    if delay > 0:
+        # Telegram попросил подождать - иначе пользователь останется с обрезанным текстом
+        await asyncio.sleep(delay)
+        shown_text, _ = await _edit_stream_message(message.chat.id, placeholder, parts[0], shown_text)
+    if shown_text != parts[0] and parts[0].strip():
+        logging.warning(f"Не удалось показать полный ответ пользователю {user_id} в заглушке, отправляем отдельным сообщением")
+        outbound_sender.answer(message, parts[0])
+    for part in parts[1:]:
+        outbound_sender.answer(message, part)
+    
+    return response_text
+
+
+async def _delete_quietly(sent: types.Message) -> None:
+    """Удалить сообщение бота, не прерываясь на ошибках Telegram."""
+    try:
+        await sent.delete()
+    except Exception as e:
+        logging.warning(f"Не удалось удалить сообщение: {e}")
+
+
+async def _edit_stream_message(chat_id: int, placeholder: types.Message, text: str, shown_text: str) -> Tuple[str, float]:
+    """
+    Отредактировать сообщение-заглушку, если текст изменился.
+    
+    Редактирование расходует те же лимиты чата и бота, что и отправка
+    сообщений через outbound_sender.
+    
+    Returns:
+        Показанный текст и дополнительная пауза до следующего редактирования
+        (больше нуля, если Telegram попросил подождать)
+    """
+    text = split_message(text)[0]
+    if not text.strip() or text == shown_text:
+        return shown_text, 0
+    
+    await outbound_sender.throttle(chat_id)
+    try:
+        await placeholder.edit_text(text)
+        return text, 0
+    except TelegramRetryAfter as e:
+        logging.warning(f"Telegram ограничил редактирование, пауза {e.retry_after}s")
+        outbound_sender.pause(chat_id, e.retry_after)
+        return shown_text, e.retry_after
+    except TelegramBadRequest as e:
+        logging.warning(f"Не удалось отредактировать сообщение: {e}")
+        return shown_text, 0
+
+
 def setup_handlers(dp: Dispatcher) -> None:
     """Настройка всех обработчиков для диспетчера."""
     dp.include_router(router)
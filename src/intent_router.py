@@ -0,0 +1,155 @@
+"""
+Ответы на типовые сообщения без обращения к LLM.
+
+Приветствия, вопросы о контактах, режиме работы и справке уже имеют
+готовые ответы в prompts.yaml. Намерения (intents) задаются в секции
+intent_router настроек: примеры фраз, регулярные выражения и имя промпта
+с ответом. При запуске все собирается в индексы:
+
+- точное совпадение нормализованного текста с примером (словарь);
+- одно общее регулярное выражение с именованной группой на намерение;
+- похожесть на примеры по символьным триграммам (инвертированный индекс),
+  чтобы находить фразы с опечатками. Похожести всей фразы мало: каждое
+  слово сообщения должно найтись в примере (с точностью до опечатки),
+  иначе "режим работы склада" сошел бы за вопрос о режиме работы.
+
+Проверяются только короткие сообщения: в длинном вопросе приветствие -
+лишь вступление, и отвечать на него должна модель.
+"""
+
+import logging
+import math
+import re
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Pattern, Tuple
+
+from config import get_section
+from response_cache import char_trigrams, normalize_text
+
+
+class IntentMatch(NamedTuple):
+    """Найденное намерение."""
+
+    name: str
+    # Имя промпта с готовым ответом
+    prompt: str
+    # exact, regex или trigram
+    method: str
+    score: float
+
+
+# Минимальная похожесть слова сообщения на слово примера (опечатка, другое окончание)
+_MIN_WORD_SIMILARITY = 0.5
+
+
+def _norm(trigrams: Counter) -> float:
+    """Длина вектора триграмм."""
+    return math.sqrt(sum(v * v for v in trigrams.values()))
+
+
+def _similarity(first: Counter, second: Counter) -> float:
+    """Косинус между векторами триграмм."""
+    dot = sum(count * second[trigram] for trigram, count in first.items() if trigram in second)
+    return dot / (_norm(first) * _norm(second)) if dot else 0.0
+
+
+class IntentRouter:
+    """Сопоставление коротких сообщений с настроенными намерениями."""
+
+    def __init__(self, intents: List[Dict[str, Any]], max_words: int = 6, min_similarity: float = 0.75):
+        self.max_words = max_words
+        self.min_similarity = min_similarity
+        # Намерения по порядку: (имя, промпт)
+        self._intents: List[Tuple[str, str]] = []
+        self._exact: Dict[str, int] = {}
+        # Примеры: (намерение, триграммы, длина вектора, триграммы слов)
+        self._examples: List[Tuple[int, Counter, float, List[Counter]]] = []
+        self._trigram_index: Dict[str, List[int]] = {}
+        regex_parts = []
+
+        for index, intent in enumerate(intents):
+            self._intents.append((intent['name'], intent['prompt']))
+            for example in intent.get('examples') or ():
+                text = normalize_text(example)
+                self._exact.setdefault(text, index)
+                trigrams = char_trigrams(text)
+                example_id = len(self._examples)
+                words = [char_trigrams(word) for word in text.split()]
+                self._examples.append((index, trigrams, _norm(trigrams), words))
+                for trigram in trigrams:
+                    self._trigram_index.setdefault(trigram, []).append(example_id)
+            for pattern in intent.get('patterns') or ():
+                regex_parts.append(f"(?P<i{index}_{len(regex_parts)}>{pattern})")
+
+        # Все выражения в одном: один проход по тексту на сообщение
+        self._regex: Optional[Pattern] = re.compile("|".join(regex_parts)) if regex_parts else None
+
+    def match(self, text: Optional[str]) -> Optional[IntentMatch]:
+        """Намерение сообщения или None, если сообщение нужно отправить в LLM."""
+        if not text:
+            return None
+        normalized = normalize_text(text)
+        if not normalized or len(normalized.split()) > self.max_words:
+            return None
+
+        index = self._exact.get(normalized)
+        if index is not None:
+            return self._result(index, "exact", 1.0)
+
+        if self._regex is not None:
+            found = self._regex.fullmatch(normalized)
+            if found is not None:
+                return self._result(int(found.lastgroup[1:].split("_")[0]), "regex", 1.0)
+
+        return self._match_trigrams(normalized)
+
+    def _match_trigrams(self, normalized: str) -> Optional[IntentMatch]:
+        """
+        Самый похожий пример по косинусу триграмм (не ниже min_similarity),
+        в котором нашлось каждое слово сообщения.
+        """
+        trigrams = char_trigrams(normalized)
+        dots: Dict[int, int] = {}
+        for trigram, count in trigrams.items():
+            for example_id in self._trigram_index.get(trigram, ()):
+                dots[example_id] = dots.get(example_id, 0) + count * self._examples[example_id][1][trigram]
+        if not dots:
+            return None
+
+        norm = _norm(trigrams)
+        candidates = sorted(((dot / (norm * self._examples[example_id][2]), example_id)
+                             for example_id, dot in dots.items()), reverse=True)
+        words = [char_trigrams(word) for word in normalized.split()]
+        for similarity, example_id in candidates:
+            if similarity < self.min_similarity:
+                break
+            if self._covers(self._examples[example_id][3], words):
+                return self._result(self._examples[example_id][0], "trigram", similarity)
+        return None
+
+    @staticmethod
+    def _covers(example_words: List[Counter], words: List[Counter]) -> bool:
+        """Каждое слово сообщения похоже на какое-нибудь слово примера."""
+        return all(any(_similarity(word, example_word) >= _MIN_WORD_SIMILARITY for example_word in example_words)
+                   for word in words)
+
+    def _result(self, index: int, method: str, score: float) -> IntentMatch:
+        """Результат для намерения с номером index."""
+        name, prompt = self._intents[index]
+        return IntentMatch(name, prompt, method, score)
+
+
+def create_intent_router() -> Optional[IntentRouter]:
+    """Создать роутер по секции intent_router (None если выключен или намерений нет)."""
+    router_config = get_section('intent_router')
+    intents = router_config.get('intents') or []
+    if not router_config.get('enabled', False) or not intents:
+        return None
+
+    router = IntentRouter(
+        intents,
+        max_words=router_config.get('max_words', 6),
+        min_similarity=router_config.get('min_similarity', 0.75)
+    )
+    logging.info(f"Роутер намерений: {', '.join(intent['name'] for intent in intents)}")
+    return router
@@ -0,0 +1,259 @@
+"""
+База знаний компании с поиском BM25.
+
+Описания услуг лежат файлами (.md, .txt) в папке knowledge/. Файлы
+режутся на фрагменты по абзацам, фрагменты индексируются в
+инвертированном индексе в памяти. Для каждого вопроса в запрос к LLM
+попадают только несколько самых подходящих фрагментов, а не весь каталог.
+
+Индекс обновляется по изменению файлов (mtime): измененный файл
+переиндексируется, остальные не трогаются.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+
+from config import get_project_root, get_section
+from context_builder import count_tokens
+
+# Расширения файлов базы знаний
+KNOWLEDGE_EXTENSIONS = ('.md', '.txt')
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+# Частые слова вопросов, которые не помогают найти услугу
+_STOP_WORDS = {
+    "и", "в", "во", "на", "с", "со", "по", "для", "к", "о", "об", "от", "до", "из", "за", "у", "не",
+    "а", "но", "или", "ли", "же", "как", "что", "это", "мне", "мы", "вы", "вас", "нас", "наш", "ваш",
+    "я", "он", "она", "они", "бы", "есть", "можно", "нужно", "какие", "какой", "сколько"
+}
+
+# Окончания и суффиксы, которые отбрасываются у русских слов (сначала длинные)
+_ENDINGS = tuple(sorted((
+    "ением", "ения", "ение", "ению", "ении", "ость", "ости", "ский", "ская", "ское", "ские", "ских", "ским",
+    "иями", "иях", "иям", "ией", "ями", "ами", "ого", "его", "ому", "ему", "ыми", "ими", "ить", "ать", "ять", "еть", "ует", "уют",
+    "ают", "яют", "ия", "ие", "ии", "ию", "ий", "ей", "ый", "ой", "ая", "яя", "ое", "ее", "ые", "ых", "их", "ую", "юю", "ам",
+    "ям", "ах", "ях", "ом", "ем", "ов", "ев", "а", "я", "о", "е", "и", "ы", "у", "ю", "ь"
+), key=len, reverse=True))
+
+# Минимальная длина основы после отбрасывания окончания и максимальная длина терма
+_MIN_STEM = 4
+_MAX_STEM = 7
+
+
+def stem(word: str) -> str:
+    """
+    Грубая основа слова: без окончания и не длиннее _MAX_STEM символов
+    ("внедрить", "внедрение" -> "внедр"; "строительными", "строительстве" -> "строите").
+    """
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= _MIN_STEM:
+            word = word[:-len(ending)]
+            break
+    return word[:_MAX_STEM]
+
+
+def tokenize(text: str) -> List[str]:
+    """Термы текста: нижний регистр, ё -> е, без стоп-слов, основы слов."""
+    words = _WORD.findall(text.lower().replace("ё", "е"))
+    return [stem(word) for word in words if len(word) > 1 and word not in _STOP_WORDS]
+
+
+class KnowledgeChunk(NamedTuple):
+    """Фрагмент базы знаний."""
+
+    source: str
+    title: str
+    text: str
+
+
+def split_chunks(source: str, content: str, chunk_chars: int = 800) -> List[KnowledgeChunk]:
+    """
+    Разрезать файл на фрагменты по абзацам.
+
+    Заголовок markdown (# ...) становится названием следующих за ним
+    фрагментов. Абзацы объединяются, пока фрагмент не длиннее chunk_chars.
+    """
+    chunks = []
+    title = os.path.splitext(os.path.basename(source))[0]
+    parts: List[str] = []
+
+    def flush() -> None:
+        if parts:
+            chunks.append(KnowledgeChunk(source, title, "\n\n".join(parts)))
+            parts.clear()
+
+    for paragraph in re.split(r"\n\s*\n", content):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if paragraph.startswith("#"):
+            flush()
+            heading, _, rest = paragraph.partition("\n")
+            title = heading.lstrip("#").strip() or title
+            paragraph = rest.strip()
+            if not paragraph:
+                continue
+        if parts and sum(len(part) for part in parts) + len(paragraph) > chunk_chars:
+            flush()
+        parts.append(paragraph)
+    flush()
+    return chunks
+
+
+class KnowledgeBase:
+    """Инвертированный индекс фрагментов с ранжированием BM25."""
+
+    def __init__(self, directory: str, chunk_chars: int = 800, k1: float = 1.5, b: float = 0.75):
+        self.directory = directory
+        self.chunk_chars = chunk_chars
+        self.k1 = k1
+        self.b = b
+        self.chunks: Dict[int, KnowledgeChunk] = {}
+        # терм -> {id фрагмента: частота терма во фрагменте}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._file_chunks: Dict[str, List[int]] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._next_id = 0
+
+    def reload_if_changed(self) -> bool:
+        """
+        Переиндексировать добавленные, измененные и удаленные файлы.
+
+        Returns:
+            True если индекс изменился
+        """
+        mtimes = self._read_mtimes()
+        changed = [path for path, mtime in mtimes.items() if self._mtimes.get(path) != mtime]
+        removed = [path for path in self._mtimes if path not in mtimes]
+        for path in removed:
+            self._remove_file(path)
+            del self._mtimes[path]
+        for path in changed:
+            self._remove_file(path)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    content = f.read()
+            except OSError as e:
+                logging.error(f"Не удалось прочитать файл базы знаний {path}: {e}")
+                continue
+            self._add_file(path, content)
+            self._mtimes[path] = mtimes[path]
+        if changed or removed:
+            logging.info(f"База знаний обновлена: файлов {len(self._mtimes)}, фрагментов {len(self.chunks)}")
+        return bool(changed or removed)
+
+    async def watch(self, interval_seconds: float) -> None:
+        """Фоновая проверка изменений файлов базы знаний."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                self.reload_if_changed()
+            except Exception as e:
+                logging.error(f"Ошибка при обновлении базы знаний: {e}")
+
+    def search(self, query: str, top_k: int = 3, min_score: float = 0.0) -> List[Tuple[KnowledgeChunk, float]]:
+        """
+        Самые подходящие к запросу фрагменты.
+
+        Returns:
+            Фрагменты с оценкой BM25 по убыванию оценки
+        """
+        if not self.chunks:
+            return []
+        total = len(self.chunks)
+        average_length = self._total_length / total
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, tf in postings.items():
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[chunk_id] / average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [(self.chunks[chunk_id], score) for chunk_id, score in best if score >= min_score]
+
+    def _add_file(self, path: str, content: str) -> None:
+        """Проиндексировать фрагменты файла."""
+        ids = []
+        for chunk in split_chunks(os.path.relpath(path, self.directory), content, self.chunk_chars):
+            chunk_id = self._next_id
+            self._next_id += 1
+            terms = Counter(tokenize(f"{chunk.title}\n{chunk.text}"))
+            for term, tf in terms.items():
+                self._postings.setdefault(term, {})[chunk_id] = tf
+            self.chunks[chunk_id] = chunk
+            self._lengths[chunk_id] = sum(terms.values())
+            self._total_length += self._lengths[chunk_id]
+            ids.append(chunk_id)
+        self._file_chunks[path] = ids
+
+    def _remove_file(self, path: str) -> None:
+        """Убрать фрагменты файла из индекса."""
+        ids: Set[int] = set(self._file_chunks.pop(path, ()))
+        if not ids:
+            return
+        for chunk_id in ids:
+            chunk = self.chunks.pop(chunk_id)
+            self._total_length -= self._lengths.pop(chunk_id)
+            for term in set(tokenize(f"{chunk.title}\n{chunk.text}")):
+                postings = self._postings[term]
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def _read_mtimes(self) -> Dict[str, float]:
+        """Файлы базы знаний и время их изменения."""
+        mtimes = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if name.endswith(KNOWLEDGE_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    try:
+                        mtimes[path] = os.stat(path).st_mtime
+                    except OSError:
+                        continue
+        return mtimes
+
+
+def format_knowledge(results: List[Tuple[KnowledgeChunk, float]], max_tokens: int) -> str:
+    """
+    Текст найденных фрагментов для контекста LLM в пределах max_tokens.
+
+    Фрагменты идут по убыванию оценки; не поместившиеся отбрасываются.
+    """
+    parts = []
+    budget = max_tokens
+    for chunk, _ in results:
+        part = f"[{chunk.title}]\n{chunk.text}"
+        tokens = count_tokens(part)
+        if tokens > budget:
+            continue
+        parts.append(part)
+        budget -= tokens
+    return "\n\n".join(parts)
+
+
+def create_knowledge_base() -> Optional[KnowledgeBase]:
+    """Создать и проиндексировать базу знаний по секции knowledge_base (None если выключена)."""
+    kb_config = get_section('knowledge_base')
+    if not kb_config.get('enabled', False):
+        return None
+
+    directory = kb_config.get('directory', 'knowledge')
+    if not os.path.isabs(directory):
+        directory = os.path.join(get_project_root(), directory)
+    knowledge_base = KnowledgeBase(directory, chunk_chars=kb_config.get('chunk_chars', 800))
+    knowledge_base.reload_if_changed()
+    if not knowledge_base.chunks:
+        logging.warning(f"База знаний пуста: {directory}")
+    return knowledge_base
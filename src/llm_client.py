@@ -7,11 +7,20 @@ import os
 import logging
 import time
 import asyncio
-from openai import OpenAI
+import httpx
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from openai import AsyncOpenAI, APITimeoutError
 
+import metrics
 from logger import log_llm_request, log_error
-from config import get_llm_config, load_prompts
-from conversation_memory import conversation_memory
+from config import config_store, get_llm_config, get_prompt, get_section
+from context_builder import SystemPrefix, build_messages, get_system_prefix
+from knowledge_base import create_knowledge_base, format_knowledge
+from response_cache import create_response_cache
+from conversation_memory import conversation_memory, SummarySnapshot
+from scheduler import SchedulerRejected, create_scheduler
+from retry_policy import CircuitOpenError, create_retry_policy
+from model_router import create_model_router
 
 
 class LLMClient:
@@ -19,28 +28,133 @@ class LLMClient:
     
     def __init__(self):
         """Инициализация клиента с настройками из конфигурации."""
-        self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
-            api_key=os.getenv("OPENROUTER_API_KEY")
-        )
-        
         # Загружаем конфигурацию LLM
         llm_config = get_llm_config()
         self.model = llm_config.get('model', 'google/gemini-2.0-flash-exp:free')
+        self.max_concurrent_requests = llm_config.get('max_concurrent_requests', 100)
+        self._apply_settings()
+        
+        # Кеш ответов на повторяющиеся вопросы (None если выключен)
+        self.response_cache = create_response_cache()
+        
+        # Сведения об услугах: в запрос попадают только фрагменты, подходящие к вопросу
+        self.knowledge_base = create_knowledge_base()
+        
+        self._summarizing = set()
+        self._background_tasks = set()
+        
+        # Ограничение одновременных запросов к OpenRouter, лимиты пользователей
+        # и справедливая очередь. Ожидающие запросы не держат потоки.
+        self.scheduler = create_scheduler()
+        
+        # Повторы только повторяемых ошибок с экспоненциальной паузой
+        self.retry_policy = create_retry_policy()
+        # Выбор модели по задержке и ошибкам; у каждой модели свой circuit breaker,
+        # при недоступности всех моделей - быстрый отказ без ожидания таймаутов
+        self.router = create_model_router()
+        
+        # Один долгоживущий пул keep-alive соединений на весь процесс,
+        # чтобы не платить за TLS-рукопожатие на каждое сообщение
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=llm_config.get('pool_max_connections', 100),
+                max_keepalive_connections=llm_config.get('pool_max_keepalive', 20),
+                keepalive_expiry=llm_config.get('pool_keepalive_expiry_seconds', 30)
+            )
+        )
+        # Повторы делаем сами (см. get_response), поэтому у SDK они отключены
+        self.client = AsyncOpenAI(
+            base_url=llm_config.get('base_url', 'https://openrouter.ai/api/v1'),
+            api_key=os.getenv("OPENROUTER_API_KEY"),
+            http_client=self.http_client,
+            timeout=self.timeout_seconds,
+            max_retries=0
+        )
+        
+        logging.info(f"LLM клиент инициализирован: модели={self.router.models}, max_tokens={self.max_tokens}, timeout={self.timeout_seconds}s, max_concurrent={self.max_concurrent_requests}")
+
+    def _apply_settings(self) -> None:
+        """
+        Прочитать параметры запросов, которые можно менять без перезапуска.
+        
+        Модели, пул соединений, планировщик, повторы и кеш создаются один
+        раз в __init__ и меняются только перезапуском.
+        """
+        llm_config = get_llm_config()
         self.max_tokens = llm_config.get('max_tokens', 1000)
         self.temperature = llm_config.get('temperature', 0.7)
-        self.history_limit = llm_config.get('history_limit', 6)
+        self.history_limit = llm_config.get('history_limit', 20)
+        self.max_prompt_tokens = llm_config.get('max_prompt_tokens', 3000)
         self.timeout_seconds = llm_config.get('timeout_seconds', 30)
         self.max_retries = llm_config.get('max_retries', 2)
-        self.retry_delay = llm_config.get('retry_delay_seconds', 1)
+        self.stream = llm_config.get('stream', False)
+        self.stream_edit_interval = llm_config.get('stream_edit_interval_seconds', 1.0)
+        # Модели (префиксы имен), которым кеширование системного промпта указывается явно
+        self.prompt_cache_models = tuple(llm_config.get('prompt_cache_models') or ())
         
-        # Используем глобальное хранилище истории диалогов
+        kb_config = get_section('knowledge_base')
+        self.knowledge_top_k = kb_config.get('top_k', 3)
+        self.knowledge_min_score = kb_config.get('min_score', 1.0)
+        self.knowledge_max_tokens = kb_config.get('max_tokens', 600)
         
-        # Загружаем промпты из конфигурации
-        prompts = load_prompts()
-        self.system_prompt = prompts.get('system_prompt', 'Ты консультант компании.')
+        # Фоновое сжатие старой части диалога в краткое содержание
+        summary_config = get_section('summary')
+        self.summary_enabled = summary_config.get('enabled', True)
+        self.summary_threshold = summary_config.get('threshold_messages', 12)
+        self.summary_keep_recent = summary_config.get('keep_recent_messages', 6)
+        self.summary_max_tokens = summary_config.get('max_tokens', 300)
+        self._settings_version = config_store.version
+
+    def refresh_settings(self) -> None:
+        """Перечитать параметры запросов, если конфигурация была перезагружена."""
+        if self._settings_version != config_store.version:
+            self._apply_settings()
+            logging.info(f"Параметры LLM клиента обновлены: max_tokens={self.max_tokens}, timeout={self.timeout_seconds}s")
+
+    @property
+    def in_flight(self) -> int:
+        """Число выполняющихся запросов к LLM."""
+        return self.scheduler.in_flight
+    
+    @property
+    def waiting(self) -> int:
+        """Число запросов, ожидающих свободный слот."""
+        return self.scheduler.waiting
+
+    @property
+    def system_prompt(self) -> str:
+        """Системный промпт из кеша конфигурации (учитывает горячую перезагрузку)."""
+        return get_prompt('system_prompt', 'Ты консультант компании.')
+    
+    @property
+    def system_prefix(self) -> SystemPrefix:
+        """Неизменяемый префикс запроса для текущего системного промпта."""
+        return get_system_prefix(self.system_prompt)
+
+    async def _create_completion(self, user_id: int, model: str, weight: Optional[float] = None, **kwargs):
+        """
+        Выполнить один запрос к модели через планировщик и с таймаутом.
         
-        logging.info(f"LLM клиент инициализирован: модель={self.model}, max_tokens={self.max_tokens}, timeout={self.timeout_seconds}s")
+        При таймауте запрос отменяется по-настоящему: корутина httpx
+        прерывается и соединение возвращается в пул.
+        """
+        self.router.breakers[model].before_call()
+        try:
+            await self.scheduler.acquire(user_id, weight)
+            try:
+                started = time.monotonic()
+                response = await asyncio.wait_for(
+                    self.client.chat.completions.create(model=model, **kwargs),
+                    timeout=self.timeout_seconds
+                )
+                self.router.record_latency(model, time.monotonic() - started)
+            finally:
+                self.scheduler.release()
+        except BaseException as e:
+            self.router.record_result(model, e)
+            raise
+        self.router.record_result(model)
+        return response
 
     async def get_response(self, user_message: str, user_id: int, user_name: str = None) -> str:
         """
@@ -54,95 +168,418 @@ class LLMClient:
         Returns:
             Ответ от LLM
         """
+        self.refresh_settings()
         start_time = time.time()
+        messages, current_message = self._build_messages(user_message, user_id, user_name)
         
-        # Получаем историю диалога для пользователя
-        history = conversation_memory.get_history(user_id, self.history_limit)
+        # Повторяющиеся вопросы в том же контексте отдаем из кеша
+        cached = self._get_cached(messages, user_message, user_name)
+        if cached is not None:
+            self._handle_cache_hit(user_id, current_message, *cached, start_time)
+            return cached[0]
         
-        # Формируем сообщения с учетом истории
-        messages = [{"role": "system", "content": self.system_prompt}]
-        messages.extend(history)
-        
-        # Добавляем текущее сообщение
-        current_message = f"Клиент {user_name}: {user_message}" if user_name else user_message
-        messages.append({"role": "user", "content": current_message})
+        # Пользователь превысил лимит запросов - отвечаем сразу, без очереди
+        if not self.scheduler.admit(user_id):
+            self._log_rejected(user_id, "rate_limit", start_time, self.model)
+            return self._get_overload_message()
         
         logging.info(f"Отправляем запрос к LLM: {user_message}")
         
+        # Модели, к которым уже обращались: повтор уходит в первую очередь к другим
+        tried_models = []
+        
+        async def start(model: str):
+            tried_models.append(model)
+            return await self._create_completion(
+                user_id,
+                model,
+                messages=self._with_cache_control(messages, model),
+                max_tokens=self.max_tokens,
+                temperature=self.temperature
+            )
+        
         # Пробуем отправить запрос с повторными попытками
         for attempt in range(self.max_retries + 1):
             try:
-                response = await asyncio.wait_for(
-                    asyncio.to_thread(
-                        self.client.chat.completions.create,
-                        model=self.model,
-                        messages=messages,
-                        max_tokens=self.max_tokens,
-                        temperature=self.temperature
-                    ),
-                    timeout=self.timeout_seconds
-                )
-                
-                # Вычисляем время ответа
-                response_time_ms = int((time.time() - start_time) * 1000)
+                # Под нагрузкой второй параллельный запрос только удлинит очередь
+                response, model = await self.router.run(start, avoid=tried_models, hedge=self.scheduler.waiting == 0)
                 
                 llm_response = response.choices[0].message.content
-                logging.info(f"Получен ответ от LLM: {llm_response[:100]}...")
+                self._handle_success(user_id, current_message, llm_response, response.usage, start_time, model)
+                self._put_cached(messages, user_message, llm_response, user_name, model)
+                return llm_response
                 
-                # Логируем LLM запрос
-                prompt_tokens = response.usage.prompt_tokens if response.usage else None
-                completion_tokens = response.usage.completion_tokens if response.usage else None
+            except SchedulerRejected as e:
+                # Перегрузка: повтор только увеличит очередь
+                self._log_rejected(user_id, e.reason, start_time, self._attempted_model(tried_models))
+                return self._get_overload_message()
                 
-                log_llm_request(
-                    user_id=user_id,
-                    model=self.model,
-                    prompt_tokens=prompt_tokens,
-                    completion_tokens=completion_tokens,
-                    response_time_ms=response_time_ms,
-                    status="success"
+            except CircuitOpenError:
+                # OpenRouter недоступен - не ждем таймаутов
+                logging.warning(f"LLM недоступен, запрос {user_id} отклонен без отправки")
+                self._log_llm_error(user_id, user_message, "circuit_open", time.time() - start_time,
+                                    self._attempted_model(tried_models))
+                break
+                
+            except Exception as e:
+                error = self._describe_error(e)
+                logging.error(f"{error} - попытка {attempt + 1}/{self.max_retries + 1}")
+                
+                delay = self.retry_policy.get_delay(e, attempt) if attempt < self.max_retries else None
+                if delay is not None:
+                    metrics.llm_retries_total.inc()
+                    await asyncio.sleep(delay)
+                    continue
+                
+                # Ошибка не повторяемая или попытки исчерпаны
+                self._log_llm_error(user_id, user_message, error, time.time() - start_time,
+                                    self._attempted_model(tried_models))
+                break
+        
+        # Все попытки исчерпаны - возвращаем fallback сообщение
+        return self._get_error_message()
+    
+    async def stream_response(self, user_message: str, user_id: int, user_name: str = None) -> AsyncIterator[str]:
+        """
+        Получить ответ от LLM по частям (stream=True).
+        
+        Повторные попытки возможны только до первого полученного фрагмента:
+        после этого пользователь уже видит текст, и начинать заново нельзя.
+        
+        Args:
+            user_message: Сообщение пользователя
+            user_id: ID пользователя для истории диалога
+            user_name: Имя пользователя (опционально)
+            
+        Yields:
+            Очередные фрагменты текста ответа
+        """
+        self.refresh_settings()
+        start_time = time.time()
+        messages, current_message = self._build_messages(user_message, user_id, user_name)
+        
+        # Ответ из кеша отдаем одним фрагментом
+        cached = self._get_cached(messages, user_message, user_name)
+        if cached is not None:
+            self._handle_cache_hit(user_id, current_message, *cached, start_time)
+            yield cached[0]
+            return
+        
+        if not self.scheduler.admit(user_id):
+            self._log_rejected(user_id, "rate_limit", start_time, self.model)
+            yield self._get_overload_message()
+            return
+        
+        logging.info(f"Отправляем потоковый запрос к LLM: {user_message}")
+        
+        tried_models = []
+        
+        async def start(model: str):
+            tried_models.append(model)
+            return await self._open_stream(
+                user_id,
+                model,
+                messages=self._with_cache_control(messages, model),
+                max_tokens=self.max_tokens,
+                temperature=self.temperature
+            )
+        
+        for attempt in range(self.max_retries + 1):
+            parts = []
+            usage = None
+            # Модель, приславшая первый фрагмент
+            model = None
+            try:
+                # Hedging для потока: побеждает модель, первой приславшая фрагмент
+                (chunks, chunk), model = await self.router.run(
+                    start, avoid=tried_models, hedge=self.scheduler.waiting == 0, discard=self._close_stream
                 )
+                try:
+                    while chunk is not None:
+                        if chunk.usage:
+                            usage = chunk.usage
+                        delta = chunk.choices[0].delta.content if chunk.choices else None
+                        if delta:
+                            parts.append(delta)
+                            yield delta
+                        chunk = await anext(chunks, None)
+                finally:
+                    await chunks.aclose()
                 
-                # Сохраняем в историю диалога
-                conversation_memory.add_message(user_id, "user", current_message)
-                conversation_memory.add_message(user_id, "assistant", llm_response)
+                self._handle_success(user_id, current_message, "".join(parts), usage, start_time, model)
+                self._put_cached(messages, user_message, "".join(parts), user_name, model)
+                return
                 
-                return llm_response
+            except SchedulerRejected as e:
+                self._log_rejected(user_id, e.reason, start_time, self._attempted_model(tried_models))
+                yield self._get_overload_message()
+                return
                 
-            except asyncio.TimeoutError:
-                error_msg = f"Таймаут LLM запроса ({self.timeout_seconds}s) - попытка {attempt + 1}/{self.max_retries + 1}"
-                logging.warning(error_msg)
+            except CircuitOpenError:
+                logging.warning(f"LLM недоступен, потоковый запрос {user_id} отклонен без отправки")
+                self._log_llm_error(user_id, user_message, "circuit_open", time.time() - start_time,
+                                    self._attempted_model(tried_models))
+                yield self._get_error_message()
+                return
                 
-                if attempt < self.max_retries:
-                    await asyncio.sleep(self.retry_delay)
-                    continue
-                else:
-                    # Последняя попытка не удалась
-                    self._log_llm_error(user_id, user_message, f"Timeout after {self.max_retries + 1} attempts", time.time() - start_time)
-                    break
-                    
             except Exception as e:
-                error_msg = f"Ошибка LLM запроса: {str(e)} - попытка {attempt + 1}/{self.max_retries + 1}"
-                logging.error(error_msg)
+                error = self._describe_error(e)
+                logging.error(f"{error} - попытка {attempt + 1}/{self.max_retries + 1}")
                 
-                if attempt < self.max_retries:
-                    await asyncio.sleep(self.retry_delay)
+                delay = self.retry_policy.get_delay(e, attempt) if not parts and attempt < self.max_retries else None
+                if delay is not None:
+                    metrics.llm_retries_total.inc()
+                    await asyncio.sleep(delay)
                     continue
-                else:
-                    # Последняя попытка не удалась
-                    self._log_llm_error(user_id, user_message, str(e), time.time() - start_time)
-                    break
+                
+                # Часть ответа уже показана, ошибка не повторяемая или попытки исчерпаны
+                self._log_llm_error(user_id, user_message, error, time.time() - start_time,
+                                    model or self._attempted_model(tried_models))
+                if not parts:
+                    yield self._get_error_message()
+                return
+    
+    async def _open_stream(self, user_id: int, model: str, **kwargs) -> Tuple[AsyncIterator[Any], Any]:
+        """
+        Начать потоковый запрос и дождаться первого фрагмента.
         
-        # Все попытки исчерпаны - возвращаем fallback сообщение
-        return self._get_error_message()
+        Returns:
+            Поток оставшихся фрагментов и первый фрагмент (None, если поток пустой)
+        """
+        chunks = self._stream_completion(user_id, model, **kwargs)
+        try:
+            first = await anext(chunks, None)
+        except BaseException:
+            await chunks.aclose()
+            raise
+        return chunks, first
+    
+    @staticmethod
+    async def _close_stream(opened: Tuple[AsyncIterator[Any], Any]) -> None:
+        """Закрыть поток, проигравший в hedging."""
+        await opened[0].aclose()
     
-    def _log_llm_error(self, user_id: int, user_message: str, error: str, elapsed_time: float) -> None:
-        """Логирование ошибки LLM запроса."""
+    async def _stream_completion(self, user_id: int, model: str, **kwargs) -> AsyncIterator[Any]:
+        """
+        Потоковый запрос к модели через circuit breaker и планировщик.
+        
+        timeout_seconds ограничивает ожидание каждого фрагмента (в том числе
+        первого), а не весь ответ целиком. Задержкой модели считается время
+        до первого фрагмента.
+        """
+        self.router.breakers[model].before_call()
+        try:
+            await self.scheduler.acquire(user_id)
+            try:
+                started = time.monotonic()
+                stream = await asyncio.wait_for(
+                    self.client.chat.completions.create(
+                        model=model,
+                        stream=True,
+                        stream_options={"include_usage": True},
+                        **kwargs
+                    ),
+                    timeout=self.timeout_seconds
+                )
+                try:
+                    chunks = stream.__aiter__()
+                    while True:
+                        try:
+                            chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.timeout_seconds)
+                        except StopAsyncIteration:
+                            break
+                        if started is not None:
+                            self.router.record_latency(model, time.monotonic() - started)
+                            started = None
+                        yield chunk
+                finally:
+                    await stream.close()
+            finally:
+                self.scheduler.release()
+        except BaseException as e:
+            self.router.record_result(model, e)
+            raise
+        self.router.record_result(model)
+    
+    def _build_messages(self, user_message: str, user_id: int, user_name: str = None) -> Tuple[List[Dict[str, str]], str]:
+        """Сформировать список сообщений для LLM: системный промпт + история + текущее."""
+        # Получаем историю диалога для пользователя
+        history, history_tokens = conversation_memory.get_history_with_tokens(user_id, self.history_limit)
+        
+        # Краткое содержание более ранней части диалога (если есть)
+        summary = conversation_memory.get_summary(user_id)
+        if summary:
+            summary = get_prompt('summary_context', '{summary}').replace('{summary}', summary)
+        
+        # Текущее сообщение
+        current_message = f"Клиент {user_name}: {user_message}" if user_name else user_message
+        
+        knowledge = self._find_knowledge(user_message)
+        
+        # История берется от новых к старым, пока помещается в бюджет токенов
+        messages = build_messages(self.system_prefix, history, current_message, self.max_prompt_tokens, summary, knowledge,
+                                  history_tokens)
+        
+        return messages, current_message
+    
+    def _find_knowledge(self, user_message: str) -> str:
+        """Фрагменты базы знаний, подходящие к вопросу (пустая строка, если таких нет)."""
+        if self.knowledge_base is None:
+            return ""
+        results = self.knowledge_base.search(user_message, self.knowledge_top_k, self.knowledge_min_score)
+        knowledge = format_knowledge(results, self.knowledge_max_tokens)
+        if not knowledge:
+            return ""
+        logging.info(f"Из базы знаний взято фрагментов: {len(results)} ({', '.join(chunk.source for chunk, _ in results)})")
+        return get_prompt('knowledge_context', '{knowledge}').replace('{knowledge}', knowledge)
+    
+    def _with_cache_control(self, messages: List[Dict[str, Any]], model: str) -> List[Dict[str, Any]]:
+        """Пометить системный префикс для кеширования, если модель требует явной пометки."""
+        if not model.startswith(self.prompt_cache_models):
+            return messages
+        prefix = self.system_prefix
+        if not messages or messages[0] is not prefix.message:
+            return messages
+        return [prefix.cached_message] + messages[1:]
+    
+    def _handle_success(self, user_id: int, current_message: str, llm_response: str, usage: Any, start_time: float, model: str) -> None:
+        """Залогировать успешный ответ LLM и сохранить его в историю диалога."""
+        # Вычисляем время ответа
+        response_time_ms = int((time.time() - start_time) * 1000)
+        
+        logging.info(f"Получен ответ от LLM: {llm_response[:100]}...")
+        
+        # Логируем LLM запрос
+        prompt_tokens = usage.prompt_tokens if usage else None
+        completion_tokens = usage.completion_tokens if usage else None
+        
+        log_llm_request(
+            user_id=user_id,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=_cached_tokens(usage),
+            response_time_ms=response_time_ms,
+            status="success"
+        )
+        
+        # Сохраняем в историю диалога
+        conversation_memory.add_message(user_id, "user", current_message)
+        conversation_memory.add_message(user_id, "assistant", llm_response)
+        
+        # Длинную историю сжимаем в фоне, не задерживая ответ
+        self._schedule_summary(user_id)
+    
+    def _get_cached(self, messages: List[Dict[str, str]], user_message: str,
+                    user_name: str = None) -> Optional[Tuple[str, str]]:
+        """
+        Найти ответ в кеше: ключ - контекст перед вопросом и сам вопрос.
+        
+        Returns:
+            (ответ, модель, которая его дала) или None
+        """
+        if self.response_cache is None:
+            return None
+        found = self.response_cache.get_with_source(self.model, messages[:-1], user_message, user_name)
+        if found is None:
+            return None
+        response, source = found
+        return response, source or self.model
+    
+    def _put_cached(self, messages: List[Dict[str, str]], user_message: str, llm_response: str,
+                    user_name: str, model: str) -> None:
+        """Сохранить успешный ответ модели model в кеш."""
+        if self.response_cache is not None:
+            self.response_cache.put(self.model, messages[:-1], user_message, llm_response, user_name, source=model)
+    
+    def _attempted_model(self, tried_models: List[str]) -> str:
+        """Модель последней попытки запроса (основная, если запрос не успел уйти)."""
+        return tried_models[-1] if tried_models else self.model
+    
+    def _handle_cache_hit(self, user_id: int, current_message: str, cached_response: str, model: str,
+                          start_time: float) -> None:
+        """Залогировать ответ из кеша (model - модель, давшая ответ) и сохранить его в историю диалога."""
+        response_time_ms = int((time.time() - start_time) * 1000)
+        logging.info(f"Ответ для пользователя {user_id} взят из кеша")
+        
+        log_llm_request(
+            user_id=user_id,
+            model=model,
+            prompt_tokens=0,
+            completion_tokens=0,
+            response_time_ms=response_time_ms,
+            status="cache_hit"
+        )
+        
+        conversation_memory.add_message(user_id, "user", current_message)
+        conversation_memory.add_message(user_id, "assistant", cached_response)
+        self._schedule_summary(user_id)
+    
+    def _schedule_summary(self, user_id: int) -> None:
+        """Запустить фоновое сжатие старых сообщений, если история достигла порога."""
+        if not self.summary_enabled or user_id in self._summarizing:
+            return
+        
+        snapshot = conversation_memory.get_summary_snapshot(user_id, self.summary_threshold, self.summary_keep_recent)
+        if snapshot is None:
+            return
+        
+        self._summarizing.add(user_id)
+        task = asyncio.create_task(self._summarize(user_id, snapshot))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _summarize(self, user_id: int, snapshot: SummarySnapshot) -> None:
+        """Сжать старые сообщения в краткое содержание (дополняя предыдущее)."""
+        start_time = time.time()
+        try:
+            dialog = "\n".join(
+                f"{'Клиент' if message['role'] == 'user' else 'Консультант'}: {message['content']}"
+                for message in snapshot.messages
+            )
+            request = get_prompt('summary_request', '{summary}\n\n{dialog}').replace(
+                '{summary}', snapshot.summary or '-'
+            ).replace('{dialog}', dialog)
+            
+            # Фоновое сжатие уступает в очереди ответам пользователям
+            model = self.router.pick()
+            response = await self._create_completion(
+                user_id,
+                model,
+                weight=0.5,
+                messages=[
+                    {"role": "system", "content": get_prompt('summary_prompt', 'Кратко перескажи диалог.')},
+                    {"role": "user", "content": request}
+                ],
+                max_tokens=self.summary_max_tokens,
+                temperature=0.2
+            )
+            summary = (response.choices[0].message.content or "").strip()
+            if summary and conversation_memory.apply_summary(user_id, snapshot, summary):
+                logging.info(f"История пользователя {user_id} сжата: {len(snapshot.messages)} сообщений -> {len(summary)} символов")
+            
+            log_llm_request(
+                user_id=user_id,
+                model=model,
+                prompt_tokens=response.usage.prompt_tokens if response.usage else None,
+                completion_tokens=response.usage.completion_tokens if response.usage else None,
+                cached_tokens=_cached_tokens(response.usage),
+                response_time_ms=int((time.time() - start_time) * 1000),
+                status="summary"
+            )
+        except Exception as e:
+            logging.warning(f"Не удалось сжать историю пользователя {user_id}: {e}")
+        finally:
+            self._summarizing.discard(user_id)
+    
+    def _log_llm_error(self, user_id: int, user_message: str, error: str, elapsed_time: float, model: str) -> None:
+        """Логирование ошибки LLM запроса к модели model."""
         response_time_ms = int(elapsed_time * 1000)
         
         # Логируем ошибку LLM запроса
         log_llm_request(
             user_id=user_id,
-            model=self.model,
+            model=model,
             response_time_ms=response_time_ms,
             status="error",
             error=error
@@ -153,19 +590,77 @@ class LLMClient:
             error_type="llm_request_error",
             error_message=error,
             user_id=user_id,
-            additional_data={"model": self.model, "message": user_message}
+            additional_data={"model": model, "message": user_message}
         )
     
+    def _describe_error(self, error: Exception) -> str:
+        """Текст ошибки LLM запроса для логов."""
+        if isinstance(error, (asyncio.TimeoutError, APITimeoutError)):
+            return f"Таймаут LLM запроса ({self.timeout_seconds}s)"
+        return f"Ошибка LLM запроса: {str(error)}"
+    
+    def _log_rejected(self, user_id: int, reason: str, start_time: float, model: str) -> None:
+        """Залогировать запрос к модели model, не допущенный планировщиком."""
+        log_llm_request(
+            user_id=user_id,
+            model=model,
+            response_time_ms=int((time.time() - start_time) * 1000),
+            status="rejected",
+            error=reason
+        )
+    
+    def _get_overload_message(self) -> str:
+        """Сообщение о перегрузке для отклоненного запроса."""
+        return get_prompt('overload_message', 'Сейчас слишком много обращений. Пожалуйста, повторите вопрос через минуту.')
+    
     def _get_error_message(self) -> str:
         """Получить сообщение об ошибке из конфигурации."""
         try:
-            prompts = load_prompts()
-            return prompts.get('error_message', 'Извините, произошла ошибка при обработке вашего запроса. Попробуйте позже.')
+            return get_prompt('error_message', 'Извините, произошла ошибка при обработке вашего запроса. Попробуйте позже.')
         except Exception:
             # Если даже конфигурация не загружается - используем hardcoded сообщение
             return 'Извините, произошла техническая ошибка. Попробуйте позже или обратитесь к менеджеру.'
+    
+    async def warm_up(self, timeout: float = 10) -> bool:
+        """
+        Подготовить клиент к первому запросу до приема сообщений.
+        
+        Создает ленивые объекты SDK и префикс системного промпта, а дешевый
+        запрос списка моделей проходит DNS и TLS и оставляет соединение в пуле.
+        
+        Returns:
+            True если OpenRouter ответил
+        """
+        # Ленивые ресурсы SDK и префикс промпта создаются здесь, а не в первом запросе
+        _ = self.client.chat.completions, self.system_prefix
+        try:
+            await asyncio.wait_for(self.client.models.list(), timeout=timeout)
+            return True
+        except Exception as e:
+            logging.warning(f"Не удалось прогреть соединение с OpenRouter: {e}")
+            return False
+
+    async def close(self) -> None:
+        """Закрыть пул HTTP-соединений (вызывается при остановке бота)."""
+        # Фоновые задачи (сжатие истории) больше не нужны
+        for task in list(self._background_tasks):
+            task.cancel()
+        await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await self.client.close()
+        logging.info("LLM клиент закрыт")
+
+
+def _cached_tokens(usage: Any) -> Optional[int]:
+    """Токены промпта, взятые провайдером из кеша (если он их сообщил)."""
+    details = getattr(usage, 'prompt_tokens_details', None)
+    return getattr(details, 'cached_tokens', None)
 
 
 def create_llm_client() -> LLMClient:
-    """Создать экземпляр LLM клиента."""
+    """
+    Создать экземпляр LLM клиента.
+    
+    Вызывается один раз в bot.main(): клиент живет весь процесс
+    и передается в обработчики через диспетчер.
+    """
     return LLMClient()
\ No newline at end of file
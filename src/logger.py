@@ -1,13 +1,27 @@
 """
 Система логирования для LLM-ассистента.
 Простое логирование в JSON файлы по дням согласно vision.md.
+
+Записи JSON логов по возможности пишутся в фоне: log_* функции только
+кладут запись в очередь, а отдельный поток пишет пакеты в открытые файлы.
+Пока фоновая запись не запущена (тесты, скрипты), записи пишутся сразу.
 """
 
+import gzip
 import json
 import logging
+import logging.handlers
 import os
+import queue
+import re
+import shutil
+import threading
+import time
 from datetime import datetime, date
-from typing import Optional
+from typing import Dict, List, Optional, TextIO, Tuple
+
+import metrics
+from config import get_logging_config
 
 
 def get_project_root() -> str:
@@ -15,32 +29,176 @@ def get_project_root() -> str:
     return os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
-def setup_logging() -> None:
-    """Настройка Python logging с записью в файлы по дням."""
-    project_root = get_project_root()
-    logs_dir = os.path.join(project_root, 'logs')
+def get_logs_dir() -> str:
+    """Папка логов: LOGS_DIR из окружения (наследуют и воркеры) или logs/ в корне проекта."""
+    return os.getenv('LOGS_DIR') or os.path.join(get_project_root(), 'logs')
+
+
+def setup_logging(worker_id: Optional[int] = None) -> None:
+    """
+    Настройка Python logging с записью в файлы по дням.
+    
+    Args:
+        worker_id: Номер процесса-воркера: его логи пишутся в отдельные
+            файлы <тип>-w<N>_<дата>, а старые логи разбирает только супервизор
+    """
+    global _worker_tag
+    if worker_id is not None:
+        _worker_tag = f'-w{worker_id}'
+    
+    logs_dir = get_logs_dir()
     
     # Создаем папку для логов если не существует
     os.makedirs(logs_dir, exist_ok=True)
     
-    # Формируем имя файла с текущей датой
-    today = date.today().strftime("%Y-%m-%d")
-    log_file = os.path.join(logs_dir, f'app_{today}.log')
+    # Файл app_<дата>.log переключается на новую дату в полночь
+    logging_config = get_logging_config()
+    file_handler = DailyRotatingFileHandler(
+        logs_dir,
+        prefix=f'app{_worker_tag}',
+        max_bytes=int(logging_config.get('max_file_size_mb', 100) * 1024 * 1024),
+        retention_days=logging_config.get('retention_days', 30),
+        compress_after_days=logging_config.get('compress_after_days', 1)
+    )
     
-    # Настраиваем логирование
+    # Настраиваем логирование. force: конфигурация читается уже при импорте модулей,
+    # и ее logging.info успевает повесить на root обработчик по умолчанию
     logging.basicConfig(
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
         handlers=[
-            logging.FileHandler(log_file, encoding='utf-8'),
+            file_handler,
             logging.StreamHandler()
-        ]
+        ],
+        force=True
     )
     
-    logging.info(f"Логирование настроено. Файл: {log_file}")
+    logging.info(f"Логирование настроено. Файл: {file_handler.baseFilename}")
+    
+    # Разбираем логи, накопившиеся до перезапуска
+    if worker_id is None:
+        file_handler.start_cleanup()
+
+
+class DailyRotatingFileHandler(logging.handlers.BaseRotatingHandler):
+    """
+    Лог в файл <prefix>_<дата>.log с переключением на новую дату в полночь.
+    
+    При превышении max_bytes текущий файл переименовывается в
+    <prefix>_<дата>.<N>.log и запись продолжается в новый файл. После каждой
+    ротации в фоне запускается cleanup_old_logs (сжатие и удаление старых файлов).
+    """
+    
+    def __init__(self, logs_dir: str, prefix: str = 'app', max_bytes: int = 0, retention_days: int = 30, compress_after_days: int = 1):
+        self.logs_dir = logs_dir
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.retention_days = retention_days
+        self.compress_after_days = compress_after_days
+        self.current_date = self._current_date()
+        super().__init__(self._path_for(self.current_date), 'a', encoding='utf-8', delay=True)
+    
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        """Нужна ли ротация: сменилась дата или файл превысил max_bytes."""
+        if self._current_date() != self.current_date:
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            if self.stream.tell() >= self.max_bytes:
+                return True
+        return False
+    
+    def doRollover(self) -> None:
+        """Переключиться на новый файл."""
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        
+        today = self._current_date()
+        if today == self.current_date and os.path.exists(self.baseFilename):
+            # Превышен размер - сохраняем текущий файл как очередную часть дня
+            part = 1
+            while os.path.exists(self._path_for(today, part)):
+                part += 1
+            os.rename(self.baseFilename, self._path_for(today, part))
+        
+        self.current_date = today
+        self.baseFilename = self._path_for(today)
+        self.stream = self._open()
+        self.start_cleanup()
+    
+    def start_cleanup(self) -> None:
+        """Запустить сжатие и удаление старых логов в фоновом потоке."""
+        threading.Thread(
+            target=cleanup_old_logs,
+            args=(self.logs_dir, self.retention_days, self.compress_after_days),
+            name="log-cleanup",
+            daemon=True
+        ).start()
+    
+    def _current_date(self) -> str:
+        """Текущая дата для имени файла."""
+        return _today()
+    
+    def _path_for(self, day: str, part: int = 0) -> str:
+        """Путь к файлу лога за день (part > 0 - часть после ротации по размеру)."""
+        suffix = f'.{part}' if part else ''
+        return os.path.join(self.logs_dir, f'{self.prefix}_{day}{suffix}.log')
+
+
+# Файлы в logs/, которые подлежат сжатию и удалению: <тип>[-w<воркер>]_<дата>[.<часть>].<log|json>[.gz]
+LOG_FILE_PATTERN = re.compile(
+    r'^(app|conversations|llm_requests|errors)(?:-w\d+)?_(\d{4}-\d{2}-\d{2})(\.\d+)?\.(log|json)(\.gz)?$'
+)
 
+# Не сжимаем файлы, в которые писали совсем недавно (их еще может дописывать фоновая запись)
+_COMPRESS_MIN_IDLE_SECONDS = 60
 
-def log_conversation(user_id: int, username: Optional[str], user_message: str, bot_response: str, response_time_ms: Optional[int] = None) -> None:
+
+def cleanup_old_logs(logs_dir: str, retention_days: int = 30, compress_after_days: int = 1) -> None:
+    """
+    Сжать в gzip и удалить старые файлы логов.
+    
+    Args:
+        logs_dir: Папка с логами
+        retention_days: Файлы старше этого числа дней удаляются (0 - не удалять)
+        compress_after_days: Файлы старше этого числа дней сжимаются (0 - не сжимать)
+    """
+    today = date.today()
+    try:
+        names = os.listdir(logs_dir)
+    except OSError as e:
+        logging.error(f"Не удалось прочитать папку логов {logs_dir}: {e}")
+        return
+    
+    for name in names:
+        match = LOG_FILE_PATTERN.match(name)
+        if not match:
+            continue
+        
+        path = os.path.join(logs_dir, name)
+        try:
+            age_days = (today - date.fromisoformat(match.group(2))).days
+            if retention_days and age_days > retention_days:
+                os.remove(path)
+                logging.info(f"Удален старый лог: {name}")
+            elif (compress_after_days and age_days >= compress_after_days and not match.group(5)
+                    and time.time() - os.path.getmtime(path) > _COMPRESS_MIN_IDLE_SECONDS):
+                _gzip_file(path)
+                logging.info(f"Сжат лог: {name}")
+        except Exception as e:
+            logging.error(f"Ошибка обработки старого лога {name}: {e}")
+
+
+def _gzip_file(path: str) -> None:
+    """Сжать файл в <path>.gz и удалить исходный."""
+    with open(path, 'rb') as src, gzip.open(path + '.gz', 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(path)
+
+
+def log_conversation(user_id: int, username: Optional[str], user_message: str, bot_response: str, response_time_ms: Optional[int] = None, intent: Optional[str] = None) -> None:
     """
     Логирование диалога пользователя в JSON файл.
     
@@ -50,29 +208,28 @@ def log_conversation(user_id: int, username: Optional[str], user_message: str, b
         user_message: Сообщение пользователя  
         bot_response: Ответ бота
         response_time_ms: Время ответа в миллисекундах
+        intent: Намерение, если ответ дан без LLM (intent_router)
     """
-    project_root = get_project_root()
-    logs_dir = os.path.join(project_root, 'logs')
-    today = date.today().strftime("%Y-%m-%d")
-    conversations_file = os.path.join(logs_dir, f'conversations_{today}.json')
-    
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "user_id": user_id,
         "username": username,
         "user_message": user_message,
         "bot_response": bot_response,
-        "response_time_ms": response_time_ms
+        "response_time_ms": response_time_ms,
+        "intent": intent
     }
     
-    try:
-        with open(conversations_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-    except Exception as e:
-        logging.error(f"Ошибка записи лога диалога: {e}")
+    _write_json_log('conversations', log_entry)
+    
+    metrics.messages_total.inc()
+    if intent is not None:
+        metrics.intent_answers_total.inc(intent)
+    if response_time_ms is not None:
+        metrics.response_seconds.observe(response_time_ms / 1000)
 
 
-def log_llm_request(user_id: int, model: str, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None, response_time_ms: Optional[int] = None, status: str = "success", error: Optional[str] = None) -> None:
+def log_llm_request(user_id: int, model: str, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None, response_time_ms: Optional[int] = None, status: str = "success", error: Optional[str] = None, cached_tokens: Optional[int] = None) -> None:
     """
     Логирование запроса к LLM в JSON файл.
     
@@ -84,12 +241,8 @@ def log_llm_request(user_id: int, model: str, prompt_tokens: Optional[int] = Non
         response_time_ms: Время ответа в миллисекундах
         status: Статус запроса (success/error)
         error: Текст ошибки если есть
+        cached_tokens: Сколько токенов промпта провайдер взял из кеша
     """
-    project_root = get_project_root()
-    logs_dir = os.path.join(project_root, 'logs')
-    today = date.today().strftime("%Y-%m-%d")
-    llm_requests_file = os.path.join(logs_dir, f'llm_requests_{today}.json')
-    
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "user_id": user_id,
@@ -97,16 +250,21 @@ def log_llm_request(user_id: int, model: str, prompt_tokens: Optional[int] = Non
         "prompt_tokens": prompt_tokens,
         "completion_tokens": completion_tokens,
         "total_tokens": (prompt_tokens or 0) + (completion_tokens or 0) if prompt_tokens and completion_tokens else None,
+        "cached_tokens": cached_tokens,
         "response_time_ms": response_time_ms,
         "status": status,
         "error": error
     }
     
-    try:
-        with open(llm_requests_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-    except Exception as e:
-        logging.error(f"Ошибка записи лога LLM запроса: {e}")
+    _write_json_log('llm_requests', log_entry)
+    
+    metrics.llm_requests_total.inc(model, status)
+    if prompt_tokens:
+        metrics.llm_tokens_total.inc(model, "prompt", amount=prompt_tokens)
+    if completion_tokens:
+        metrics.llm_tokens_total.inc(model, "completion", amount=completion_tokens)
+    if cached_tokens:
+        metrics.llm_tokens_total.inc(model, "cached", amount=cached_tokens)
 
 
 def log_error(error_type: str, error_message: str, user_id: Optional[int] = None, additional_data: Optional[dict] = None) -> None:
@@ -119,11 +277,6 @@ def log_error(error_type: str, error_message: str, user_id: Optional[int] = None
         user_id: ID пользователя если есть
         additional_data: Дополнительные данные
     """
-    project_root = get_project_root()
-    logs_dir = os.path.join(project_root, 'logs')
-    today = date.today().strftime("%Y-%m-%d")
-    errors_file = os.path.join(logs_dir, f'errors_{today}.json')
-    
     log_entry = {
         "timestamp": datetime.now().isoformat(),
         "error_type": error_type,
@@ -132,8 +285,164 @@ def log_error(error_type: str, error_message: str, user_id: Optional[int] = None
         "additional_data": additional_data or {}
     }
     
+    _write_json_log('errors', log_entry)
+
+
+class JsonLogWriter:
+    """
+    Фоновая запись JSON логов.
+    
+    Один поток держит открытыми файлы текущего дня и пишет записи пакетами:
+    сброс на диск раз в flush_interval секунд или при накоплении batch_size записей.
+    Если очередь переполнена, запись отбрасывается (log_entries_dropped_total):
+    писать файл из event loop нельзя - он открыт потоком, а диск тормозит ответы.
+    """
+    
+    def __init__(self, flush_interval: float = 1.0, batch_size: int = 200, max_queue_size: int = 10000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._queue: "queue.Queue[Optional[Tuple[str, str, dict]]]" = queue.Queue(maxsize=max_queue_size)
+        self._files: Dict[str, Tuple[str, TextIO]] = {}
+        # Очередь переполнена - предупреждение пишется один раз на серию потерь
+        self._dropping = False
+        self._thread = threading.Thread(target=self._run, name="json-log-writer", daemon=True)
+    
+    def start(self) -> None:
+        """Запустить поток записи."""
+        self._thread.start()
+    
+    def write(self, kind: str, entry: dict) -> bool:
+        """
+        Поставить запись в очередь.
+        
+        Returns:
+            False если очередь переполнена и запись отброшена
+        """
+        try:
+            self._queue.put_nowait((kind, _today(), entry))
+        except queue.Full:
+            metrics.log_entries_dropped_total.inc(kind)
+            if not self._dropping:
+                self._dropping = True
+                logging.warning(f"Очередь записи JSON логов переполнена, записи {kind} отбрасываются")
+            return False
+        self._dropping = False
+        return True
+    
+    def stop(self) -> None:
+        """Дописать все записи из очереди и закрыть файлы."""
+        self._queue.put(None)
+        self._thread.join()
+    
+    def _run(self) -> None:
+        """Цикл потока записи."""
+        stopping = False
+        while not stopping:
+            batch: List[Tuple[str, str, dict]] = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            
+            if batch:
+                self._write_batch(batch)
+        
+        for _, f in self._files.values():
+            f.close()
+        self._files.clear()
+    
+    def _write_batch(self, batch: List[Tuple[str, str, dict]]) -> None:
+        """Записать пакет записей и сбросить затронутые файлы на диск."""
+        touched = set()
+        for kind, day, entry in batch:
+            try:
+                f = self._get_file(kind, day)
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                touched.add(f)
+            except Exception as e:
+                logging.error(f"Ошибка записи JSON лога {kind}: {e}")
+        
+        for f in touched:
+            try:
+                f.flush()
+            except Exception as e:
+                logging.error(f"Ошибка сброса JSON лога на диск: {e}")
+    
+    def _get_file(self, kind: str, day: str) -> TextIO:
+        """Открытый файл лога для типа записи и дня (файл прошлого дня закрывается)."""
+        current = self._files.get(kind)
+        if current is not None and current[0] == day:
+            return current[1]
+        if current is not None:
+            current[1].close()
+        
+        f = open(_json_log_path(kind, day), 'a', encoding='utf-8')
+        self._files[kind] = (day, f)
+        return f
+
+
+# Фоновая запись JSON логов (None - пишем синхронно)
+_log_writer: Optional[JsonLogWriter] = None
+
+# Суффикс имен файлов логов процесса-воркера ('' в основном процессе)
+_worker_tag = ''
+
+
+def start_log_writer() -> None:
+    """Запустить фоновую запись JSON логов (вызывается в bot.main)."""
+    global _log_writer
+    if _log_writer is not None:
+        return
+    
+    logging_config = get_logging_config()
+    _log_writer = JsonLogWriter(
+        flush_interval=logging_config.get('writer_flush_interval_seconds', 1.0),
+        batch_size=logging_config.get('writer_batch_size', 200),
+        max_queue_size=logging_config.get('writer_max_queue_size', 10000)
+    )
+    _log_writer.start()
+    logging.info("Фоновая запись JSON логов запущена")
+
+
+def stop_log_writer() -> None:
+    """Остановить фоновую запись, дописав все накопленные записи."""
+    global _log_writer
+    if _log_writer is None:
+        return
+    
+    writer, _log_writer = _log_writer, None
+    writer.stop()
+    logging.info("Фоновая запись JSON логов остановлена")
+
+
+def _today() -> str:
+    """Текущая дата в формате имени файла лога."""
+    return date.today().strftime("%Y-%m-%d")
+
+
+def _json_log_path(kind: str, day: str) -> str:
+    """Путь к JSON логу заданного типа за день."""
+    return os.path.join(get_logs_dir(), f'{kind}{_worker_tag}_{day}.json')
+
+
+def _write_json_log(kind: str, log_entry: dict) -> None:
+    """Записать JSON запись: через фоновый поток или сразу, если он не запущен."""
+    writer = _log_writer
+    if writer is not None:
+        writer.write(kind, log_entry)
+        return
+    
     try:
-        with open(errors_file, 'a', encoding='utf-8') as f:
+        with open(_json_log_path(kind, _today()), 'a', encoding='utf-8') as f:
             f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
     except Exception as e:
-        logging.error(f"Ошибка записи лога ошибки: {e}")
\ No newline at end of file
+        logging.error(f"Ошибка записи JSON лога {kind}: {e}")
\ No newline at end of file
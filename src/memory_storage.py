@@ -0,0 +1,282 @@
+"""
+Постоянное хранение истории диалогов.
+Интерфейс хранилища и реализация на SQLite с отложенной пакетной записью.
+"""
+
+import itertools
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import get_project_root
+
+
+class MemoryStorage(ABC):
+    """
+    Интерфейс постоянного хранилища истории.
+
+    ConversationMemory держит горячую историю в памяти и обращается к
+    хранилищу только для записи и для загрузки истории "холодных" пользователей.
+    """
+
+    @abstractmethod
+    def load_history(self, user_id: int, limit: int) -> List[Dict[str, str]]:
+        """Загрузить последние limit сообщений пользователя (от старых к новым)."""
+
+    @abstractmethod
+    def append(self, user_id: int, role: str, content: str) -> None:
+        """Сохранить сообщение (не должно блокировать event loop)."""
+
+    @abstractmethod
+    def clear(self, user_id: int) -> None:
+        """Удалить историю пользователя."""
+
+    @abstractmethod
+    def load_summary(self, user_id: int) -> str:
+        """Загрузить краткое содержание ранней части диалога."""
+
+    @abstractmethod
+    def save_summary(self, user_id: int, summary: str, keep_last: int) -> None:
+        """Сохранить краткое содержание и оставить только keep_last последних сообщений."""
+
+    def close(self) -> None:
+        """Дописать отложенные изменения и закрыть хранилище."""
+
+
+class SQLiteStorage(MemoryStorage):
+    """
+    История в SQLite (WAL) с фоновым потоком записи.
+
+    append/clear/save_summary только кладут операцию в очередь. Поток записи
+    собирает операции в пакеты (до batch_size штук или flush_interval секунд)
+    и применяет каждый пакет одной транзакцией - один fsync на пакет,
+    а не на сообщение.
+
+    Пока очистка истории стоит в очереди, загрузка истории и краткого
+    содержания этого пользователя возвращает пустой результат - иначе
+    старые строки успели бы вернуться в память до удаления.
+    """
+
+    def __init__(self, path: str, max_messages_per_user: int = 20, batch_size: int = 100, flush_interval: float = 0.5):
+        self.path = path
+        self.max_messages_per_user = max_messages_per_user
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # Соединение для чтения используется из потока event loop,
+        # у потока записи свое соединение (WAL позволяет читать во время записи)
+        self._read_conn = self._connect()
+        self._init_schema(self._read_conn)
+        max_seq = self._read_conn.execute("SELECT COALESCE(MAX(seq), 0) FROM messages").fetchone()[0]
+        self._seq = itertools.count(max_seq + 1)
+
+        # user_id -> число еще не примененных очисток
+        self._pending_clears: Dict[int, int] = {}
+        self._pending_lock = threading.Lock()
+
+        self._queue: "queue.Queue[Optional[Tuple[Any, ...]]]" = queue.Queue()
+        self._writer = threading.Thread(target=self._write_loop, name="sqlite-memory-writer", daemon=True)
+        self._writer.start()
+
+        logging.info(f"SQLite хранилище истории открыто: {path}")
+
+    def load_history(self, user_id: int, limit: int) -> List[Dict[str, str]]:
+        """Загрузить последние сообщения по индексу (user_id, seq)."""
+        if self._clear_pending(user_id):
+            return []
+        rows = self._read_conn.execute(
+            "SELECT role, content FROM messages WHERE user_id = ? ORDER BY seq DESC LIMIT ?",
+            (user_id, limit)
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def append(self, user_id: int, role: str, content: str) -> None:
+        """Поставить сообщение в очередь на запись."""
+        self._queue.put(("add", user_id, next(self._seq), role, content, time.time()))
+
+    def clear(self, user_id: int) -> None:
+        """Поставить удаление истории в очередь на запись."""
+        with self._pending_lock:
+            self._pending_clears[user_id] = self._pending_clears.get(user_id, 0) + 1
+        self._queue.put(("clear", user_id))
+
+    def load_summary(self, user_id: int) -> str:
+        """Загрузить краткое содержание по первичному ключу."""
+        if self._clear_pending(user_id):
+            return ""
+        row = self._read_conn.execute("SELECT summary FROM summaries WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else ""
+
+    def save_summary(self, user_id: int, summary: str, keep_last: int) -> None:
+        """Поставить сохранение краткого содержания в очередь на запись."""
+        self._queue.put(("summary", user_id, summary, keep_last, time.time()))
+
+    def close(self) -> None:
+        """Дождаться записи всех операций из очереди и закрыть соединения."""
+        self._queue.put(None)
+        self._writer.join()
+        self._read_conn.close()
+        logging.info("SQLite хранилище истории закрыто")
+
+    def _clear_pending(self, user_id: int) -> bool:
+        """Очистка истории пользователя еще не записана в базу."""
+        with self._pending_lock:
+            return user_id in self._pending_clears
+
+    def _clears_applied(self, batch: List[Tuple[Any, ...]]) -> None:
+        """Снять отметки об очистках пакета (после транзакции)."""
+        with self._pending_lock:
+            for operation in batch:
+                if operation[0] == "clear":
+                    user_id = operation[1]
+                    self._pending_clears[user_id] -= 1
+                    if not self._pending_clears[user_id]:
+                        del self._pending_clears[user_id]
+
+    def _connect(self) -> sqlite3.Connection:
+        """Открыть соединение с настройками для WAL."""
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # В WAL режиме NORMAL безопасен и не делает fsync на каждую транзакцию
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_schema(self, conn: sqlite3.Connection) -> None:
+        """Создать таблицы истории и кратких содержаний, если их еще нет."""
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                user_id INTEGER NOT NULL,
+                seq INTEGER NOT NULL,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (user_id, seq)
+            ) WITHOUT ROWID
+            """
+        )
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS summaries (
+                user_id INTEGER PRIMARY KEY,
+                summary TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        conn.commit()
+
+    def _write_loop(self) -> None:
+        """Поток записи: собирает операции в пакеты и применяет их."""
+        conn = self._connect()
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size and batch[-1] is not None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            if batch[-1] is None:
+                stopping = True
+                batch.pop()
+
+            try:
+                self._apply_batch(conn, batch)
+            except Exception as e:
+                logging.error(f"Ошибка записи истории в SQLite ({len(batch)} операций): {e}")
+            finally:
+                self._clears_applied(batch)
+        conn.close()
+
+    def _apply_batch(self, conn: sqlite3.Connection, batch: List[Tuple[Any, ...]]) -> None:
+        """Применить пакет операций одной транзакцией."""
+        if not batch:
+            return
+
+        touched_users = set()
+        with conn:
+            for operation in batch:
+                if operation[0] == "add":
+                    _, user_id, seq, role, content, created_at = operation
+                    conn.execute(
+                        "INSERT INTO messages (user_id, seq, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                        (user_id, seq, role, content, created_at)
+                    )
+                    touched_users.add(user_id)
+                elif operation[0] == "clear":
+                    conn.execute("DELETE FROM messages WHERE user_id = ?", (operation[1],))
+                    conn.execute("DELETE FROM summaries WHERE user_id = ?", (operation[1],))
+                    touched_users.discard(operation[1])
+                elif operation[0] == "summary":
+                    _, user_id, summary, keep_last, updated_at = operation
+                    conn.execute(
+                        "INSERT OR REPLACE INTO summaries (user_id, summary, updated_at) VALUES (?, ?, ?)",
+                        (user_id, summary, updated_at)
+                    )
+                    # Сжатые сообщения больше не нужны - остаются только последние keep_last
+                    self._trim(conn, user_id, keep_last)
+
+            # Храним не больше max_messages_per_user последних сообщений
+            for user_id in touched_users:
+                self._trim(conn, user_id, self.max_messages_per_user)
+
+    def _trim(self, conn: sqlite3.Connection, user_id: int, keep_last: int) -> None:
+        """Удалить все сообщения пользователя, кроме keep_last последних."""
+        if keep_last <= 0:
+            conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            return
+        conn.execute(
+            """
+            DELETE FROM messages WHERE user_id = ? AND seq < (
+                SELECT MIN(seq) FROM (
+                    SELECT seq FROM messages WHERE user_id = ? ORDER BY seq DESC LIMIT ?
+                )
+            )
+            """,
+            (user_id, user_id, keep_last)
+        )
+
+
+def create_storage(memory_config: Dict[str, Any], shard: Optional[int] = None) -> Optional[MemoryStorage]:
+    """
+    Создать постоянное хранилище по секции memory из settings.yaml.
+
+    Args:
+        memory_config: Секция memory
+        shard: Номер воркера - у каждого свой файл SQLite (<имя>.shard<N>.db)
+
+    Returns:
+        Хранилище или None, если история хранится только в памяти
+    """
+    backend = memory_config.get('backend', 'memory')
+    if backend == 'memory':
+        return None
+    if backend == 'sqlite':
+        path = memory_config.get('sqlite_path', 'data/conversations.db')
+        if not os.path.isabs(path):
+            path = os.path.join(get_project_root(), path)
+        if shard is not None:
+            root, ext = os.path.splitext(path)
+            path = f"{root}.shard{shard}{ext}"
+        return SQLiteStorage(
+            path,
+            max_messages_per_user=memory_config.get('max_messages_per_user', 20),
+            batch_size=memory_config.get('write_batch_size', 100),
+            flush_interval=memory_config.get('write_flush_interval_seconds', 0.5)
+        )
+    raise ValueError(f"Неизвестный backend хранилища истории: {backend}")
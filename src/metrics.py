@@ -0,0 +1,314 @@
+"""
+Метрики процесса в текстовом формате Prometheus.
+
+Счетчики, гистограммы и показатели (gauge) хранятся в памяти процесса
+(registry) и отдаются по HTTP на /metrics локального сервера. Значения,
+которые и так есть в компонентах (запросы в работе, очередь, размер
+истории), не дублируются: показатель читает их функцией в момент
+запроса метрик.
+
+В режиме нескольких процессов у каждого воркера свой сервер метрик
+на порту port + 1 + номер воркера.
+"""
+
+import asyncio
+import logging
+import math
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+from config import get_section
+
+# Границы гистограмм времени (секунды): от кеша до долгих ответов LLM
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60)
+# Задержка event loop: все заметное начинается с единиц миллисекунд
+LOOP_LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5)
+
+# Content-Type текстового формата Prometheus
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_value(value: float) -> str:
+    """Число в формате Prometheus."""
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    """Экранирование значения метки."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    """Общее для всех метрик: имя, описание и метки."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels: Sequence[str]) -> LabelValues:
+        """Значения меток в виде ключа (проверяется их число)."""
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: ожидаются метки {self.labelnames}, получено {labels}")
+        return tuple(str(label) for label in labels)
+
+    def _labels_text(self, key: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        """Метки в виде {a="1",b="2"}."""
+        pairs = list(zip(self.labelnames, key))
+        if extra is not None:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self) -> Iterable[str]:
+        """Строки значений метрики."""
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        """Блок метрики: HELP, TYPE и значения."""
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(_Metric):
+    """Монотонно растущий счетчик."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Увеличить счетчик для значений меток."""
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        """Текущее значение счетчика."""
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterable[str]:
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{self._labels_text(key)} {_format_value(value)}"
+
+
+class Gauge(_Metric):
+    """Текущее значение: задается явно или читается функцией при запросе метрик."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        """Задать значение."""
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], *labels: str) -> None:
+        """Читать значение функцией в момент запроса метрик."""
+        self._functions[self._key(labels)] = function
+
+    def value(self, *labels: str) -> float:
+        """Текущее значение."""
+        key = self._key(labels)
+        function = self._functions.get(key)
+        return function() if function is not None else self._values.get(key, 0)
+
+    def samples(self) -> Iterable[str]:
+        for key in sorted(set(self._values) | set(self._functions)):
+            try:
+                value = self.value(*key)
+            except Exception as e:
+                logging.warning(f"Не удалось прочитать метрику {self.name}: {e}")
+                continue
+            yield f"{self.name}{self._labels_text(key)} {_format_value(value)}"
+
+
+class Histogram(_Metric):
+    """Распределение значений по корзинам (накопительно) с суммой и числом."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Метки -> (счетчики корзин, сумма, число)
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Учесть значение."""
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = ([0] * len(self.buckets), [0.0, 0])
+        counts, totals = state
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        totals[0] += value
+        totals[1] += 1
+
+    def count(self, *labels: str) -> int:
+        """Число учтенных значений."""
+        state = self._values.get(self._key(labels))
+        return state[1][1] if state else 0
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, totals) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f"{self.name}_bucket{self._labels_text(key, ('le', _format_value(bound)))} {cumulative}"
+            yield f"{self.name}_sum{self._labels_text(key)} {_format_value(totals[0])}"
+            yield f"{self.name}_count{self._labels_text(key)} {totals[1]}"
+
+
+class MetricsRegistry:
+    """Все метрики процесса."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Зарегистрировать счетчик."""
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        """Зарегистрировать показатель."""
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        """Зарегистрировать гистограмму."""
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """Все метрики в текстовом формате Prometheus."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _register(self, metric: _Metric) -> _Metric:
+        """Добавить метрику (имена уникальны)."""
+        if metric.name in self._metrics:
+            raise ValueError(f"Метрика {metric.name} уже зарегистрирована")
+        self._metrics[metric.name] = metric
+        return metric
+
+
+# Глобальный реестр метрик процесса
+registry = MetricsRegistry()
+
+# Обращения пользователей и запросы к LLM (по итогу, с учетом повторов)
+messages_total = registry.counter(
+    "bot_messages_total", "Обработанные сообщения пользователей")
+response_seconds = registry.histogram(
+    "bot_response_seconds", "Время от получения сообщения до ответа пользователю")
+intent_answers_total = registry.counter(
+    "intent_answers_total", "Ответы на типовые сообщения без LLM по намерению", ("intent",))
+llm_requests_total = registry.counter(
+    "llm_requests_total", "Запросы к LLM по итогу (success, cache_hit, error, rejected, summary)", ("model", "status"))
+llm_tokens_total = registry.counter(
+    "llm_tokens_total", "Токены LLM (prompt, completion, cached - часть prompt из кеша провайдера)", ("model", "kind"))
+
+# Отдельные попытки обращения к модели
+llm_attempts_total = registry.counter(
+    "llm_attempts_total", "Попытки запроса к модели по исходу (success, timeout, error, cancelled)", ("model", "outcome"))
+llm_latency_seconds = registry.histogram(
+    "llm_latency_seconds", "Задержка ответа модели (для потока - до первого фрагмента)", ("model",))
+llm_retries_total = registry.counter(
+    "llm_retries_total", "Повторные попытки запроса к LLM")
+
+# Текущее состояние (значения читаются из компонентов при запросе метрик)
+llm_in_flight = registry.gauge(
+    "llm_in_flight", "Выполняющиеся запросы к LLM")
+llm_queue_depth = registry.gauge(
+    "llm_queue_depth", "Запросы к LLM, ожидающие свободный слот")
+outbound_queue_messages = registry.gauge(
+    "outbound_queue_messages", "Сообщения в очереди отправки в Telegram")
+outbound_retry_after_total = registry.counter(
+    "outbound_retry_after_total", "Ответы Telegram RetryAfter при отправке сообщений")
+user_queue_messages = registry.gauge(
+    "user_queue_messages", "Сообщения в очередях пользователей")
+user_queue_active_users = registry.gauge(
+    "user_queue_active_users", "Пользователи с необработанными сообщениями")
+log_entries_dropped_total = registry.counter(
+    "log_entries_dropped_total", "JSON записи логов, отброшенные из-за переполненной очереди записи", ("kind",))
+conversation_users = registry.gauge(
+    "conversation_users", "Пользователи с историей диалога в памяти")
+conversation_bytes = registry.gauge(
+    "conversation_bytes", "Размер истории диалогов в памяти, байт")
+
+# Задержка event loop: насколько позже запланированного просыпается корутина
+event_loop_lag_seconds = registry.histogram(
+    "event_loop_lag_seconds", "Задержка event loop", buckets=LOOP_LAG_BUCKETS)
+event_loop_lag_last_seconds = registry.gauge(
+    "event_loop_lag_last_seconds", "Последний замер задержки event loop")
+time_to_ready_seconds = registry.gauge(
+    "time_to_ready_seconds", "Время от запуска процесса до готовности принимать сообщения")
+
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """Периодически замерять задержку event loop."""
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - started - interval)
+        event_loop_lag_seconds.observe(lag)
+        event_loop_lag_last_seconds.set(lag)
+
+
+def create_metrics_app() -> web.Application:
+    """aiohttp приложение с /metrics."""
+    app = web.Application()
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(body=registry.render().encode("utf-8"), headers={"Content-Type": CONTENT_TYPE})
+
+    app.router.add_get('/metrics', handle_metrics)
+    return app
+
+
+async def start_metrics_server(shard: Optional[int] = None) -> Optional[web.AppRunner]:
+    """
+    Запустить локальный сервер метрик по секции metrics (если включен).
+
+    Returns:
+        Runner для остановки или None, если сервер не запущен
+    """
+    metrics_config = get_section('metrics')
+    if not metrics_config.get('enabled', False):
+        return None
+
+    host = metrics_config.get('host', '127.0.0.1')
+    port = metrics_config.get('port', 9090)
+    if shard is not None:
+        port += 1 + shard
+
+    runner = web.AppRunner(create_metrics_app())
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host=host, port=port).start()
+    except OSError as e:
+        # Метрики не должны мешать работе бота
+        logging.error(f"Не удалось запустить сервер метрик на {host}:{port}: {e}")
+        await runner.cleanup()
+        return None
+    logging.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
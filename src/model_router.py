@@ -0,0 +1,250 @@
+"""
+Выбор модели LLM по задержке и доле ошибок.
+
+Модели задаются упорядоченным списком. Для каждой считаются скользящие
+p50/p95 задержки и доля ошибок по последним запросам (старые замеры
+устаревают через stats_ttl_seconds), у каждой свой circuit breaker.
+Запрос уходит в самую здоровую модель; опционально, если она не
+ответила за hedge_delay_seconds, параллельно запускается следующая
+модель и берется тот ответ, который пришел первым.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from openai import APITimeoutError
+
+import metrics
+from config import get_llm_config, get_section
+from retry_policy import CircuitBreaker, CircuitOpenError, create_circuit_breaker, is_retryable
+
+T = TypeVar("T")
+
+
+class ModelStats:
+    """Скользящее окно задержек и исходов запросов одной модели."""
+
+    __slots__ = ("latencies", "outcomes", "ttl")
+
+    def __init__(self, window_size: int, ttl: float):
+        # (время замера, задержка в секундах)
+        self.latencies: deque = deque(maxlen=window_size)
+        # (время замера, был ли сбой)
+        self.outcomes: deque = deque(maxlen=window_size)
+        self.ttl = ttl
+
+    def add_latency(self, seconds: float) -> None:
+        """Добавить замер задержки успешного запроса."""
+        self.latencies.append((time.monotonic(), seconds))
+
+    def add_outcome(self, failed: bool) -> None:
+        """Добавить исход запроса."""
+        self.outcomes.append((time.monotonic(), failed))
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Перцентиль задержки (0..1) по свежим замерам или None, если замеров нет."""
+        self._expire(self.latencies)
+        if not self.latencies:
+            return None
+        values = sorted(seconds for _, seconds in self.latencies)
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    @property
+    def samples(self) -> int:
+        """Число свежих исходов запросов."""
+        self._expire(self.outcomes)
+        return len(self.outcomes)
+
+    @property
+    def error_rate(self) -> float:
+        """Доля сбоев среди свежих исходов."""
+        self._expire(self.outcomes)
+        if not self.outcomes:
+            return 0.0
+        return sum(1 for _, failed in self.outcomes if failed) / len(self.outcomes)
+
+    def _expire(self, samples: deque) -> None:
+        """Отбросить устаревшие замеры."""
+        deadline = time.monotonic() - self.ttl
+        while samples and samples[0][0] < deadline:
+            samples.popleft()
+
+
+class ModelRouter:
+    """Упорядочивание моделей по здоровью и hedging медленных запросов."""
+
+    def __init__(self, models: List[str], window_size: int = 100, stats_ttl: float = 300, min_samples: int = 5,
+                 max_error_rate: float = 0.5, hedge_enabled: bool = False, hedge_delay: float = 3.0,
+                 breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+                 latency_margin: float = 0.2, latency_tolerance: float = 0.1):
+        self.models = list(models)
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        # p95 в пределах margin (доля) + tolerance (секунды) от лучшей - разница считается шумом
+        self.latency_margin = latency_margin
+        self.latency_tolerance = latency_tolerance
+        self.hedge_enabled = hedge_enabled
+        self.hedge_delay = hedge_delay
+        self.stats: Dict[str, ModelStats] = {model: ModelStats(window_size, stats_ttl) for model in self.models}
+        self.breakers: Dict[str, CircuitBreaker] = {model: breaker_factory() for model in self.models}
+
+    def candidates(self, avoid: Iterable[str] = ()) -> List[str]:
+        """
+        Модели от самой здоровой к наименее здоровой.
+
+        Модели с разомкнутым circuit breaker пропускаются. Порядок: сначала
+        не из avoid (уже подводили в этом запросе), затем с допустимой долей
+        ошибок, затем по p95 задержки; без замеров модель считается быстрой,
+        чтобы снова получить трафик и обновить статистику. Модели с близкой
+        p95 (см. latency_margin, latency_tolerance) идут в порядке из
+        настроек, чтобы шум в замерах не уводил трафик с приоритетной модели.
+        """
+        avoid = set(avoid)
+
+        def health(model: str) -> Tuple[bool, bool]:
+            stats = self.stats[model]
+            unhealthy = stats.samples >= self.min_samples and stats.error_rate >= self.max_error_rate
+            return model in avoid, unhealthy
+
+        def latency(model: str) -> float:
+            return self.stats[model].percentile(0.95) or 0.0
+
+        available = [(index, model) for index, model in enumerate(self.models) if self.breakers[model].is_available()]
+        ranked = sorted(available, key=lambda item: (health(item[1]), latency(item[1])))
+
+        # Группы моделей с близкой задержкой: внутри группы - по приоритету
+        ordered: List[str] = []
+        group: List[Tuple[int, str]] = []
+        for item in ranked:
+            if group:
+                leader = group[0][1]
+                if (health(item[1]) != health(leader)
+                        or latency(item[1]) > latency(leader) * (1 + self.latency_margin) + self.latency_tolerance):
+                    ordered.extend(model for _, model in sorted(group))
+                    group = []
+            group.append(item)
+        ordered.extend(model for _, model in sorted(group))
+        return ordered
+
+    def pick(self, avoid: Iterable[str] = ()) -> str:
+        """
+        Самая здоровая модель.
+
+        Raises:
+            CircuitOpenError: Все модели недоступны
+        """
+        models = self.candidates(avoid)
+        if not models:
+            raise CircuitOpenError("circuit_open")
+        return models[0]
+
+    def record_latency(self, model: str, seconds: float) -> None:
+        """Учесть задержку успешного ответа (для потока - до первого фрагмента)."""
+        self.stats[model].add_latency(seconds)
+        metrics.llm_latency_seconds.observe(seconds, model)
+
+    def record_result(self, model: str, error: Optional[BaseException] = None) -> None:
+        """Учесть исход запроса: сбой апстрима или успех."""
+        if error is None or is_retryable(error):
+            self.stats[model].add_outcome(error is not None)
+        self.breakers[model].record(error)
+        metrics.llm_attempts_total.inc(model, _outcome(error))
+
+    async def run(self, start: Callable[[str], Awaitable[T]], avoid: Iterable[str] = (), hedge: bool = True,
+                  discard: Optional[Callable[[T], Awaitable[None]]] = None) -> Tuple[T, str]:
+        """
+        Выполнить запрос на самой здоровой модели, при необходимости с hedging.
+
+        Args:
+            start: Запуск запроса к указанной модели
+            avoid: Модели, которые уже подвели в этом запросе
+            hedge: Разрешить параллельный запрос к следующей модели
+            discard: Освобождение результата проигравшего запроса (например, закрыть поток)
+
+        Returns:
+            Результат первого успешного запроса и модель, которая его дала
+
+        Raises:
+            CircuitOpenError: Все модели недоступны
+        """
+        models = self.candidates(avoid)
+        if not models:
+            raise CircuitOpenError("circuit_open")
+        if not (hedge and self.hedge_enabled and len(models) > 1):
+            return await start(models[0]), models[0]
+
+        backup = models[1]
+        tasks: Dict[asyncio.Task, str] = {asyncio.create_task(start(models[0])): models[0]}
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                timeout = self.hedge_delay if backup else None
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    logging.info(f"Модель {models[0]} не ответила за {self.hedge_delay}s, параллельный запрос к {backup}")
+                    tasks[asyncio.create_task(start(backup))] = backup
+                    backup = None
+                    continue
+                for task in done:
+                    model = tasks.pop(task)
+                    if task.exception() is None:
+                        return task.result(), model
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            for task in tasks:
+                try:
+                    result = await task
+                except BaseException:
+                    continue
+                # Проигравший запрос успел завершиться - освобождаем его результат
+                if discard is not None:
+                    await discard(result)
+
+    def get_stats(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """p50/p95, доля ошибок и состояние circuit breaker по моделям."""
+        return {
+            model: {
+                "p50": self.stats[model].percentile(0.5),
+                "p95": self.stats[model].percentile(0.95),
+                "error_rate": self.stats[model].error_rate,
+                "samples": self.stats[model].samples,
+                "circuit": self.breakers[model].state
+            }
+            for model in self.models
+        }
+
+
+def _outcome(error: Optional[BaseException]) -> str:
+    """Исход попытки для метрик."""
+    if error is None:
+        return "success"
+    if isinstance(error, asyncio.CancelledError):
+        # Проигравший в hedging или отмененный пользователем запрос
+        return "cancelled"
+    if isinstance(error, (asyncio.TimeoutError, APITimeoutError)):
+        return "timeout"
+    return "error"
+
+
+def create_model_router() -> ModelRouter:
+    """Создать роутер по секции model_router (по умолчанию одна модель llm.model)."""
+    router_config = get_section('model_router')
+    models = router_config.get('models') or [get_llm_config().get('model', 'google/gemini-2.0-flash-exp:free')]
+    return ModelRouter(
+        models,
+        window_size=router_config.get('window_size', 100),
+        stats_ttl=router_config.get('stats_ttl_seconds', 300),
+        min_samples=router_config.get('min_samples', 5),
+        max_error_rate=router_config.get('max_error_rate', 0.5),
+        hedge_enabled=router_config.get('hedge_enabled', False),
+        hedge_delay=router_config.get('hedge_delay_seconds', 3.0),
+        breaker_factory=create_circuit_breaker,
+        latency_margin=router_config.get('latency_margin', 0.2),
+        latency_tolerance=router_config.get('latency_tolerance_seconds', 0.1)
+    )
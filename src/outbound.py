@@ -0,0 +1,291 @@
+"""
+Очередь исходящих сообщений в Telegram.
+
+Обработчики не ждут отправки: ответ ставится в очередь чата, а
+отправка идет в фоне с соблюдением лимитов Telegram - общего на бота
+(около 30 сообщений в секунду) и на один чат (около 1 в секунду).
+Если Telegram все же просит подождать (RetryAfter), чат ставится на
+паузу и сообщение отправляется повторно; если RetryAfter приходит сразу
+в нескольких чатах, это общий лимит бота - на паузу ставится вся отправка.
+Редактирования сообщений (потоковые ответы) расходуют те же лимиты.
+Ответы длиннее 4096 символов разбиваются на части по абзацам, строкам,
+предложениям или словам.
+
+В режиме нескольких процессов у каждого воркера своя очередь, поэтому
+общий лимит делится между воркерами (configure_outbound).
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
+
+from aiogram.exceptions import TelegramRetryAfter
+
+import metrics
+from config import get_section
+from scheduler import TokenBucket
+
+# Максимальная длина текстового сообщения в Telegram (в единицах UTF-16)
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+# Границы для разбиения длинного ответа - от лучшей к худшей
+_SPLIT_SEPARATORS = ("\n\n", "\n", ". ", "! ", "? ", "; ", ", ", " ")
+
+# Сколько корзин чатов хранить, прежде чем удалять простаивающие
+_MAX_IDLE_BUCKETS = 1000
+
+
+def _utf16_length(text: str) -> int:
+    """Длина текста так, как ее считает Telegram (эмодзи и т.п. - две единицы)."""
+    return len(text) + sum(1 for char in text if ord(char) > 0xFFFF)
+
+
+def _utf16_prefix(text: str, limit: int) -> int:
+    """Число символов в начале text, умещающихся в limit единиц UTF-16."""
+    units = 0
+    for index, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > limit:
+            return index
+    return len(text)
+
+
+def split_message(text: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> List[str]:
+    """
+    Разбить текст на части не длиннее limit.
+
+    Часть обрезается по последней удобной границе во второй половине
+    окна (абзац, строка, предложение, слово); если границы нет -
+    ровно по лимиту.
+    """
+    parts = []
+    rest = text
+    while _utf16_length(rest) > limit:
+        end = _utf16_prefix(rest, limit)
+        window = rest[:end]
+        cut = max(end, 1)
+        for separator in _SPLIT_SEPARATORS:
+            position = window.rfind(separator)
+            if position >= end // 2:
+                cut = position + len(separator)
+                break
+        part = rest[:cut].rstrip()
+        if part:
+            parts.append(part)
+        rest = rest[cut:].lstrip("\n")
+    if rest.strip() or not parts:
+        parts.append(rest)
+    return parts
+
+
+class _Outgoing(NamedTuple):
+    """Сообщение в очереди чата."""
+
+    parts: List[str]
+    # Отправка одной части (например, message.answer)
+    send: Callable[[str], Awaitable[Any]]
+    # Результат: отправленные сообщения
+    future: asyncio.Future
+
+
+class _ChatState:
+    """Очередь и отправитель одного чата."""
+
+    __slots__ = ("queue", "bucket", "worker")
+
+    def __init__(self, bucket: TokenBucket):
+        self.queue: Deque[_Outgoing] = deque()
+        self.bucket = bucket
+        self.worker: Optional[asyncio.Task] = None
+
+
+class OutboundSender:
+    """Отправка сообщений по очередям чатов с ограничением скорости."""
+
+    def __init__(self, global_rate: float = 25, global_burst: float = 5, chat_rate: float = 1.0,
+                 chat_burst: float = 3, max_retries: int = 3):
+        self.configure(global_rate, global_burst, chat_rate, chat_burst, max_retries)
+        self._chats: Dict[int, _ChatState] = {}
+        # Последний RetryAfter: чат и время окончания паузы
+        self._last_flood: Tuple[Optional[int], float] = (None, 0.0)
+
+    def configure(self, global_rate: float, global_burst: float, chat_rate: float,
+                  chat_burst: float, max_retries: int) -> None:
+        """Задать лимиты (новые лимиты чатов действуют для новых корзин)."""
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_retries = max_retries
+
+    @property
+    def queued_messages(self) -> int:
+        """Число частей сообщений, ожидающих отправки."""
+        return sum(len(item.parts) for state in self._chats.values() for item in state.queue)
+
+    def send(self, chat_id: int, text: str, send: Callable[[str], Awaitable[Any]]) -> asyncio.Future:
+        """
+        Поставить сообщение в очередь чата (возвращается сразу).
+
+        Args:
+            chat_id: Чат - сообщения одного чата отправляются по порядку
+            text: Текст любой длины
+            send: Отправка одной части текста
+
+        Returns:
+            Future со списком отправленных сообщений; ждать его не обязательно,
+            ошибки отправки записываются в лог
+        """
+        future = asyncio.get_running_loop().create_future()
+        # Ошибка в непрочитанном future не должна давать предупреждение asyncio
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+
+        state = self._chat(chat_id)
+        state.queue.append(_Outgoing(split_message(text), send, future))
+        if state.worker is None:
+            state.worker = asyncio.create_task(self._run(chat_id, state))
+        return future
+
+    def answer(self, message: Any, text: str) -> asyncio.Future:
+        """Поставить в очередь ответ в чат сообщения message."""
+        return self.send(message.chat.id, text, message.answer)
+
+    async def throttle(self, chat_id: int) -> None:
+        """Дождаться лимитов чата и бота для запроса вне очереди (редактирование сообщения)."""
+        await self._chat(chat_id).bucket.acquire()
+        await self.global_bucket.acquire()
+
+    def pause(self, chat_id: int, seconds: float) -> None:
+        """
+        Учесть RetryAfter от Telegram.
+
+        Чат ставится на паузу. Если пауза пришла и другому чату, пока
+        предыдущая еще не кончилась, - ограничен весь бот, и на паузу
+        ставится общий лимит.
+        """
+        metrics.outbound_retry_after_total.inc()
+        now = time.monotonic()
+        self._chat(chat_id).bucket.block(seconds)
+        last_chat, last_until = self._last_flood
+        if last_chat is not None and last_chat != chat_id and now < last_until:
+            logging.warning(f"Telegram ограничил отправку в нескольких чатах, общая пауза {seconds}s")
+            self.global_bucket.block(seconds)
+        self._last_flood = (chat_id, now + seconds)
+
+    async def wait_sent(self, chat_id: int) -> bool:
+        """
+        Дождаться отправки сообщений, уже стоящих в очереди чата.
+
+        Returns:
+            True если все они доставлены (False - ошибка или отмена)
+        """
+        state = self._chats.get(chat_id)
+        futures = [item.future for item in state.queue] if state is not None else []
+        if not futures:
+            return True
+        # asyncio.wait, в отличие от gather, не отменяет отправку, если отменят нас
+        await asyncio.wait(futures)
+        return all(not future.cancelled() and future.exception() is None for future in futures)
+
+    async def close(self, timeout: float = 10) -> int:
+        """
+        Дождаться отправки очередей (не дольше timeout), остальное отменить.
+
+        Returns:
+            Число отмененных, так и не отправленных сообщений
+        """
+        workers = [state.worker for state in self._chats.values() if state.worker is not None]
+        if not workers:
+            return 0
+        _, still_running = await asyncio.wait(workers, timeout=timeout)
+        cancelled = sum(len(state.queue) for state in self._chats.values() if state.worker in still_running)
+        for worker in still_running:
+            worker.cancel()
+        await asyncio.gather(*still_running, return_exceptions=True)
+        if cancelled:
+            logging.warning(f"Не отправлено при остановке: {cancelled} сообщений")
+        return cancelled
+
+    async def _run(self, chat_id: int, state: _ChatState) -> None:
+        """Отправитель очереди одного чата."""
+        try:
+            while state.queue:
+                item = state.queue[0]
+                try:
+                    sent = []
+                    for part in item.parts:
+                        sent.append(await self._send_part(chat_id, state.bucket, part, item.send))
+                    if not item.future.done():
+                        item.future.set_result(sent)
+                except asyncio.CancelledError:
+                    item.future.cancel()
+                    raise
+                except Exception as e:
+                    logging.error(f"Ошибка отправки сообщения в чат {chat_id}: {e}")
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                finally:
+                    state.queue.popleft()
+        finally:
+            for item in state.queue:
+                item.future.cancel()
+            state.queue.clear()
+            state.worker = None
+
+    async def _send_part(self, chat_id: int, bucket: TokenBucket, part: str,
+                         send: Callable[[str], Awaitable[Any]]) -> Any:
+        """Отправить часть сообщения в пределах лимитов, повторяя после RetryAfter."""
+        attempt = 0
+        while True:
+            # Сначала лимит чата, затем общий - чтобы не занимать общий токен на время ожидания чата
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                return await send(part)
+            except TelegramRetryAfter as e:
+                attempt += 1
+                self.pause(chat_id, e.retry_after)
+                if attempt > self.max_retries:
+                    raise
+                logging.warning(f"Telegram ограничил отправку в чат {chat_id}, пауза {e.retry_after}s")
+
+    def _chat(self, chat_id: int) -> _ChatState:
+        """Очередь и лимит чата (создаются при первом обращении)."""
+        state = self._chats.get(chat_id)
+        if state is None:
+            self._prune_idle()
+            state = _ChatState(TokenBucket(self.chat_rate, self.chat_burst))
+            self._chats[chat_id] = state
+        return state
+
+    def _prune_idle(self) -> None:
+        """Удалить корзины чатов без очереди, у которых лимит уже восстановился."""
+        if len(self._chats) <= _MAX_IDLE_BUCKETS:
+            return
+        for chat_id in [chat_id for chat_id, state in self._chats.items()
+                        if state.worker is None and not state.queue and state.bucket.is_full]:
+            del self._chats[chat_id]
+
+
+# Глобальный экземпляр очереди исходящих сообщений
+outbound_sender = OutboundSender()
+
+
+def configure_outbound(workers: int = 1) -> None:
+    """
+    Применить лимиты из секции outbound settings.yaml.
+
+    Args:
+        workers: Число процессов-воркеров - общий лимит бота делится между ними,
+            каждый воркер получает свою долю
+    """
+    outbound_config = get_section('outbound')
+    workers = max(workers, 1)
+    outbound_sender.configure(
+        global_rate=outbound_config.get('global_rate', 25) / workers,
+        global_burst=max(outbound_config.get('global_burst', 5) / workers, 1),
+        chat_rate=outbound_config.get('chat_rate', 1.0),
+        chat_burst=outbound_config.get('chat_burst', 3),
+        max_retries=outbound_config.get('max_retries', 3)
+    )
@@ -0,0 +1,255 @@
+"""
+Кеш ответов LLM для повторяющихся вопросов.
+
+Ключ кеша - модель, хеш всего контекста перед вопросом (системный промпт,
+краткое содержание, история) и сам вопрос. Поиск идет по слоям:
+точное совпадение текста, совпадение нормализованного текста и
+(опционально) близость по символьным триграммам через локальный
+инвертированный индекс.
+
+Слой semantic - это похожесть написания, а не смысла: "можно ли" и
+"нельзя ли" или вопросы, различающиеся одной цифрой, для триграмм почти
+одинаковы. Поэтому похожий вопрос засчитывается, только если числа и
+слова-отрицания в нем те же, что в сохраненном.
+"""
+
+import hashlib
+import json
+import math
+import re
+import time
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from config import get_section
+
+# Заменитель имени клиента в сохраненном ответе
+_NAME_PLACEHOLDER = "\x00name\x00"
+
+# Имя для клиентов без first_name - обычное слово, его не подменяем
+DEFAULT_USER_NAME = "клиент"
+
+# Более короткие имена легко спутать с обычными словами
+_MIN_NAME_LENGTH = 3
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+# Слова, меняющие смысл вопроса на противоположный
+_NEGATIONS = frozenset(("не", "нет", "ни", "нельзя", "без"))
+
+
+def normalize_text(text: str) -> str:
+    """Нормализовать вопрос: регистр, ё, пунктуация и лишние пробелы."""
+    return _NON_WORD.sub(" ", text.lower().replace("ё", "е")).strip()
+
+
+def _meaning_tokens(normalized: str) -> Tuple[Tuple[str, ...], frozenset]:
+    """Числа и отрицания вопроса - они должны совпасть у похожих вопросов."""
+    words = normalized.split()
+    numbers = tuple(word for word in words if any(char.isdigit() for char in word))
+    return numbers, frozenset(word for word in words if word in _NEGATIONS)
+
+
+def context_hash(model: str, context: List[Dict[str, str]]) -> str:
+    """Хеш модели и всех сообщений контекста перед вопросом."""
+    payload = json.dumps([model, context], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def char_trigrams(text: str) -> Counter:
+    """Символьные триграммы нормализованного текста (с границами слов)."""
+    padded = f"  {text} "
+    return Counter(padded[i:i + 3] for i in range(len(padded) - 2))
+
+
+class _CacheEntry:
+    """Запись кеша."""
+
+    __slots__ = ("response", "text", "source", "created_at", "trigrams", "norm")
+
+    def __init__(self, response: str, text: str, trigrams: Optional[Counter], source: Optional[str] = None):
+        self.response = response
+        self.text = text
+        # Модель, давшая ответ (при нескольких моделях может отличаться от model ключа)
+        self.source = source
+        self.created_at = time.monotonic()
+        self.trigrams = trigrams
+        self.norm = math.sqrt(sum(v * v for v in trigrams.values())) if trigrams else 0.0
+
+
+class ResponseCache:
+    """Кеш ответов с TTL, LRU вытеснением и счетчиками попаданий."""
+
+    def __init__(self, max_entries: int = 5000, ttl_seconds: float = 3600, semantic_enabled: bool = False,
+                 semantic_threshold: float = 0.85, semantic_max_candidates: int = 50):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_enabled = semantic_enabled
+        self.semantic_threshold = semantic_threshold
+        self.semantic_max_candidates = semantic_max_candidates
+
+        # (хеш контекста, нормализованный вопрос) -> запись, порядок LRU
+        self._entries: "OrderedDict[Tuple[str, str], _CacheEntry]" = OrderedDict()
+        # Инвертированный индекс триграмм: (хеш контекста, триграмма) -> ключи записей
+        self._index: Dict[Tuple[str, str], Set[Tuple[str, str]]] = defaultdict(set)
+
+        self.stats = {"hits_exact": 0, "hits_normalized": 0, "hits_semantic": 0, "misses": 0, "evictions": 0}
+
+    def get(self, model: str, context: List[Dict[str, str]], question: str, user_name: Optional[str] = None) -> Optional[str]:
+        """
+        Найти ответ в кеше.
+
+        Args:
+            model: Модель LLM
+            context: Сообщения перед вопросом (системный промпт, история)
+            question: Вопрос пользователя без служебных префиксов
+            user_name: Имя клиента для подстановки в ответ
+
+        Returns:
+            Ответ или None при промахе
+        """
+        found = self.get_with_source(model, context, question, user_name)
+        return found[0] if found is not None else None
+
+    def get_with_source(self, model: str, context: List[Dict[str, str]], question: str,
+                        user_name: Optional[str] = None) -> Optional[Tuple[str, Optional[str]]]:
+        """Найти ответ в кеше вместе с моделью, которая его дала (см. get)."""
+        ctx = context_hash(model, context)
+        normalized = normalize_text(question)
+        key = (ctx, normalized)
+
+        entry = self._get_live(key)
+        if entry is not None:
+            self.stats["hits_exact" if entry.text == question else "hits_normalized"] += 1
+            return self._render(entry.response, user_name), entry.source
+
+        if self.semantic_enabled and normalized:
+            entry = self._search_similar(ctx, normalized)
+            if entry is not None:
+                self.stats["hits_semantic"] += 1
+                return self._render(entry.response, user_name), entry.source
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, model: str, context: List[Dict[str, str]], question: str, response: str, user_name: Optional[str] = None,
+            source: Optional[str] = None) -> None:
+        """Сохранить ответ (обращение по имени заменяется заменителем, см. _mask_name); source - модель, давшая ответ."""
+        normalized = normalize_text(question)
+        if not normalized or not response:
+            return
+
+        ctx = context_hash(model, context)
+        key = (ctx, normalized)
+        if key in self._entries:
+            self._remove(key)
+
+        response = _mask_name(response, user_name)
+        if response is None:
+            return
+
+        trigrams = char_trigrams(normalized) if self.semantic_enabled else None
+        self._entries[key] = _CacheEntry(response, question, trigrams, source)
+        if trigrams:
+            for trigram in trigrams:
+                self._index[(ctx, trigram)].add(key)
+
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.stats["evictions"] += 1
+
+    def get_stats(self) -> Dict[str, float]:
+        """Счетчики попаданий/промахов и размер кеша."""
+        hits = self.stats["hits_exact"] + self.stats["hits_normalized"] + self.stats["hits_semantic"]
+        total = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self._entries),
+            "hit_rate": hits / total if total else 0.0
+        }
+
+    def _get_live(self, key: Tuple[str, str]) -> Optional[_CacheEntry]:
+        """Запись по ключу с проверкой TTL (обновляет позицию LRU)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.monotonic() - entry.created_at > self.ttl_seconds:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _search_similar(self, ctx: str, normalized: str) -> Optional[_CacheEntry]:
+        """Найти самый похожий вопрос в том же контексте по косинусу триграмм."""
+        query = char_trigrams(normalized)
+        overlap: Counter = Counter()
+        for trigram in query:
+            for key in self._index.get((ctx, trigram), ()):
+                overlap[key] += 1
+
+        query_norm = math.sqrt(sum(v * v for v in query.values()))
+        query_meaning = _meaning_tokens(normalized)
+        best_key, best_score = None, self.semantic_threshold
+        for key, _ in overlap.most_common(self.semantic_max_candidates):
+            if _meaning_tokens(key[1]) != query_meaning:
+                continue
+            entry = self._entries[key]
+            dot = sum(count * entry.trigrams.get(trigram, 0) for trigram, count in query.items())
+            score = dot / (query_norm * entry.norm)
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        return self._get_live(best_key) if best_key is not None else None
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        """Удалить запись и ее триграммы из индекса."""
+        entry = self._entries.pop(key)
+        if entry.trigrams:
+            for trigram in entry.trigrams:
+                keys = self._index.get((key[0], trigram))
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self._index[(key[0], trigram)]
+
+    @staticmethod
+    def _render(response: str, user_name: Optional[str]) -> str:
+        """Подставить имя текущего клиента в сохраненный ответ."""
+        return response.replace(_NAME_PLACEHOLDER, user_name or "")
+
+
+def _mask_name(response: str, user_name: Optional[str]) -> Optional[str]:
+    """
+    Заменить обращение к клиенту по имени заменителем.
+
+    Подменяется только имя в позиции обращения - в начале ответа или перед
+    запятой/восклицательным знаком ("Здравствуйте, Иван!"). Если имя
+    осталось в тексте где-то еще, ответ нельзя отдавать другому клиенту.
+
+    Returns:
+        Ответ для кеша или None, если кешировать его нельзя
+    """
+    if not user_name or user_name == DEFAULT_USER_NAME:
+        return response
+    name = re.escape(user_name)
+    if len(user_name) >= _MIN_NAME_LENGTH:
+        response = re.sub(rf"^{name}(?!\w)|(?<!\w){name}(?=\s*[,!])", _NAME_PLACEHOLDER, response)
+    if re.search(rf"(?<!\w){name}(?!\w)", response):
+        return None
+    return response
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Создать кеш ответов по секции response_cache (None если выключен)."""
+    cache_config = get_section('response_cache')
+    if not cache_config.get('enabled', False):
+        return None
+
+    semantic_config = cache_config.get('semantic') or {}
+    return ResponseCache(
+        max_entries=cache_config.get('max_entries', 5000),
+        ttl_seconds=cache_config.get('ttl_seconds', 3600),
+        semantic_enabled=semantic_config.get('enabled', False),
+        semantic_threshold=semantic_config.get('threshold', 0.85),
+        semantic_max_candidates=semantic_config.get('max_candidates', 50)
+    )
@@ -0,0 +1,167 @@
+"""
+Политика повторов и circuit breaker для запросов к OpenRouter.
+
+Ошибки делятся на повторяемые (таймаут, обрыв соединения, 429, 5xx) и
+нет (4xx: неверный запрос, ключ, модель) - их повторять бессмысленно.
+Пауза между попытками растет экспоненциально со случайным разбросом
+(full jitter), чтобы повторы многих пользователей не приходили волной;
+Retry-After от сервера имеет приоритет.
+
+Circuit breaker считает подряд идущие сбои апстрима. После
+failure_threshold сбоев он "размыкается", и запросы сразу получают
+ошибку, не дожидаясь таймаутов. Через recovery_timeout один пробный
+запрос проверяет, восстановился ли сервис.
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Optional
+
+from openai import APIConnectionError, APIStatusError
+
+from config import get_llm_config, get_section
+
+# HTTP статусы, при которых запрос имеет смысл повторить
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: апстрим считается недоступным."""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Повторяемая ли ошибка (сбой апстрима, а не ошибка в запросе)."""
+    if isinstance(error, (asyncio.TimeoutError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES
+    return False
+
+
+def get_retry_after(error: BaseException) -> Optional[float]:
+    """Пауза из заголовка Retry-After (в секундах), если сервер ее указал."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # Формат HTTP-даты OpenRouter не использует
+        return None
+
+
+class RetryPolicy:
+    """Экспоненциальная пауза с jitter и учетом Retry-After."""
+
+    def __init__(self, base_delay: float = 1.0, max_delay: float = 10.0, max_retry_after: float = 30.0):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def get_delay(self, error: BaseException, attempt: int) -> Optional[float]:
+        """
+        Пауза перед следующей попыткой.
+
+        Args:
+            error: Ошибка текущей попытки
+            attempt: Номер текущей попытки (с нуля)
+
+        Returns:
+            Пауза в секундах или None, если повторять не нужно
+        """
+        if not is_retryable(error):
+            return None
+
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            # Ждать дольше, чем пользователь готов, нет смысла
+            return retry_after if retry_after <= self.max_retry_after else None
+
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+
+class CircuitBreaker:
+    """Circuit breaker: closed -> open после серии сбоев -> half_open -> closed."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def is_available(self) -> bool:
+        """Можно ли сейчас отправить запрос (без изменения состояния)."""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at >= self.recovery_timeout
+        if self.state == self.HALF_OPEN:
+            return not self._probe_in_flight
+        return True
+
+    def before_call(self) -> None:
+        """
+        Проверить, можно ли отправлять запрос.
+
+        Raises:
+            CircuitOpenError: Апстрим недоступен (или уже идет пробный запрос)
+        """
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                raise CircuitOpenError("circuit_open")
+            self.state = self.HALF_OPEN
+            logging.info("Circuit breaker: пробный запрос к LLM")
+
+        if self.state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError("circuit_open")
+            self._probe_in_flight = True
+
+    def record(self, error: Optional[BaseException] = None) -> None:
+        """Учесть результат запроса: None - успех, повторяемая ошибка - сбой апстрима."""
+        self._probe_in_flight = False
+        if error is None:
+            if self.state != self.CLOSED:
+                logging.info("Circuit breaker: LLM снова доступен")
+            self.state = self.CLOSED
+            self.failures = 0
+            return
+
+        if not is_retryable(error):
+            # Ошибка в запросе или отмена ничего не говорит о здоровье апстрима
+            return
+
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logging.error(f"Circuit breaker: LLM недоступен после {self.failures} сбоев, пауза {self.recovery_timeout}s")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+
+def create_retry_policy() -> RetryPolicy:
+    """Создать политику повторов по секции llm."""
+    llm_config = get_llm_config()
+    return RetryPolicy(
+        base_delay=llm_config.get('retry_delay_seconds', 1),
+        max_delay=llm_config.get('retry_max_delay_seconds', 10),
+        max_retry_after=llm_config.get('retry_after_max_seconds', 30)
+    )
+
+
+def create_circuit_breaker() -> CircuitBreaker:
+    """Создать circuit breaker по секции circuit_breaker."""
+    breaker_config = get_section('circuit_breaker')
+    return CircuitBreaker(
+        failure_threshold=breaker_config.get('failure_threshold', 5),
+        recovery_timeout=breaker_config.get('recovery_timeout_seconds', 30)
+    )
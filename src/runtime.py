@@ -0,0 +1,190 @@
+"""
+Сборка и остановка компонентов бота в одном процессе.
+
+Используется и основным процессом (polling/webhook), и каждым
+процессом-воркером в режиме нескольких процессов.
+"""
+
+import asyncio
+import logging
+import signal
+import time
+from functools import partial
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiohttp import web
+
+import metrics
+
+from config import config_store, get_section
+from conversation_memory import conversation_memory
+from handlers import setup_handlers, process_user_batch
+from intent_router import IntentRouter, create_intent_router
+from llm_client import LLMClient, create_llm_client
+from logger import start_log_writer, stop_log_writer
+from outbound import configure_outbound, outbound_sender
+from user_dispatcher import UserDispatcher, create_user_dispatcher
+
+
+class BotRuntime:
+    """Бот, LLM клиент, очередь сообщений и диспетчер одного процесса."""
+
+    def __init__(self, bot_token: str, shard: Optional[int] = None):
+        self.bot_token = bot_token
+        # Номер воркера: у каждого свой файл истории диалогов
+        self.shard = shard
+        self.bot: Optional[Bot] = None
+        self.dp: Optional[Dispatcher] = None
+        self.llm_client: Optional[LLMClient] = None
+        self.user_dispatcher: Optional[UserDispatcher] = None
+        self.intent_router: Optional[IntentRouter] = None
+        self._config_watcher: Optional[asyncio.Task] = None
+        self._loop_lag_monitor: Optional[asyncio.Task] = None
+        self._knowledge_watcher: Optional[asyncio.Task] = None
+        self._metrics_runner: Optional[web.AppRunner] = None
+
+    async def start(self) -> None:
+        """Загрузить конфигурацию и создать компоненты бота."""
+        # Читаем конфигурацию и промпты один раз (если еще не прочитаны при настройке логов);
+        # дальше - только при изменении файлов или по SIGHUP
+        config_store.reload_if_changed()
+        config_store.install_sighup_handler()
+        reload_interval = get_section('config_reload').get('check_interval_seconds', 5)
+        self._config_watcher = asyncio.create_task(config_store.watch(reload_interval))
+
+        # Запись JSON логов диалогов/запросов в фоновом потоке
+        start_log_writer()
+
+        # Лимиты очереди исходящих сообщений (общий лимит бота делится между воркерами)
+        configure_outbound(get_section('workers').get('count', 1) if self.shard is not None else 1)
+
+        # Подключаем постоянное хранилище истории диалогов (если включено)
+        conversation_memory.open_storage(self.shard)
+
+        # Создаем бота, общий LLM клиент, очередь сообщений пользователей и диспетчер.
+        # llm_client и user_dispatcher попадают в обработчики как именованные аргументы.
+        self.bot = Bot(token=self.bot_token)
+        self.llm_client = create_llm_client()
+        # Ответы на типовые сообщения без LLM (None если выключено) - тоже через очередь
+        # пользователя, чтобы не обгонять ответы на предыдущие сообщения
+        self.intent_router = create_intent_router()
+        self.user_dispatcher = create_user_dispatcher(
+            partial(process_user_batch, llm_client=self.llm_client, intent_router=self.intent_router))
+        self.dp = Dispatcher(llm_client=self.llm_client, user_dispatcher=self.user_dispatcher)
+        
+        # Переиндексация базы знаний при изменении файлов
+        if self.llm_client.knowledge_base is not None:
+            kb_interval = get_section('knowledge_base').get('check_interval_seconds', 10)
+            self._knowledge_watcher = asyncio.create_task(self.llm_client.knowledge_base.watch(kb_interval))
+
+        # Настраиваем обработчики
+        setup_handlers(self.dp)
+        
+        await self._start_metrics()
+    
+    async def warm_up(self) -> None:
+        """
+        Открыть соединения с Telegram и OpenRouter до приема обновлений.
+        
+        Первые сообщения после перезапуска не платят за DNS, TLS и ленивое
+        создание клиентов. Ошибки прогрева не мешают запуску.
+        """
+        warmup_config = get_section('warmup')
+        if not warmup_config.get('enabled', True):
+            return
+        timeout = warmup_config.get('timeout_seconds', 10)
+        started = time.monotonic()
+        await asyncio.gather(warm_up_bot(self.bot, timeout), self.llm_client.warm_up(timeout))
+        logging.info(f"Соединения прогреты за {time.monotonic() - started:.2f}s")
+
+    async def _start_metrics(self) -> None:
+        """Подключить показатели компонентов к метрикам и запустить сервер /metrics."""
+        metrics.llm_in_flight.set_function(lambda: self.llm_client.in_flight)
+        metrics.llm_queue_depth.set_function(lambda: self.llm_client.waiting)
+        metrics.user_queue_messages.set_function(lambda: self.user_dispatcher.queued_messages)
+        metrics.outbound_queue_messages.set_function(lambda: outbound_sender.queued_messages)
+        metrics.user_queue_active_users.set_function(lambda: self.user_dispatcher.active_users)
+        metrics.conversation_users.set_function(lambda: conversation_memory.total_users)
+        metrics.conversation_bytes.set_function(lambda: conversation_memory.total_bytes)
+        
+        interval = get_section('metrics').get('loop_lag_interval_seconds', 0.5)
+        self._loop_lag_monitor = asyncio.create_task(metrics.monitor_event_loop_lag(interval))
+        self._metrics_runner = await metrics.start_metrics_server(self.shard)
+
+    async def stop(self) -> None:
+        """Дообработать принятые сообщения и закрыть все ресурсы."""
+        if self._config_watcher is not None:
+            self._config_watcher.cancel()
+        for task in (self._loop_lag_monitor, self._knowledge_watcher):
+            if task is not None:
+                task.cancel()
+        try:
+            if self._metrics_runner is not None:
+                await self._metrics_runner.cleanup()
+        except Exception as e:
+            logging.error(f"Ошибка при остановке сервера метрик: {e}")
+        try:
+            # Даем дообработать уже принятые сообщения
+            if self.user_dispatcher is not None:
+                await self.user_dispatcher.close()
+        except Exception as e:
+            logging.error(f"Ошибка при остановке очереди сообщений: {e}")
+        try:
+            # Досылаем ответы, уже поставленные в очередь
+            await outbound_sender.close()
+        except Exception as e:
+            logging.error(f"Ошибка при остановке очереди отправки: {e}")
+        try:
+            if self.llm_client is not None:
+                await self.llm_client.close()
+        except Exception as e:
+            logging.error(f"Ошибка при закрытии LLM клиента: {e}")
+        try:
+            conversation_memory.close()
+        except Exception as e:
+            logging.error(f"Ошибка при закрытии хранилища истории: {e}")
+        try:
+            if self.bot is not None:
+                await self.bot.session.close()
+                logging.info("Бот остановлен")
+        except Exception as e:
+            logging.error(f"Ошибка при закрытии сессии бота: {e}")
+        # Последним - чтобы дописать логи, накопленные при остановке
+        stop_log_writer()
+
+
+async def warm_up_bot(bot: Bot, timeout: float = 10) -> bool:
+    """
+    Открыть соединение с Bot API запросом get_me.
+    
+    Returns:
+        True если Telegram ответил
+    """
+    try:
+        me = await asyncio.wait_for(bot.get_me(), timeout=timeout)
+        logging.info(f"Соединение с Telegram открыто: @{me.username}")
+        return True
+    except Exception as e:
+        logging.warning(f"Не удалось прогреть соединение с Telegram: {e}")
+        return False
+
+
+async def wait_for_stop_signal() -> None:
+    """Ждать SIGINT/SIGTERM (там, где сигналы недоступны - до KeyboardInterrupt)."""
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    installed = []
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+            installed.append(sig)
+        except (NotImplementedError, RuntimeError):
+            # Windows или не главный поток
+            pass
+    try:
+        await stop_event.wait()
+        logging.info("Получен сигнал остановки")
+    finally:
+        for sig in installed:
+            loop.remove_signal_handler(sig)
@@ -0,0 +1,229 @@
+"""
+Планировщик запросов к LLM: допуск и справедливая очередь.
+
+Перед каждым запросом пользователь проходит проверку лимита (token bucket
+на пользователя). Одновременно выполняется не больше max_concurrent
+запросов; остальные ждут в ограниченной очереди, из которой слоты
+раздаются по взвешенной справедливой очереди (WFQ): активный пользователь
+с десятком запросов не задерживает тех, кто спросил один раз.
+Если очередь переполнена или ждать слишком долго - запрос сразу
+отклоняется, и пользователь получает сообщение о перегрузке.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import get_llm_config, get_section
+
+
+class SchedulerRejected(Exception):
+    """Запрос не допущен к LLM (лимит пользователя или перегрузка)."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class TokenBucket:
+    """
+    Token bucket: rate токенов в секунду, не больше capacity про запас.
+
+    Используется и для допуска запросов к LLM (try_consume), и для
+    равномерной отправки в Telegram (acquire, block) в outbound.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "blocked_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        # Пауза: до этого момента токены не выдаются (RetryAfter от Telegram)
+        self.blocked_until = 0.0
+
+    def try_consume(self, tokens: float = 1.0) -> bool:
+        """Списать токены, если их хватает."""
+        self._refill()
+        if self.tokens < tokens or self.updated_at < self.blocked_until:
+            return False
+        self.tokens -= tokens
+        return True
+
+    def reserve(self, tokens: float = 1.0) -> float:
+        """
+        Занять токены, даже если их пока не хватает.
+
+        Returns:
+            Сколько секунд ждать до использования (токены уже заняты, поэтому
+            одновременные вызовы получают очередь, а не одни и те же токены)
+        """
+        self._refill()
+        self.tokens -= tokens
+        delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(delay, self.blocked_until - self.updated_at)
+
+    async def acquire(self, tokens: float = 1.0) -> None:
+        """Дождаться своей очереди на токены."""
+        delay = self.reserve(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def block(self, seconds: float) -> None:
+        """Не выдавать токены seconds секунд."""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    @property
+    def is_full(self) -> bool:
+        """Ведро полное и без паузы - им давно не пользовались."""
+        self._refill()
+        return self.tokens >= self.capacity and self.updated_at >= self.blocked_until
+
+    def _refill(self) -> None:
+        """Пополнить токены за прошедшее время."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+
+class LLMScheduler:
+    """Глобальный лимит параллельных запросов, лимиты пользователей и WFQ очередь."""
+
+    def __init__(self, max_concurrent: int = 100, max_queue_size: int = 200, max_queue_wait: float = 20,
+                 user_rate_per_minute: float = 10, user_burst: float = 5,
+                 user_weights: Optional[Dict[int, float]] = None, max_tracked_users: int = 10000):
+        self.max_concurrent = max_concurrent
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait = max_queue_wait
+        self.user_rate = user_rate_per_minute / 60
+        self.user_burst = user_burst
+        self.user_weights = user_weights or {}
+        self.max_tracked_users = max_tracked_users
+
+        self.in_flight = 0
+        self._buckets: Dict[int, TokenBucket] = {}
+
+        # Очередь ожидания: (виртуальное время окончания, порядковый номер, user_id, future)
+        self._queue: List[Tuple[float, int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        # Виртуальное время окончания последнего запроса пользователя в очереди
+        self._last_finish: Dict[int, float] = {}
+
+        self.stats = {"admitted": 0, "rejected_rate_limit": 0, "rejected_queue_full": 0, "rejected_queue_timeout": 0}
+
+    @property
+    def waiting(self) -> int:
+        """Число запросов, ожидающих слот."""
+        return len(self._queue)
+
+    def admit(self, user_id: int) -> bool:
+        """
+        Проверить лимит запросов пользователя.
+
+        Returns:
+            True, если запрос можно выполнять
+        """
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_tracked_users:
+                self._forget_idle_users()
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._buckets[user_id] = bucket
+
+        if not bucket.try_consume():
+            self.stats["rejected_rate_limit"] += 1
+            logging.warning(f"Пользователь {user_id} превысил лимит запросов к LLM")
+            return False
+        self.stats["admitted"] += 1
+        return True
+
+    async def acquire(self, user_id: int, weight: Optional[float] = None) -> None:
+        """
+        Занять слот для запроса к LLM.
+
+        Args:
+            user_id: Пользователь, для которого выполняется запрос
+            weight: Вес в справедливой очереди (по умолчанию из user_weights или 1)
+
+        Raises:
+            SchedulerRejected: Очередь переполнена или слот не освободился за max_queue_wait
+        """
+        if self.in_flight < self.max_concurrent and not self._queue:
+            self.in_flight += 1
+            return
+
+        if len(self._queue) >= self.max_queue_size:
+            self.stats["rejected_queue_full"] += 1
+            logging.warning(f"Очередь LLM запросов переполнена ({self.max_queue_size}), запрос {user_id} отклонен")
+            raise SchedulerRejected("queue_full")
+
+        if weight is None:
+            weight = self.user_weights.get(user_id, 1.0)
+        start = max(self._virtual_time, self._last_finish.get(user_id, 0.0))
+        finish = start + 1.0 / weight
+        self._last_finish[user_id] = finish
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._queue, (finish, next(self._sequence), user_id, future))
+        try:
+            await asyncio.wait_for(future, timeout=self.max_queue_wait)
+        except asyncio.TimeoutError:
+            self._pass_on_granted_slot(future)
+            self.stats["rejected_queue_timeout"] += 1
+            logging.warning(f"Запрос {user_id} не дождался слота LLM за {self.max_queue_wait}s")
+            raise SchedulerRejected("queue_timeout")
+        except asyncio.CancelledError:
+            self._pass_on_granted_slot(future)
+            raise
+
+    def release(self) -> None:
+        """Освободить слот и отдать его следующему запросу из очереди."""
+        while self._queue:
+            finish, _, user_id, future = heapq.heappop(self._queue)
+            if self._last_finish.get(user_id) == finish:
+                del self._last_finish[user_id]
+            if future.done():
+                # Запрос уже отменен или отклонен по таймауту
+                continue
+            self._virtual_time = finish
+            # Слот переходит ожидающему запросу, in_flight не меняется
+            future.set_result(None)
+            return
+        self.in_flight -= 1
+
+    def get_stats(self) -> Dict[str, int]:
+        """Счетчики допуска и текущая загрузка."""
+        return {
+            **self.stats,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "tracked_users": len(self._buckets)
+        }
+
+    def _pass_on_granted_slot(self, future: asyncio.Future) -> None:
+        """Слот уже был выдан, но ожидающий ушел - передать его дальше."""
+        if future.done() and not future.cancelled():
+            self.release()
+
+    def _forget_idle_users(self) -> None:
+        """Удалить полные ведра: они не отличаются от новых."""
+        for user_id in [user_id for user_id, bucket in self._buckets.items() if bucket.is_full]:
+            del self._buckets[user_id]
+
+
+def create_scheduler() -> LLMScheduler:
+    """Создать планировщик по секции scheduler и llm.max_concurrent_requests."""
+    scheduler_config = get_section('scheduler')
+    return LLMScheduler(
+        max_concurrent=get_llm_config().get('max_concurrent_requests', 100),
+        max_queue_size=scheduler_config.get('max_queue_size', 200),
+        max_queue_wait=scheduler_config.get('max_queue_wait_seconds', 20),
+        user_rate_per_minute=scheduler_config.get('user_rate_per_minute', 10),
+        user_burst=scheduler_config.get('user_burst', 5),
+        user_weights={int(user_id): weight for user_id, weight in (scheduler_config.get('user_weights') or {}).items()}
+    )
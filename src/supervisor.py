@@ -0,0 +1,282 @@
+"""
+Режим нескольких процессов: супервизор и воркеры.
+
+Супервизор получает обновления Telegram (long polling или webhook) и
+раздает их N процессам-воркерам по user_id: все сообщения пользователя
+попадают в один и тот же воркер, поэтому его история, очередь сообщений
+и лимиты живут в одном процессе (и в своем файле SQLite). Каждый воркер -
+полноценный бот (BotRuntime) со своим event loop, а значит логирование,
+JSON и подсчет токенов используют все ядра.
+
+Воркеры раз в health_interval_seconds присылают отчет о состоянии,
+супервизор пишет его в лог и перезапускает упавшие воркеры.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import resource
+import signal
+import time
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+
+from config import get_section
+from conversation_memory import conversation_memory
+from handlers import setup_handlers
+from logger import setup_logging
+from runtime import BotRuntime, wait_for_stop_signal, warm_up_bot
+from webhook import create_routing_app, get_webhook_config, serve_app
+
+# Поля обновления, в которых есть отправитель (from)
+_USER_UPDATE_FIELDS = (
+    "message", "edited_message", "callback_query", "inline_query", "chosen_inline_result",
+    "shipping_query", "pre_checkout_query", "poll_answer", "my_chat_member", "chat_member",
+    "chat_join_request", "business_message", "edited_business_message", "message_reaction"
+)
+
+
+def extract_user_id(update: Dict[str, Any]) -> int:
+    """ID пользователя из обновления (0, если отправителя нет)."""
+    for field in _USER_UPDATE_FIELDS:
+        payload = update.get(field)
+        if not payload:
+            continue
+        sender = payload.get("from") or payload.get("user")
+        if sender:
+            return sender["id"]
+        chat = payload.get("chat")
+        if chat:
+            return chat["id"]
+    return 0
+
+
+def shard_for(user_id: int, workers: int) -> int:
+    """Номер воркера для пользователя (стабилен, пока не меняется число воркеров)."""
+    return user_id % workers
+
+
+def worker_main(worker_id: int, bot_token: str, updates: multiprocessing.Queue,
+                health: multiprocessing.Queue, health_interval: float) -> None:
+    """Точка входа процесса-воркера."""
+    # Остановкой управляет супервизор (Ctrl+C приходит всей группе процессов)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    setup_logging(worker_id)
+    asyncio.run(_run_worker(worker_id, bot_token, updates, health, health_interval))
+
+
+async def _run_worker(worker_id: int, bot_token: str, updates: multiprocessing.Queue,
+                      health: multiprocessing.Queue, health_interval: float) -> None:
+    """Получать обновления из очереди супервизора и обрабатывать их."""
+    runtime = BotRuntime(bot_token, shard=worker_id)
+    await runtime.start()
+    await runtime.warm_up()
+    logging.info(f"Воркер {worker_id} запущен (pid {os.getpid()})")
+
+    stats = {"processed": 0}
+    tasks = set()
+    reporter = asyncio.create_task(_report_health(worker_id, runtime, stats, health, health_interval))
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            raw_update = await loop.run_in_executor(None, updates.get)
+            if raw_update is None:
+                break
+            task = asyncio.create_task(runtime.dp.feed_raw_update(runtime.bot, raw_update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            stats["processed"] += 1
+        await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        reporter.cancel()
+        # Итоговый отчет - супервизор заберет его после остановки воркера
+        health.put(_health_report(worker_id, runtime, stats))
+        await runtime.stop()
+        logging.info(f"Воркер {worker_id} остановлен, обработано обновлений: {stats['processed']}")
+
+
+async def _report_health(worker_id: int, runtime: BotRuntime, stats: Dict[str, int],
+                         health: multiprocessing.Queue, interval: float) -> None:
+    """Периодически отправлять супервизору отчет о состоянии воркера."""
+    while True:
+        health.put(_health_report(worker_id, runtime, stats))
+        await asyncio.sleep(interval)
+
+
+def _health_report(worker_id: int, runtime: BotRuntime, stats: Dict[str, int]) -> Dict[str, Any]:
+    """Отчет о состоянии воркера."""
+    return {
+        "worker_id": worker_id,
+        "pid": os.getpid(),
+        "processed": stats["processed"],
+        "llm_in_flight": runtime.llm_client.in_flight,
+        "llm_waiting": runtime.llm_client.waiting,
+        "active_users": runtime.user_dispatcher.active_users,
+        "users_in_memory": conversation_memory.get_stats()["total_users"],
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "reported_at": time.time()
+    }
+
+
+class Supervisor:
+    """Запуск воркеров, раздача обновлений по user_id и контроль состояния."""
+
+    def __init__(self, bot_token: str, workers: int, health_interval: float = 30, shutdown_timeout: float = 30):
+        self.bot_token = bot_token
+        self.workers = workers
+        self.health_interval = health_interval
+        self.shutdown_timeout = shutdown_timeout
+        # spawn: воркер начинает с чистого процесса, без потоков и event loop супервизора
+        self._context = multiprocessing.get_context("spawn")
+        self._health = self._context.Queue()
+        self._queues: List[multiprocessing.Queue] = []
+        self._processes: List[Optional[multiprocessing.Process]] = []
+        self.reports: Dict[int, Dict[str, Any]] = {}
+        self.routed = [0] * workers
+
+    def start(self) -> None:
+        """Запустить все воркеры."""
+        for worker_id in range(self.workers):
+            self._queues.append(self._context.Queue())
+            self._processes.append(None)
+            self._start_worker(worker_id)
+        logging.info(f"Супервизор запустил {self.workers} воркеров")
+
+    def route(self, raw_update: Dict[str, Any]) -> None:
+        """Передать обновление воркеру пользователя."""
+        worker_id = shard_for(extract_user_id(raw_update), self.workers)
+        self._queues[worker_id].put(raw_update)
+        self.routed[worker_id] += 1
+
+    async def monitor(self) -> None:
+        """Собирать отчеты воркеров, писать их в лог и перезапускать упавшие."""
+        while True:
+            await asyncio.sleep(self.health_interval)
+            self._collect_reports()
+            for worker_id, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logging.error(f"Воркер {worker_id} завершился с кодом {process.exitcode}, перезапускаем")
+                    self._start_worker(worker_id)
+            for line in self.health_report():
+                logging.info(line)
+
+    def health_report(self) -> List[str]:
+        """Строки отчета о состоянии воркеров."""
+        lines = []
+        now = time.time()
+        for worker_id in range(self.workers):
+            report = self.reports.get(worker_id)
+            if report is None:
+                lines.append(f"Воркер {worker_id}: отчетов пока нет, передано обновлений {self.routed[worker_id]}")
+                continue
+            lines.append(
+                f"Воркер {worker_id} (pid {report['pid']}): передано {self.routed[worker_id]}, "
+                f"обработано {report['processed']}, LLM в работе {report['llm_in_flight']} "
+                f"(ждут {report['llm_waiting']}), активных пользователей {report['active_users']}, "
+                f"в памяти {report['users_in_memory']}, max RSS {report['max_rss_mb']} MB, "
+                f"отчет {int(now - report['reported_at'])}s назад"
+            )
+        return lines
+
+    async def stop(self) -> None:
+        """Попросить воркеры дообработать очередь и дождаться их остановки."""
+        for worker_queue in self._queues:
+            worker_queue.put(None)
+
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + self.shutdown_timeout
+        for worker_id, process in enumerate(self._processes):
+            await loop.run_in_executor(None, process.join, max(0.0, deadline - time.monotonic()))
+            if process.is_alive():
+                logging.warning(f"Воркер {worker_id} не остановился за {self.shutdown_timeout}s, завершаем принудительно")
+                process.terminate()
+                await loop.run_in_executor(None, process.join, 5)
+        self._collect_reports()
+        logging.info("Все воркеры остановлены")
+
+    def _start_worker(self, worker_id: int) -> None:
+        """Запустить (или перезапустить) процесс воркера."""
+        process = self._context.Process(
+            target=worker_main,
+            args=(worker_id, self.bot_token, self._queues[worker_id], self._health, self.health_interval),
+            name=f"bot-worker-{worker_id}"
+        )
+        process.start()
+        self._processes[worker_id] = process
+
+    def _collect_reports(self) -> None:
+        """Забрать накопившиеся отчеты воркеров (остается последний от каждого)."""
+        while True:
+            try:
+                report = self._health.get_nowait()
+            except queue.Empty:
+                return
+            self.reports[report["worker_id"]] = report
+
+
+async def poll_updates(bot: Bot, supervisor: Supervisor, allowed_updates: List[str], timeout: int = 25) -> None:
+    """Long polling в супервизоре: обновления не разбираются, а раздаются воркерам."""
+    offset = None
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+            except Exception as e:
+                logging.error(f"Ошибка получения обновлений: {e}")
+                await asyncio.sleep(5)
+                continue
+            for update in updates:
+                offset = update.update_id + 1
+                supervisor.route(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+    finally:
+        if offset is not None:
+            # Подтверждаем Telegram уже розданные обновления, чтобы не получить их повторно
+            try:
+                await bot.get_updates(offset=offset, timeout=0, limit=1)
+            except Exception as e:
+                logging.warning(f"Не удалось подтвердить полученные обновления: {e}")
+
+
+async def run_supervisor(bot_token: str) -> None:
+    """Запустить воркеры и раздавать им обновления до SIGINT/SIGTERM."""
+    workers_config = get_section('workers')
+    supervisor = Supervisor(
+        bot_token,
+        workers=workers_config.get('count', 1),
+        health_interval=workers_config.get('health_interval_seconds', 30),
+        shutdown_timeout=workers_config.get('shutdown_timeout_seconds', 30)
+    )
+
+    # Типы обновлений, на которые есть обработчики (сами обработчики работают в воркерах)
+    handlers_dp = Dispatcher()
+    setup_handlers(handlers_dp)
+    allowed_updates = handlers_dp.resolve_used_update_types()
+
+    bot = Bot(token=bot_token)
+    supervisor.start()
+    # Пока воркеры запускаются, открываем соединение для получения обновлений
+    warmup_config = get_section('warmup')
+    if warmup_config.get('enabled', True):
+        await warm_up_bot(bot, warmup_config.get('timeout_seconds', 10))
+    monitor = asyncio.create_task(supervisor.monitor())
+    webhook_config = get_webhook_config()
+    try:
+        if webhook_config['enabled']:
+            app = create_routing_app(bot, supervisor.route, webhook_config, allowed_updates)
+            await serve_app(app, webhook_config)
+        else:
+            polling = asyncio.create_task(poll_updates(bot, supervisor, allowed_updates))
+            try:
+                await wait_for_stop_signal()
+            finally:
+                polling.cancel()
+                await asyncio.gather(polling, return_exceptions=True)
+    finally:
+        monitor.cancel()
+        await supervisor.stop()
+        for line in supervisor.health_report():
+            logging.info(line)
+        await bot.session.close()
@@ -0,0 +1,150 @@
+"""
+Последовательная обработка сообщений каждого пользователя.
+
+Сообщения одного пользователя обрабатываются строго по очереди. Серия
+быстрых сообщений, пришедших за окно debounce, объединяется в один запрос
+к LLM. Опционально новое сообщение отменяет еще не отправленный ответ
+на предыдущие - они объединяются с новым.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import get_section
+
+
+class UserBatch:
+    """Пакет сообщений пользователя, обрабатываемых одним запросом."""
+
+    def __init__(self, user_id: int, messages: List[Any], received_at: float):
+        self.user_id = user_id
+        self.messages = messages
+        # Время получения первого сообщения пакета (для времени ответа)
+        self.received_at = received_at
+        self.committed = False
+
+    @property
+    def last_message(self) -> Any:
+        """Последнее сообщение пакета (на него отправляется ответ)."""
+        return self.messages[-1]
+
+    @property
+    def text(self) -> str:
+        """Объединенный текст всех сообщений пакета."""
+        return "\n".join(message.text for message in self.messages if message.text) or "сообщение без текста"
+
+    def commit(self) -> None:
+        """Отметить, что ответ начал отправляться - после этого пакет не отменяется."""
+        self.committed = True
+
+
+class _UserState:
+    """Очередь и текущая обработка одного пользователя."""
+
+    __slots__ = ("pending", "received_at", "worker", "batch", "processing")
+
+    def __init__(self):
+        self.pending: List[Any] = []
+        self.received_at = 0.0
+        self.worker: Optional[asyncio.Task] = None
+        self.batch: Optional[UserBatch] = None
+        self.processing: Optional[asyncio.Task] = None
+
+
+class UserDispatcher:
+    """Диспетчер сообщений по user_id."""
+
+    def __init__(self, process: Callable[[UserBatch], Awaitable[None]], debounce_seconds: float = 0.7,
+                 cancel_superseded: bool = False, max_batch_messages: int = 10):
+        self.process = process
+        self.debounce_seconds = debounce_seconds
+        self.cancel_superseded = cancel_superseded
+        self.max_batch_messages = max_batch_messages
+        self._users: Dict[int, _UserState] = {}
+
+    def submit(self, user_id: int, message: Any) -> None:
+        """Поставить сообщение в очередь пользователя (возвращается сразу)."""
+        state = self._users.get(user_id)
+        if state is None:
+            state = _UserState()
+            self._users[user_id] = state
+
+        if not state.pending:
+            state.received_at = time.time()
+        state.pending.append(message)
+
+        # Ответ на предыдущие сообщения еще не начал отправляться - пересобираем его с новым
+        if (self.cancel_superseded and state.processing is not None and not state.processing.done()
+                and state.batch is not None and not state.batch.committed):
+            logging.info(f"Новое сообщение от {user_id} отменяет обработку предыдущих")
+            state.processing.cancel()
+
+        if state.worker is None:
+            state.worker = asyncio.create_task(self._run(user_id, state))
+
+    @property
+    def active_users(self) -> int:
+        """Число пользователей с необработанными сообщениями."""
+        return len(self._users)
+
+    @property
+    def queued_messages(self) -> int:
+        """Число сообщений, ожидающих обработки."""
+        return sum(len(state.pending) for state in self._users.values())
+
+    async def close(self, timeout: float = 10) -> None:
+        """Дождаться обработки очередей (не дольше timeout), остальное отменить."""
+        workers = [state.worker for state in self._users.values() if state.worker is not None]
+        if not workers:
+            return
+        _, still_running = await asyncio.wait(workers, timeout=timeout)
+        for worker in still_running:
+            worker.cancel()
+        await asyncio.gather(*still_running, return_exceptions=True)
+
+    async def _run(self, user_id: int, state: _UserState) -> None:
+        """Обработчик очереди одного пользователя."""
+        try:
+            while state.pending:
+                # Ждем, не допишет ли пользователь еще что-нибудь
+                await asyncio.sleep(self.debounce_seconds)
+
+                messages = state.pending[:self.max_batch_messages]
+                state.pending = state.pending[self.max_batch_messages:]
+                received_at = state.received_at
+                if state.pending:
+                    state.received_at = time.time()
+                if len(messages) > 1:
+                    logging.info(f"Объединено {len(messages)} сообщений пользователя {user_id}")
+
+                state.batch = UserBatch(user_id, messages, received_at)
+                state.processing = asyncio.create_task(self.process(state.batch))
+                try:
+                    await state.processing
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling():
+                        raise
+                    # Обработку отменило новое сообщение - повторим вместе с ним
+                    state.pending = messages + state.pending
+                    state.received_at = received_at
+                except Exception as e:
+                    logging.error(f"Ошибка обработки сообщений пользователя {user_id}: {e}")
+                finally:
+                    state.batch = None
+                    state.processing = None
+        finally:
+            if self._users.get(user_id) is state:
+                del self._users[user_id]
+
+
+def create_user_dispatcher(process: Callable[[UserBatch], Awaitable[None]]) -> UserDispatcher:
+    """Создать диспетчер по секции user_dispatcher из settings.yaml."""
+    dispatcher_config = get_section('user_dispatcher')
+    return UserDispatcher(
+        process,
+        debounce_seconds=dispatcher_config.get('debounce_seconds', 0.7),
+        cancel_superseded=dispatcher_config.get('cancel_superseded', False),
+        max_batch_messages=dispatcher_config.get('max_batch_messages', 10)
+    )
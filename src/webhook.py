@@ -0,0 +1,152 @@
+"""
+Прием обновлений Telegram через webhook (aiohttp сервер aiogram).
+
+Вместо long polling Telegram сам отправляет обновления POST запросом,
+и они обрабатываются сразу по получении. Сервер слушает локальный
+host:port за reverse proxy с TLS; публичный адрес регистрируется в
+Telegram при запуске вместе с секретным токеном, которым Telegram
+подписывает каждый запрос.
+"""
+
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from config import get_section
+from runtime import wait_for_stop_signal
+
+# Заголовок, в котором Telegram передает секретный токен webhook
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def get_webhook_config() -> Dict[str, Any]:
+    """Настройки webhook из секции webhook (секрет - из переменной окружения)."""
+    webhook_config = get_section('webhook')
+    return {
+        'enabled': webhook_config.get('enabled', False),
+        'base_url': webhook_config.get('base_url') or os.getenv('WEBHOOK_BASE_URL', ''),
+        'path': webhook_config.get('path', '/telegram/webhook'),
+        'host': webhook_config.get('host', '127.0.0.1'),
+        'port': webhook_config.get('port', 8080),
+        'secret_token': os.getenv('TELEGRAM_WEBHOOK_SECRET') or None,
+        'drop_pending_updates': webhook_config.get('drop_pending_updates', False),
+        'delete_on_shutdown': webhook_config.get('delete_on_shutdown', True)
+    }
+
+
+def create_webhook_app(bot: Bot, dp: Dispatcher, webhook_config: Dict[str, Any]) -> web.Application:
+    """
+    Создать aiohttp приложение с обработчиком webhook.
+
+    Регистрация webhook в Telegram происходит при старте приложения,
+    удаление - при остановке (если delete_on_shutdown).
+    """
+    app = _create_app()
+
+    # Ответ Telegram отдается сразу, обработка обновления идет в фоне
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=webhook_config['secret_token']
+    ).register(app, path=webhook_config['path'])
+
+    async def on_startup(bot: Bot) -> None:
+        await _set_webhook(bot, webhook_config, dp.resolve_used_update_types())
+
+    async def on_shutdown(bot: Bot) -> None:
+        await _delete_webhook(bot, webhook_config)
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    # Запуск/остановка диспетчера вместе с приложением
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+def create_routing_app(bot: Bot, route: Callable[[Dict[str, Any]], None], webhook_config: Dict[str, Any],
+                       allowed_updates: Optional[List[str]] = None) -> web.Application:
+    """
+    Создать webhook приложение, которое не обрабатывает обновления, а передает
+    их как есть в route (режим нескольких процессов: route выбирает воркер).
+    """
+    app = _create_app()
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if webhook_config['secret_token'] and request.headers.get(SECRET_HEADER) != webhook_config['secret_token']:
+            return web.Response(status=401, text="Unauthorized")
+        route(await request.json())
+        return web.Response()
+
+    app.router.add_post(webhook_config['path'], handle_update)
+
+    async def on_startup(app: web.Application) -> None:
+        await _set_webhook(bot, webhook_config, allowed_updates)
+
+    async def on_shutdown(app: web.Application) -> None:
+        await _delete_webhook(bot, webhook_config)
+
+    app.on_startup.append(on_startup)
+    app.on_shutdown.append(on_shutdown)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher, webhook_config: Dict[str, Any]) -> None:
+    """
+    Запустить webhook сервер и работать до SIGINT/SIGTERM.
+
+    При остановке сервер перестает принимать запросы и вызывает
+    shutdown-обработчики диспетчера.
+    """
+    await serve_app(create_webhook_app(bot, dp, webhook_config), webhook_config)
+
+
+async def serve_app(app: web.Application, webhook_config: Dict[str, Any]) -> None:
+    """Запустить webhook приложение на host:port и работать до сигнала остановки."""
+    if not webhook_config['base_url']:
+        raise ValueError("Для режима webhook нужен webhook.base_url или WEBHOOK_BASE_URL")
+    if not webhook_config['secret_token']:
+        logging.warning("TELEGRAM_WEBHOOK_SECRET не задан - запросы к webhook не проверяются")
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=webhook_config['host'], port=webhook_config['port'])
+    try:
+        await site.start()
+        logging.info(f"Webhook сервер слушает {webhook_config['host']}:{webhook_config['port']}{webhook_config['path']}")
+        await wait_for_stop_signal()
+    finally:
+        await runner.cleanup()
+
+
+def _create_app() -> web.Application:
+    """aiohttp приложение с проверкой живости для reverse proxy."""
+    app = web.Application()
+
+    async def healthz(request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    app.router.add_get('/healthz', healthz)
+    return app
+
+
+async def _set_webhook(bot: Bot, webhook_config: Dict[str, Any], allowed_updates: Optional[List[str]]) -> None:
+    """Зарегистрировать webhook в Telegram."""
+    url = webhook_config['base_url'].rstrip('/') + webhook_config['path']
+    await bot.set_webhook(
+        url=url,
+        secret_token=webhook_config['secret_token'],
+        allowed_updates=allowed_updates,
+        drop_pending_updates=webhook_config['drop_pending_updates']
+    )
+    logging.info(f"Webhook зарегистрирован: {url}")
+
+
+async def _delete_webhook(bot: Bot, webhook_config: Dict[str, Any]) -> None:
+    """Удалить webhook при остановке (если delete_on_shutdown)."""
+    if webhook_config['delete_on_shutdown']:
+        await bot.delete_webhook()
+        logging.info("Webhook удален")
@@ -0,0 +1,24 @@
+"""
+Общие фикстуры тестов.
+"""
+
+import pytest
+import os
+import sys
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import memory_storage
+
+
+@pytest.fixture(autouse=True, scope="session")
+def isolated_files(tmp_path_factory):
+    """Логи и данные тестов пишутся во временную папку, а не в logs/ и data/ проекта."""
+    root = tmp_path_factory.mktemp("project")
+    (root / "logs").mkdir()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # Через окружение папку логов получают и процессы-воркеры
+        monkeypatch.setenv("LOGS_DIR", str(root / "logs"))
+        monkeypatch.setattr(memory_storage, "get_project_root", lambda: str(root))
+        yield root
@@ -0,0 +1,106 @@
+"""
+Тесты отчета по JSON логам.
+"""
+
+import pytest
+import gzip
+import json
+import os
+import sys
+from datetime import date
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from analytics import LatencyHistogram, analyze_logs, build_report, find_log_files
+
+
+def write_log(path, entries):
+    """Записать JSON лог построчно (.gz - сжатый)."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        for entry in entries:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def llm_entry(user_id, model, response_time_ms, status="success", prompt_tokens=100, completion_tokens=20):
+    """Запись llm_requests."""
+    return {"user_id": user_id, "model": model, "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens, "response_time_ms": response_time_ms, "status": status}
+
+
+@pytest.fixture
+def logs_dir(tmp_path):
+    """Логи за два дня: обычные, сжатые, воркера и лишние файлы."""
+    write_log(str(tmp_path / 'llm_requests_2024-05-01.json.gz'),
+              [llm_entry(1, "model-a", ms) for ms in range(100, 1100, 10)])
+    write_log(str(tmp_path / 'llm_requests-w1_2024-05-02.json'),
+              [llm_entry(2, "model-b", 2000), llm_entry(2, "model-b", None, status="error", prompt_tokens=None)])
+    write_log(str(tmp_path / 'conversations_2024-05-01.json'),
+              [{"user_id": 1, "response_time_ms": 500}] * 3)
+    write_log(str(tmp_path / 'conversations-w1_2024-05-02.json.gz'),
+              [{"user_id": 2, "response_time_ms": 900}, {"user_id": 2, "response_time_ms": 1, "intent": "greeting"}])
+    write_log(str(tmp_path / 'errors_2024-05-02.json'),
+              [{"error_type": "llm_request_error"}, {"error_type": "llm_request_error"}, {"error_type": "telegram"}])
+    # Оборванная строка
+    with open(tmp_path / 'errors_2024-05-02.json', 'a', encoding='utf-8') as f:
+        f.write('{"error_type": "llm_re\n')
+    # Вне периода и не JSON логи
+    write_log(str(tmp_path / 'llm_requests_2024-05-03.json'), [llm_entry(3, "model-c", 100)])
+    write_log(str(tmp_path / 'app_2024-05-01.log'), [])
+    return str(tmp_path)
+
+
+class TestAnalytics:
+    """Тесты разбора логов."""
+
+    def test_histogram_percentile_is_close(self):
+        """Перцентиль по логарифмическим корзинам отличается не больше чем на ~1%."""
+        histogram = LatencyHistogram()
+        for value in range(1, 1001):
+            histogram.add(value)
+        assert histogram.percentile(0.5) == pytest.approx(500, rel=0.02)
+        assert histogram.percentile(0.95) == pytest.approx(950, rel=0.02)
+        assert LatencyHistogram().percentile(0.5) is None
+
+    def test_find_log_files(self, logs_dir):
+        """Берутся только JSON логи за период, включая .gz и файлы воркеров."""
+        files = find_log_files(logs_dir, date(2024, 5, 1), date(2024, 5, 2))
+        assert sorted(files) == ["2024-05-01", "2024-05-02"]
+        assert len(files["2024-05-01"]) == 2
+        assert len(files["2024-05-02"]) == 3
+
+    @pytest.mark.parametrize("workers", [1, 2])
+    def test_report(self, logs_dir, workers):
+        """Перцентили, токены, стоимость, ошибки и активные пользователи за период."""
+        stats = analyze_logs(logs_dir, date(2024, 5, 1), date(2024, 5, 2), workers=workers)
+        report = build_report(stats, {"model-a": {"prompt_per_million": 1.0, "completion_per_million": 2.0}}, top=1)
+
+        assert report["days"] == ["2024-05-01", "2024-05-02"]
+        assert set(report["models"]) == {"model-a", "model-b"}
+
+        model_a = report["models"]["model-a"]
+        assert model_a["requests"] == 100
+        assert model_a["prompt_tokens"] == 10000
+        assert model_a["cost"] == pytest.approx((10000 * 1.0 + 2000 * 2.0) / 1_000_000)
+        assert model_a["p95_ms"] == pytest.approx(1050, rel=0.02)
+
+        model_b = report["models"]["model-b"]
+        assert model_b["statuses"] == {"success": 1, "error": 1}
+        assert model_b["cost"] is None
+
+        assert report["conversations"] == 5
+        assert report["intents"] == {"greeting": 1}
+        assert report["errors"] == {"llm_request_error": 2, "telegram": 1}
+        assert report["bad_lines"] == 1
+        assert report["top_users_by_messages"] == [(1, 3)]
+        assert report["top_users_by_tokens"] == [(1, 12000)]
+
+    def test_empty_period(self, logs_dir):
+        """Период без логов - пустой отчет."""
+        stats = analyze_logs(logs_dir, date(2023, 1, 1), date(2023, 1, 2))
+        assert build_report(stats, {})["days"] == []
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -4,6 +4,8 @@
 """
 
 import pytest
+import json
+import logging
 import os
 import sys
 
@@ -91,6 +93,69 @@ class TestConversationMemory:
         self.memory.clear_history(self.test_user_id)
         assert len(self.memory.get_history(self.test_user_id)) == 0
     
+    def test_get_history_does_not_create_entries(self):
+        """Тест что чтение истории не создает записей для новых пользователей."""
+        self.memory.get_history(self.test_user_id)
+        assert self.test_user_id not in self.memory.get_stats()['users_with_history']
+        assert self.test_user_id not in self.memory._conversations
+    
+    def test_idle_history_expires(self, monkeypatch):
+        """Тест удаления истории после idle TTL."""
+        self.memory.add_message(self.test_user_id, "user", "Тест")
+        monkeypatch.setattr(self.memory, 'idle_ttl_seconds', -1)
+        
+        assert self.memory.get_history(self.test_user_id) == []
+        assert self.test_user_id not in self.memory._conversations
+    
+    def test_lru_user_limit(self, monkeypatch):
+        """Тест вытеснения самых давно активных пользователей сверх лимита."""
+        for user_id in (self.test_user_id, self.test_user_id + 1):
+            self.memory.clear_history(user_id)
+        monkeypatch.setattr(self.memory, 'max_users', len(self.memory._conversations) + 1)
+        
+        self.memory.add_message(self.test_user_id, "user", "Первый")
+        self.memory.add_message(self.test_user_id + 1, "user", "Второй")
+        
+        assert self.memory.get_history(self.test_user_id) == []
+        assert len(self.memory.get_history(self.test_user_id + 1)) == 1
+        self.memory.clear_history(self.test_user_id + 1)
+    
+    def test_total_bytes_accounting(self):
+        """Тест учета размера истории при вытеснении из кольцевого буфера."""
+        before = self.memory.total_bytes
+        for i in range(self.memory.max_messages_per_user + 5):
+            self.memory.add_message(self.test_user_id, "user", "x" * 10)
+        
+        expected = self.memory.max_messages_per_user * (10 + len("user"))
+        assert self.memory.total_bytes - before == expected
+        
+        self.memory.clear_history(self.test_user_id)
+        assert self.memory.total_bytes == before
+    
+    def test_apply_summary_keeps_new_messages(self):
+        """Тест что сжатие удаляет только сообщения из снимка, даже если пришли новые."""
+        for i in range(6):
+            self.memory.add_message(self.test_user_id, "user", f"Сообщение {i}")
+        snapshot = self.memory.get_summary_snapshot(self.test_user_id, threshold=6, keep_recent=2)
+        assert len(snapshot.messages) == 4
+        
+        self.memory.add_message(self.test_user_id, "user", "Новое сообщение")
+        assert self.memory.apply_summary(self.test_user_id, snapshot, "Итог")
+        
+        history = self.memory.get_history(self.test_user_id, 20)
+        assert [m["content"] for m in history] == ["Сообщение 4", "Сообщение 5", "Новое сообщение"]
+        assert self.memory.get_summary(self.test_user_id) == "Итог"
+    
+    def test_apply_summary_after_clear_is_ignored(self):
+        """Тест что результат сжатия не применяется к очищенной истории."""
+        for i in range(4):
+            self.memory.add_message(self.test_user_id, "user", f"Сообщение {i}")
+        snapshot = self.memory.get_summary_snapshot(self.test_user_id, threshold=4, keep_recent=1)
+        self.memory.clear_history(self.test_user_id)
+        
+        assert not self.memory.apply_summary(self.test_user_id, snapshot, "Итог")
+        assert self.memory.get_summary(self.test_user_id) == ""
+    
     def test_get_stats(self):
         """Тест получения статистики."""
         self.memory.add_message(self.test_user_id, "user", "Тест")
@@ -113,6 +178,95 @@ class TestLogging:
             assert True
         except Exception as e:
             pytest.fail(f"setup_logging вызвал исключение: {e}")
+    
+    def test_json_log_writer_batches_and_drains(self, monkeypatch, tmp_path):
+        """Тест что фоновая запись дописывает все записи при остановке."""
+        import logger
+        os.makedirs(tmp_path / 'logs')
+        monkeypatch.setenv('LOGS_DIR', str(tmp_path / 'logs'))
+        
+        logger.start_log_writer()
+        for i in range(50):
+            logger.log_error(error_type="test_error", error_message=f"Ошибка {i}")
+        logger.stop_log_writer()
+        
+        files = os.listdir(tmp_path / 'logs')
+        assert len(files) == 1 and files[0].startswith('errors_')
+        with open(tmp_path / 'logs' / files[0], encoding='utf-8') as f:
+            lines = f.readlines()
+        assert len(lines) == 50
+        assert json.loads(lines[-1])['error_message'] == "Ошибка 49"
+
+    def test_json_log_writer_drops_when_queue_is_full(self, monkeypatch, tmp_path):
+        """Тест что при переполненной очереди запись отбрасывается и учитывается, а не пишется из event loop."""
+        import logger
+        import metrics
+        os.makedirs(tmp_path / 'logs')
+        monkeypatch.setenv('LOGS_DIR', str(tmp_path / 'logs'))
+        # Поток записи не запущен - очередь не разбирается
+        writer = logger.JsonLogWriter(max_queue_size=2)
+        monkeypatch.setattr(logger, '_log_writer', writer)
+        before = metrics.log_entries_dropped_total.value("errors")
+        
+        for i in range(3):
+            logger.log_error(error_type="test_error", error_message=f"Ошибка {i}")
+        
+        assert metrics.log_entries_dropped_total.value("errors") == before + 1
+        assert os.listdir(tmp_path / 'logs') == []
+
+
+class TestLogRotation:
+    """Тесты ротации и очистки файлов логов."""
+    
+    def _record(self, text):
+        """Создать запись лога."""
+        return logging.LogRecord("test", logging.INFO, __file__, 0, text, None, None)
+    
+    def test_switches_file_on_new_day(self, monkeypatch, tmp_path):
+        """Тест переключения app лога на новую дату."""
+        import logger
+        handler = logger.DailyRotatingFileHandler(str(tmp_path), retention_days=0, compress_after_days=0)
+        monkeypatch.setattr(handler, '_current_date', lambda: '2025-01-01')
+        handler.current_date = '2025-01-01'
+        handler.baseFilename = handler._path_for('2025-01-01')
+        handler.emit(self._record("день первый"))
+        
+        monkeypatch.setattr(handler, '_current_date', lambda: '2025-01-02')
+        handler.emit(self._record("день второй"))
+        handler.close()
+        
+        assert sorted(os.listdir(tmp_path)) == ['app_2025-01-01.log', 'app_2025-01-02.log']
+    
+    def test_size_cap_creates_parts(self, tmp_path):
+        """Тест ротации по размеру файла."""
+        import logger
+        handler = logger.DailyRotatingFileHandler(str(tmp_path), max_bytes=100, retention_days=0, compress_after_days=0)
+        for i in range(10):
+            handler.emit(self._record("x" * 40))
+        handler.close()
+        
+        names = os.listdir(tmp_path)
+        assert len(names) > 1
+        assert all(os.path.getsize(tmp_path / name) <= 150 for name in names)
+    
+    def test_cleanup_compresses_and_removes_old_files(self, tmp_path):
+        """Тест сжатия и удаления старых логов всех типов."""
+        import logger
+        from datetime import date, timedelta
+        old_day = (date.today() - timedelta(days=40)).isoformat()
+        recent_day = (date.today() - timedelta(days=2)).isoformat()
+        today = date.today().isoformat()
+        
+        for name in [f'app_{old_day}.log', f'errors_{old_day}.json',
+                     f'conversations_{recent_day}.json', f'llm_requests_{today}.json', 'notes.txt']:
+            (tmp_path / name).write_text('{"a": 1}\n')
+            os.utime(tmp_path / name, (0, 0))
+        
+        logger.cleanup_old_logs(str(tmp_path), retention_days=30, compress_after_days=1)
+        
+        assert sorted(os.listdir(tmp_path)) == sorted([
+            f'conversations_{recent_day}.json.gz', f'llm_requests_{today}.json', 'notes.txt'
+        ])
 
 
 class TestProjectStructure:
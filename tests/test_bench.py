@@ -0,0 +1,52 @@
+"""
+Тесты нагрузочного стенда (заглушки Telegram и OpenRouter).
+"""
+
+import pytest
+import os
+import sys
+
+# Добавляем src и bench в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+from config import config_store
+from outbound import configure_outbound
+from run_bench import percentile, run_benchmark
+
+
+class TestBench:
+    """Тесты прогона нагрузки."""
+
+    def test_percentile(self):
+        """Перцентиль по отсортированным значениям."""
+        values = [float(n) for n in range(1, 101)]
+        assert percentile(values, 0.5) == 51.0
+        assert percentile(values, 0.99) == 100.0
+        assert percentile([], 0.5) is None
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("stream", [True, False])
+    async def test_run_benchmark(self, stream):
+        """Каждое сообщение получает ответ через заглушки Telegram и LLM."""
+        try:
+            result = await run_benchmark(users=5, messages_per_user=2, llm_latency=0.01, llm_jitter=0, stream=stream)
+        finally:
+            # Возвращаем настройки из settings.yaml для остальных тестов
+            config_store.reload()
+            configure_outbound()
+
+        assert result["answered"] == 10
+        assert result["timeouts"] == 0
+        assert result["failed"] == 0
+        assert result["llm_requests"] == 10
+        assert result["latency_p99"] is not None
+        assert result["telegram_calls"]["sendMessage"] >= 10
+        if not stream:
+            assert result["telegram_calls"]["sendChatAction"] == 10
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
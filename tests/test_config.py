@@ -11,7 +11,7 @@ import yaml
 # Добавляем src в путь для импортов
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
-from config import load_config, load_prompts
+from config import load_config, load_prompts, ConfigStore
 
 
 class TestConfigErrorHandling:
@@ -139,5 +139,79 @@ class TestConfigValidation:
         assert len(llm_config.get('model', '')) > 0
 
 
+class TestConfigStore:
+    """Тесты кеша конфигурации."""
+    
+    def _write_config(self, root, model, welcome):
+        """Записать settings.yaml и prompts.yaml во временный проект."""
+        config_dir = os.path.join(root, 'config')
+        os.makedirs(config_dir, exist_ok=True)
+        with open(os.path.join(config_dir, 'settings.yaml'), 'w', encoding='utf-8') as f:
+            yaml.safe_dump({'llm': {'model': model}}, f)
+        with open(os.path.join(config_dir, 'prompts.yaml'), 'w', encoding='utf-8') as f:
+            yaml.safe_dump({'welcome_message': welcome}, f, allow_unicode=True)
+    
+    def test_store_reads_files_once(self, monkeypatch, tmp_path):
+        """Тест что повторные обращения не читают файлы заново."""
+        import config
+        monkeypatch.setattr(config, 'get_project_root', lambda: str(tmp_path))
+        self._write_config(str(tmp_path), 'model-a', 'Привет')
+        
+        calls = []
+        original_load_config = config.load_config
+        monkeypatch.setattr(config, 'load_config', lambda: calls.append(1) or original_load_config())
+        
+        store = ConfigStore()
+        assert store.config['llm']['model'] == 'model-a'
+        assert store.config['llm']['model'] == 'model-a'
+        assert store.prompts['welcome_message'] == 'Привет'
+        assert len(calls) == 1
+    
+    def test_reload_if_changed(self, monkeypatch, tmp_path):
+        """Тест перезагрузки только при изменении mtime файла."""
+        import config
+        monkeypatch.setattr(config, 'get_project_root', lambda: str(tmp_path))
+        self._write_config(str(tmp_path), 'model-a', 'Привет')
+        
+        store = ConfigStore()
+        store.reload()
+        assert store.reload_if_changed() is False
+        
+        self._write_config(str(tmp_path), 'model-b', 'Здравствуйте')
+        settings_path = os.path.join(str(tmp_path), 'config', 'settings.yaml')
+        stat = os.stat(settings_path)
+        os.utime(settings_path, (stat.st_atime, stat.st_mtime + 10))
+        
+        assert store.reload_if_changed() is True
+        assert store.config['llm']['model'] == 'model-b'
+        assert store.prompts['welcome_message'] == 'Здравствуйте'
+    
+    def test_invalid_file_keeps_previous_config(self, monkeypatch, tmp_path):
+        """Тест что недописанный settings.yaml не заменяет рабочую конфигурацию."""
+        import config
+        monkeypatch.setattr(config, 'get_project_root', lambda: str(tmp_path))
+        self._write_config(str(tmp_path), 'model-a', 'Привет')
+        
+        store = ConfigStore()
+        store.reload()
+        version = store.version
+        
+        settings_path = os.path.join(str(tmp_path), 'config', 'settings.yaml')
+        with open(settings_path, 'w', encoding='utf-8') as f:
+            f.write("llm:\n  model: [")
+        stat = os.stat(settings_path)
+        os.utime(settings_path, (stat.st_atime, stat.st_mtime + 10))
+        
+        assert store.reload_if_changed() is False
+        assert store.config['llm']['model'] == 'model-a'
+        assert store.prompts['welcome_message'] == 'Привет'
+        assert store.version == version
+        
+        # Пустой файл (сохранение не завершено) - тоже ошибка, а не пустая конфигурация
+        open(settings_path, 'w').close()
+        assert store.reload() is False
+        assert store.config['llm']['model'] == 'model-a'
+
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file
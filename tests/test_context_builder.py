@@ -0,0 +1,92 @@
+"""
+Тесты сборки контекста с бюджетом токенов.
+"""
+
+import pytest
+import os
+import sys
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from context_builder import build_messages, count_message_tokens, get_system_prefix
+from conversation_memory import conversation_memory
+
+
+def make_history(pairs, size):
+    """История из pairs пар вопрос-ответ длиной size символов."""
+    history = []
+    for i in range(pairs):
+        history.append({"role": "user", "content": f"{i}" + "в" * size})
+        history.append({"role": "assistant", "content": f"{i}" + "о" * size})
+    return history
+
+
+class TestContextBuilder:
+    """Тесты сборки контекста."""
+    
+    def test_all_history_fits(self):
+        """Тест что короткая история попадает в контекст целиком."""
+        history = make_history(3, 10)
+        messages = build_messages("Системный промпт", history, "Вопрос", 10000)
+        
+        assert messages[0]["role"] == "system"
+        assert messages[1:-1] == history
+        assert messages[-1] == {"role": "user", "content": "Вопрос"}
+    
+    def test_oldest_messages_dropped_first(self):
+        """Тест что при нехватке бюджета отбрасываются самые старые сообщения."""
+        history = make_history(5, 200)
+        budget = (count_message_tokens({"role": "system", "content": "Промпт"})
+                  + count_message_tokens({"role": "user", "content": "Вопрос"})
+                  + sum(count_message_tokens(m) for m in history[-4:]))
+        
+        messages = build_messages("Промпт", history, "Вопрос", budget)
+        
+        assert messages[1:-1] == history[-4:]
+    
+    def test_context_does_not_start_with_assistant(self):
+        """Тест что контекст не начинается с ответа без вопроса."""
+        history = make_history(3, 200)
+        budget = (count_message_tokens({"role": "system", "content": "Промпт"})
+                  + count_message_tokens({"role": "user", "content": "Вопрос"})
+                  + sum(count_message_tokens(m) for m in history[-3:]))
+        
+        messages = build_messages("Промпт", history, "Вопрос", budget)
+        
+        assert messages[1]["role"] == "user"
+        assert messages[1:-1] == history[-2:]
+    
+    def test_memory_keeps_token_counts(self):
+        """Тест что токены считаются при добавлении в память и используются при сборке."""
+        user_id = 999001
+        conversation_memory.clear_history(user_id)
+        try:
+            for message in make_history(3, 40):
+                conversation_memory.add_message(user_id, message["role"], message["content"])
+            history, tokens = conversation_memory.get_history_with_tokens(user_id, 4)
+            assert tokens == [count_message_tokens(m) for m in history]
+
+            # Сборка берет готовые числа, а не пересчитывает историю
+            messages = build_messages("Промпт", history, "Вопрос", 10000, history_tokens=[10000] * 4)
+            assert messages[1:-1] == []
+        finally:
+            conversation_memory.clear_history(user_id)
+    
+    def test_system_prefix_is_shared_and_immutable(self):
+        """Тест что префикс создается один раз на текст промпта и не изменяется."""
+        prefix = get_system_prefix("Системный промпт")
+        first = build_messages("Системный промпт", [], "Вопрос 1", 10000)
+        second = build_messages(prefix, [], "Вопрос 2", 10000)
+        
+        assert get_system_prefix("Системный промпт") is prefix
+        assert first[0] is second[0] is prefix.message
+        assert prefix.tokens == count_message_tokens({"role": "system", "content": "Системный промпт"})
+        with pytest.raises(TypeError):
+            prefix.message["content"] = "Другой промпт"
+        with pytest.raises(AttributeError):
+            prefix.tokens = 0
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,143 @@
+"""
+Тесты обработчиков сообщений.
+Сообщения Telegram и LLM клиент заменены простыми заглушками.
+"""
+
+import pytest
+import itertools
+import os
+import sys
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import EditMessageText
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from handlers import answer_streaming
+from outbound import configure_outbound, outbound_sender
+
+# Новый чат на каждое сообщение - лимиты чатов не переходят между тестами
+chat_ids = itertools.count(1)
+
+
+class FakeSentMessage:
+    """Отправленное ботом сообщение, которое можно редактировать."""
+
+    def __init__(self, text, retry_after_edits=0):
+        self.text = text
+        self.edits = []
+        # Сколько редактирований подряд Telegram отвечает RetryAfter
+        self.retry_after_edits = retry_after_edits
+
+    async def edit_text(self, text):
+        if self.retry_after_edits:
+            self.retry_after_edits -= 1
+            raise TelegramRetryAfter(EditMessageText(text=text), "Flood control", 1)
+        self.edits.append(text)
+        self.text = text
+
+
+class FakeMessage:
+    """Входящее сообщение пользователя."""
+
+    def __init__(self, retry_after_edits=0):
+        self.chat = SimpleNamespace(id=next(chat_ids))
+        self.sent = []
+        self.retry_after_edits = retry_after_edits
+
+    async def answer(self, text):
+        sent = FakeSentMessage(text, self.retry_after_edits)
+        self.retry_after_edits = 0
+        self.sent.append(sent)
+        return sent
+
+
+class FakeStreamingClient:
+    """LLM клиент, отдающий ответ фрагментами."""
+
+    def __init__(self, parts, edit_interval=0):
+        self.parts = parts
+        self.stream = True
+        self.stream_edit_interval = edit_interval
+
+    async def stream_response(self, user_message, user_id, user_name=None):
+        for part in self.parts:
+            yield part
+
+
+class TestStreamingHandler:
+    """Тесты потоковой выдачи ответа."""
+
+    def setup_method(self):
+        """Лимиты Telegram в этих тестах не проверяются - делаем их большими."""
+        outbound_sender.configure(global_rate=1000, global_burst=1000, chat_rate=1000, chat_burst=1000, max_retries=3)
+
+    def teardown_method(self):
+        """Возвращаем лимиты из settings.yaml."""
+        configure_outbound()
+
+    @pytest.mark.asyncio
+    async def test_placeholder_is_edited_to_full_text(self):
+        """Тест что заглушка редактируется до полного текста ответа."""
+        message = FakeMessage()
+        llm_client = FakeStreamingClient(["Мы ", "помогаем ", "бизнесу"])
+
+        response = await answer_streaming(message, llm_client, "Вопрос", 1, "Иван")
+
+        assert response == "Мы помогаем бизнесу"
+        assert len(message.sent) == 1
+        assert message.sent[0].text == "Мы помогаем бизнесу"
+
+    @pytest.mark.asyncio
+    async def test_edits_are_throttled(self):
+        """Тест что при большом интервале остается только финальное редактирование."""
+        message = FakeMessage()
+        llm_client = FakeStreamingClient(["a"] * 50, edit_interval=60)
+
+        await answer_streaming(message, llm_client, "Вопрос", 1, "Иван")
+
+        assert message.sent[0].edits == ["a" * 50]
+
+    @pytest.mark.asyncio
+    async def test_long_response_is_split(self):
+        """Тест что ответ длиннее лимита Telegram досылается отдельными сообщениями."""
+        message = FakeMessage()
+        llm_client = FakeStreamingClient(["x" * 5000])
+
+        await answer_streaming(message, llm_client, "Вопрос", 1, "Иван")
+        await outbound_sender.close()
+
+        assert len(message.sent) == 2
+        assert len(message.sent[0].text) == 4096
+        assert len(message.sent[1].text) == 5000 - 4096
+
+    @pytest.mark.asyncio
+    async def test_final_edit_is_retried_after_retry_after(self):
+        """Тест что финальное редактирование повторяется после RetryAfter."""
+        message = FakeMessage(retry_after_edits=1)
+        llm_client = FakeStreamingClient(["Полный ", "ответ"], edit_interval=60)
+
+        await answer_streaming(message, llm_client, "Вопрос", 1, "Иван")
+        await outbound_sender.close()
+
+        assert len(message.sent) == 1
+        assert message.sent[0].text == "Полный ответ"
+
+    @pytest.mark.asyncio
+    async def test_full_text_is_sent_when_edit_keeps_failing(self):
+        """Тест что при повторном отказе полный ответ досылается отдельным сообщением."""
+        message = FakeMessage(retry_after_edits=2)
+        llm_client = FakeStreamingClient(["Полный ", "ответ"], edit_interval=60)
+
+        await answer_streaming(message, llm_client, "Вопрос", 1, "Иван")
+        await outbound_sender.close()
+
+        assert len(message.sent) == 2
+        assert message.sent[0].edits == []
+        assert message.sent[1].text == "Полный ответ"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,110 @@
+"""
+Тесты ответов на типовые сообщения без LLM.
+"""
+
+import pytest
+import os
+import sys
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock, patch
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from intent_router import IntentRouter
+from handlers import process_user_batch
+from outbound import outbound_sender
+from user_dispatcher import UserBatch
+
+
+INTENTS = [
+    {"name": "greeting", "prompt": "welcome_message", "examples": ["привет", "здравствуйте", "добрый день"]},
+    {"name": "contact", "prompt": "contact_message", "examples": ["ваши контакты", "номер телефона"],
+     "patterns": ["(дайте|какой) (ваш )?(телефон|адрес)"]},
+    {"name": "hours", "prompt": "hours_message", "examples": ["режим работы", "часы работы"]},
+]
+
+
+def make_message(text):
+    """Сообщение пользователя с text и answer."""
+    return SimpleNamespace(
+        text=text,
+        chat=SimpleNamespace(id=1),
+        from_user=SimpleNamespace(id=1, first_name="Иван", username="ivan"),
+        answer=AsyncMock()
+    )
+
+
+class TestIntentRouter:
+    """Тесты сопоставления сообщений с намерениями."""
+
+    def test_exact_match_ignores_case_and_punctuation(self):
+        """Пример совпадает независимо от регистра и знаков препинания."""
+        match = IntentRouter(INTENTS).match("Добрый день!")
+        assert (match.name, match.prompt, match.method) == ("greeting", "welcome_message", "exact")
+
+    def test_regex_match(self):
+        """Регулярное выражение проверяется по всему нормализованному тексту."""
+        router = IntentRouter(INTENTS)
+        assert router.match("Дайте ваш телефон?").method == "regex"
+        assert router.match("Дайте ваш телефон?").name == "contact"
+
+    def test_trigram_match_with_typo(self):
+        """Фраза с опечаткой находится по триграммам, непохожая - нет."""
+        router = IntentRouter(INTENTS)
+        match = router.match("здраствуйте")
+        assert match.name == "greeting"
+        assert match.method == "trigram"
+        assert router.match("договор") is None
+
+    def test_near_miss_questions_go_to_llm(self):
+        """Похожий на пример вопрос с лишним словом не получает готовый ответ."""
+        router = IntentRouter(INTENTS)
+        assert router.match("режим работы склада") is None
+        assert router.match("номер телефона бухгалтера") is None
+        assert router.match("часы работы суда") is None
+        assert router.match("часы роботы").name == "hours"
+
+    def test_long_and_empty_messages_go_to_llm(self):
+        """Длинные и пустые сообщения не распознаются."""
+        router = IntentRouter(INTENTS, max_words=3)
+        assert router.match("Привет, нужна бухгалтерия для ООО на УСН") is None
+        assert router.match("") is None
+        assert router.match(None) is None
+
+
+class TestIntentHandler:
+    """Тесты ответа без LLM в очереди пользователя."""
+
+    @pytest.mark.asyncio
+    async def test_intent_is_answered_and_logged(self):
+        """Распознанное сообщение получает готовый ответ без запроса к LLM."""
+        message = make_message("Привет")
+        llm_client = MagicMock()
+
+        with patch('handlers.log_conversation') as log_conversation:
+            await process_user_batch(UserBatch(1, [message], 0.0), llm_client, intent_router=IntentRouter(INTENTS))
+        await outbound_sender.close()
+
+        message.answer.assert_awaited_once()
+        llm_client.refresh_settings.assert_not_called()
+        assert log_conversation.call_args.kwargs["intent"] == "greeting"
+
+    @pytest.mark.asyncio
+    async def test_batch_of_several_messages_goes_to_llm(self):
+        """Приветствие в серии сообщений - лишь вступление, отвечает модель."""
+        messages = [make_message("Привет"), make_message("Сколько стоит аудит?")]
+        llm_client = MagicMock(stream=False)
+        llm_client.get_response = AsyncMock(return_value="Ответ")
+        messages[-1].bot = SimpleNamespace(send_chat_action=AsyncMock())
+
+        with patch('handlers.log_conversation') as log_conversation:
+            await process_user_batch(UserBatch(1, messages, 0.0), llm_client, intent_router=IntentRouter(INTENTS))
+        await outbound_sender.close()
+
+        llm_client.get_response.assert_awaited_once()
+        assert log_conversation.call_args.kwargs.get("intent") is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
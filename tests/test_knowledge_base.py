@@ -0,0 +1,88 @@
+"""
+Тесты базы знаний с поиском BM25.
+"""
+
+import pytest
+import os
+import sys
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from knowledge_base import KnowledgeBase, format_knowledge, split_chunks, tokenize
+
+
+def write_file(path, text, mtime=None):
+    """Записать файл базы знаний (с заданным mtime, чтобы изменение было заметно)."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def knowledge_dir(tmp_path):
+    """Папка с тремя описаниями услуг."""
+    write_file(tmp_path / 'accounting.md', "# Бухгалтерия\n\nВедем бухгалтерский учет для ИП и ООО на УСН и ОСНО.")
+    write_file(tmp_path / 'legal.md', "# Юристы\n\nРегистрация компаний, договоры и арбитражные суды.")
+    write_file(tmp_path / 'crm.txt', "Внедрение CRM и автоматизация продаж.")
+    return tmp_path
+
+
+class TestKnowledgeBase:
+    """Тесты индекса и поиска."""
+
+    def test_tokenize_reduces_word_forms(self):
+        """Разные формы слова дают один терм, стоп-слова отбрасываются."""
+        assert tokenize("внедрить") == tokenize("внедрение")
+        assert tokenize("бухгалтерия") == tokenize("бухгалтерский")
+        assert tokenize("как и что") == []
+
+    def test_split_chunks_by_headings_and_size(self):
+        """Заголовки становятся названиями фрагментов, длинные разделы режутся по абзацам."""
+        content = "# Первый\n\nабзац один\n\nабзац два\n\n# Второй\n\n" + "\n\n".join(["длинный абзац"] * 5)
+        chunks = split_chunks("doc.md", content, chunk_chars=30)
+
+        assert chunks[0].title == "Первый"
+        assert chunks[0].text == "абзац один\n\nабзац два"
+        assert all(chunk.title == "Второй" for chunk in chunks[1:])
+        assert len(chunks) > 2
+
+    def test_search_ranks_relevant_chunk_first(self, knowledge_dir):
+        """Первым идет фрагмент о том, о чем спрашивают; нерелевантные отсекаются порогом."""
+        knowledge_base = KnowledgeBase(str(knowledge_dir))
+        knowledge_base.reload_if_changed()
+
+        results = knowledge_base.search("Сколько стоит бухгалтерия для ИП?", top_k=3, min_score=0.5)
+        assert results[0][0].title == "Бухгалтерия"
+        assert all(chunk.title != "Юристы" for chunk, _ in results)
+        assert knowledge_base.search("Здравствуйте", min_score=0.5) == []
+
+    def test_incremental_reindex(self, knowledge_dir):
+        """Измененный и удаленный файлы переиндексируются, остальные не трогаются."""
+        knowledge_base = KnowledgeBase(str(knowledge_dir))
+        knowledge_base.reload_if_changed()
+        crm_ids = set(knowledge_base._file_chunks[str(knowledge_dir / 'crm.txt')])
+
+        write_file(knowledge_dir / 'legal.md', "# Юристы\n\nСопровождение сделок с недвижимостью.", mtime=1)
+        os.remove(knowledge_dir / 'accounting.md')
+        assert knowledge_base.reload_if_changed()
+        assert not knowledge_base.reload_if_changed()
+
+        assert set(knowledge_base._file_chunks[str(knowledge_dir / 'crm.txt')]) == crm_ids
+        assert knowledge_base.search("бухгалтерия") == []
+        assert knowledge_base.search("недвижимость")[0][0].title == "Юристы"
+        assert "арбитраж"[:7] not in knowledge_base._postings
+
+    def test_format_knowledge_respects_budget(self, knowledge_dir):
+        """Фрагменты, не помещающиеся в бюджет токенов, не добавляются."""
+        knowledge_base = KnowledgeBase(str(knowledge_dir))
+        knowledge_base.reload_if_changed()
+        results = knowledge_base.search("бухгалтерия и CRM", top_k=3)
+
+        assert "[Бухгалтерия]" in format_knowledge(results, 1000)
+        assert format_knowledge(results, 5) == ""
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,392 @@
+"""
+Тесты LLM клиента.
+Вместо OpenRouter используется простая заглушка chat.completions.
+"""
+
+import pytest
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test-key")
+
+from openai import AsyncOpenAI
+
+from config import config_store
+from llm_client import create_llm_client
+from conversation_memory import conversation_memory
+from scheduler import LLMScheduler
+from retry_policy import CircuitBreaker
+from model_router import ModelRouter
+from knowledge_base import KnowledgeBase
+
+
+class FakeCompletions:
+    """Заглушка chat.completions с заданным ответом."""
+
+    def __init__(self, text="Ответ консультанта"):
+        self.text = text
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=self.text))],
+            usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5)
+        )
+
+
+class SlowCompletions(FakeCompletions):
+    """Заглушка, которая отвечает с задержкой и считает параллельные вызовы."""
+
+    def __init__(self, delay):
+        super().__init__()
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.cancelled = 0
+
+    async def create(self, **kwargs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.active -= 1
+        return await super().create(**kwargs)
+
+
+class StreamingCompletions:
+    """Заглушка потокового ответа: отдает текст заданными фрагментами."""
+
+    def __init__(self, parts):
+        self.parts = parts
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        return FakeStream(self.parts)
+
+
+class FakeStream:
+    """Асинхронный поток фрагментов в формате chat.completion.chunk."""
+
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for part in self.parts:
+            yield SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=part))],
+                usage=None
+            )
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=10, completion_tokens=3))
+
+    async def close(self):
+        self.closed = True
+
+
+def install_fake(llm_client, completions):
+    """Подменить транспорт клиента заглушкой."""
+    llm_client.client = SimpleNamespace(
+        chat=SimpleNamespace(completions=completions),
+        close=llm_client.client.close
+    )
+
+
+class TestLLMClient:
+    """Тесты LLM клиента."""
+
+    def setup_method(self):
+        """Настройка перед каждым тестом."""
+        self.test_user_id = 888888
+        conversation_memory.clear_history(self.test_user_id)
+
+    def test_uses_async_client_with_shared_pool(self):
+        """Тест что клиент использует AsyncOpenAI с собственным пулом соединений."""
+        llm_client = create_llm_client()
+        assert isinstance(llm_client.client, AsyncOpenAI)
+        assert llm_client.client._client is llm_client.http_client
+
+    @pytest.mark.asyncio
+    async def test_get_response_saves_history(self):
+        """Тест что ответ возвращается и сохраняется в историю."""
+        llm_client = create_llm_client()
+        completions = FakeCompletions()
+        install_fake(llm_client, completions)
+
+        response = await llm_client.get_response("Привет", self.test_user_id, "Иван")
+        await llm_client.close()
+
+        assert response == "Ответ консультанта"
+        assert len(completions.calls) == 1
+        history = conversation_memory.get_history(self.test_user_id)
+        assert history[-1] == {"role": "assistant", "content": "Ответ консультанта"}
+
+    @pytest.mark.asyncio
+    async def test_concurrency_is_limited(self):
+        """Тест что одновременно выполняется не больше max_concurrent_requests запросов."""
+        llm_client = create_llm_client()
+        llm_client.scheduler = LLMScheduler(max_concurrent=2)
+        completions = SlowCompletions(delay=0.05)
+        install_fake(llm_client, completions)
+
+        await asyncio.gather(*[
+            llm_client.get_response(f"Вопрос {i}", self.test_user_id + i) for i in range(6)
+        ])
+        await llm_client.close()
+
+        assert completions.max_active == 2
+        assert len(completions.calls) == 6
+        assert llm_client.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_timeout_cancels_request(self):
+        """Тест что запрос по таймауту действительно отменяется."""
+        llm_client = create_llm_client()
+        llm_client.timeout_seconds = 0.01
+        llm_client.max_retries = 0
+        completions = SlowCompletions(delay=1)
+        install_fake(llm_client, completions)
+
+        response = await llm_client.get_response("Вопрос", self.test_user_id)
+        await llm_client.close()
+
+        assert response == llm_client._get_error_message()
+        assert completions.cancelled == 1
+        assert completions.active == 0
+
+    @pytest.mark.asyncio
+    async def test_stream_response_yields_parts(self):
+        """Тест потоковой выдачи: фрагменты приходят по очереди, ответ сохраняется целиком."""
+        llm_client = create_llm_client()
+        completions = StreamingCompletions(["Добрый ", "день", "!"])
+        install_fake(llm_client, completions)
+
+        parts = [part async for part in llm_client.stream_response("Привет", self.test_user_id)]
+        await llm_client.close()
+
+        assert parts == ["Добрый ", "день", "!"]
+        assert completions.calls[0]["stream"] is True
+        history = conversation_memory.get_history(self.test_user_id)
+        assert history[-1] == {"role": "assistant", "content": "Добрый день!"}
+
+    @pytest.mark.asyncio
+    async def test_long_history_is_summarized_in_background(self):
+        """Тест фонового сжатия старой части диалога и его использования в контексте."""
+        llm_client = create_llm_client()
+        llm_client.summary_threshold = 4
+        llm_client.summary_keep_recent = 2
+        completions = FakeCompletions(text="Краткое содержание")
+        install_fake(llm_client, completions)
+
+        await llm_client.get_response("Первый вопрос", self.test_user_id)
+        await llm_client.get_response("Второй вопрос", self.test_user_id)
+        await asyncio.gather(*llm_client._background_tasks)
+
+        assert len(completions.calls) == 3
+        assert conversation_memory.get_summary(self.test_user_id) == "Краткое содержание"
+        assert len(conversation_memory.get_history(self.test_user_id)) == 2
+
+        await llm_client.get_response("Третий вопрос", self.test_user_id)
+        await llm_client.close()
+
+        system_messages = [m["content"] for m in completions.calls[-1]["messages"] if m["role"] == "system"]
+        assert any("Краткое содержание" in content for content in system_messages)
+
+    @pytest.mark.asyncio
+    async def test_repeated_first_question_served_from_cache(self):
+        """Тест что одинаковый первый вопрос другого клиента отдается из кеша."""
+        other_user_id = self.test_user_id + 100
+        conversation_memory.clear_history(other_user_id)
+        llm_client = create_llm_client()
+        completions = FakeCompletions(text="Мы оказываем бухгалтерские услуги")
+        install_fake(llm_client, completions)
+
+        first = await llm_client.get_response("Какие у вас услуги?", self.test_user_id)
+        second = await llm_client.get_response("какие у вас услуги", other_user_id)
+        await llm_client.close()
+
+        assert first == second
+        assert len(completions.calls) == 1
+        assert llm_client.response_cache.get_stats()["hits_normalized"] == 1
+        assert len(conversation_memory.get_history(other_user_id)) == 2
+        conversation_memory.clear_history(other_user_id)
+
+
+    @pytest.mark.asyncio
+    async def test_rate_limited_user_gets_overload_message(self):
+        """Тест что пользователь сверх лимита сразу получает сообщение о перегрузке."""
+        llm_client = create_llm_client()
+        llm_client.response_cache = None
+        llm_client.scheduler = LLMScheduler(user_rate_per_minute=1, user_burst=1)
+        completions = FakeCompletions()
+        install_fake(llm_client, completions)
+
+        first = await llm_client.get_response("Первый вопрос", self.test_user_id)
+        second = await llm_client.get_response("Второй вопрос", self.test_user_id)
+        await llm_client.close()
+
+        assert first == "Ответ консультанта"
+        assert second == llm_client._get_overload_message()
+        assert len(completions.calls) == 1
+        assert llm_client.scheduler.get_stats()["rejected_rate_limit"] == 1
+
+
+    @pytest.mark.asyncio
+    async def test_open_circuit_returns_error_without_request(self):
+        """Тест что при разомкнутом circuit breaker запрос не отправляется."""
+        llm_client = create_llm_client()
+        llm_client.response_cache = None
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+        breaker.record(asyncio.TimeoutError())
+        llm_client.router.breakers[llm_client.model] = breaker
+        completions = FakeCompletions()
+        install_fake(llm_client, completions)
+
+        response = await llm_client.get_response("Вопрос", self.test_user_id)
+        await llm_client.close()
+
+        assert response == llm_client._get_error_message()
+        assert completions.calls == []
+
+
+    @pytest.mark.asyncio
+    async def test_stream_hedges_to_backup_model(self):
+        """Тест что потоковый ответ берется у модели, первой приславшей фрагмент."""
+        llm_client = create_llm_client()
+        llm_client.response_cache = None
+        llm_client.router = ModelRouter(["primary", "backup"], hedge_enabled=True, hedge_delay=0.01)
+
+        class PerModelCompletions(StreamingCompletions):
+            async def create(self, **kwargs):
+                if kwargs["model"] == "primary":
+                    await asyncio.sleep(1)
+                return await super().create(**kwargs)
+
+        install_fake(llm_client, PerModelCompletions(["Ответ ", "резервной модели"]))
+
+        parts = [part async for part in llm_client.stream_response("Вопрос", self.test_user_id)]
+        await llm_client.close()
+
+        assert "".join(parts) == "Ответ резервной модели"
+        assert llm_client.in_flight == 0
+        assert llm_client.router.get_stats()["backup"]["samples"] == 1
+
+    @pytest.mark.asyncio
+    async def test_logs_record_routed_model(self, monkeypatch):
+        """Тест что ответы из кеша и ошибки записываются на модель, которая обслужила запрос."""
+        other_user_id = self.test_user_id + 200
+        conversation_memory.clear_history(other_user_id)
+        llm_client = create_llm_client()
+        llm_client.max_retries = 0
+        llm_client.router = ModelRouter(["primary", "backup"], hedge_enabled=False)
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+        breaker.record(asyncio.TimeoutError())
+        llm_client.router.breakers["primary"] = breaker
+        install_fake(llm_client, FakeCompletions())
+        logged = []
+        errors = []
+        monkeypatch.setattr("llm_client.log_llm_request", lambda **kwargs: logged.append(kwargs))
+        monkeypatch.setattr("llm_client.log_error", lambda **kwargs: errors.append(kwargs))
+
+        await llm_client.get_response("Какие у вас услуги?", self.test_user_id)
+        await llm_client.get_response("Какие у вас услуги?", other_user_id)
+
+        async def fail(**kwargs):
+            raise ValueError("bad request")
+
+        install_fake(llm_client, SimpleNamespace(create=fail))
+        await llm_client.get_response("Другой вопрос", self.test_user_id)
+        await llm_client.close()
+        conversation_memory.clear_history(other_user_id)
+
+        assert [(entry["status"], entry["model"]) for entry in logged] == [
+            ("success", "backup"), ("cache_hit", "backup"), ("error", "backup")
+        ]
+        assert errors[0]["additional_data"]["model"] == "backup"
+
+    @pytest.mark.asyncio
+    async def test_system_prefix_marked_for_prompt_caching(self, monkeypatch):
+        """Тест что системный префикс помечается cache_control только для указанных моделей."""
+        llm_client = create_llm_client()
+        llm_client.response_cache = None
+        llm_client.prompt_cache_models = ("anthropic/",)
+        completions = FakeCompletions()
+        install_fake(llm_client, completions)
+        logged = []
+        monkeypatch.setattr("llm_client.log_llm_request", lambda **kwargs: logged.append(kwargs))
+
+        async def create(**kwargs):
+            completions.calls.append(kwargs)
+            return SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content="Ответ"))],
+                usage=SimpleNamespace(prompt_tokens=600, completion_tokens=5,
+                                      prompt_tokens_details=SimpleNamespace(cached_tokens=512))
+            )
+        completions.create = create
+
+        llm_client.router = ModelRouter(["anthropic/claude"])
+        await llm_client.get_response("Первый вопрос", self.test_user_id)
+        llm_client.router = ModelRouter(["openai/gpt"])
+        await llm_client.get_response("Второй вопрос", self.test_user_id)
+        await llm_client.close()
+
+        cached_system, plain_system = completions.calls[0]["messages"][0], completions.calls[1]["messages"][0]
+        assert cached_system["content"][0]["cache_control"] == {"type": "ephemeral"}
+        assert cached_system["content"][0]["text"] == llm_client.system_prompt
+        # Для остальных моделей - тот же неизменяемый объект префикса
+        assert plain_system is llm_client.system_prefix.message
+        assert logged[0]["cached_tokens"] == 512
+
+    @pytest.mark.asyncio
+    async def test_relevant_knowledge_added_to_request(self, tmp_path):
+        """Тест что в запрос попадает только подходящий к вопросу фрагмент базы знаний."""
+        (tmp_path / 'legal.md').write_text("# Юристы\n\nРегистрация компаний и договоры.", encoding='utf-8')
+        (tmp_path / 'training.md').write_text("# Обучение\n\nКурсы по 1С для сотрудников.", encoding='utf-8')
+        llm_client = create_llm_client()
+        llm_client.response_cache = None
+        llm_client.knowledge_base = KnowledgeBase(str(tmp_path))
+        llm_client.knowledge_base.reload_if_changed()
+        completions = FakeCompletions()
+        install_fake(llm_client, completions)
+
+        await llm_client.get_response("Нужна регистрация компании", self.test_user_id)
+        await llm_client.close()
+
+        system_texts = [m["content"] for m in completions.calls[0]["messages"] if m["role"] == "system"]
+        assert any("Регистрация компаний" in text for text in system_texts)
+        assert not any("Курсы по 1С" in text for text in system_texts)
+
+
+    @pytest.mark.asyncio
+    async def test_settings_follow_config_reload(self):
+        """Тест что параметры запроса берутся из перезагруженной конфигурации."""
+        llm_client = create_llm_client()
+        llm_client.response_cache = None
+        completions = FakeCompletions()
+        install_fake(llm_client, completions)
+        try:
+            config_store.config['llm']['max_tokens'] = 123
+            config_store.version += 1
+            await llm_client.get_response("Вопрос", self.test_user_id)
+        finally:
+            config_store.reload()
+            await llm_client.close()
+
+        assert completions.calls[0]["max_tokens"] == 123
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,135 @@
+"""
+Тесты постоянного хранилища истории диалогов (SQLite).
+"""
+
+import pytest
+import os
+import sys
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from memory_storage import SQLiteStorage, create_storage
+from conversation_memory import conversation_memory
+
+
+class TestSQLiteStorage:
+    """Тесты SQLite хранилища."""
+    
+    def test_history_survives_reopen(self, tmp_path):
+        """Тест что история сохраняется между перезапусками."""
+        path = str(tmp_path / 'conversations.db')
+        storage = SQLiteStorage(path, flush_interval=0.01)
+        storage.append(1, "user", "Привет")
+        storage.append(1, "assistant", "Здравствуйте!")
+        storage.close()
+        
+        storage = SQLiteStorage(path)
+        history = storage.load_history(1, 10)
+        storage.close()
+        
+        assert history == [
+            {"role": "user", "content": "Привет"},
+            {"role": "assistant", "content": "Здравствуйте!"}
+        ]
+    
+    def test_history_is_trimmed_and_cleared(self, tmp_path):
+        """Тест ограничения числа сохраненных сообщений и очистки."""
+        path = str(tmp_path / 'conversations.db')
+        storage = SQLiteStorage(path, max_messages_per_user=3, flush_interval=0.01)
+        for i in range(10):
+            storage.append(1, "user", f"Сообщение {i}")
+        storage.append(2, "user", "Другой пользователь")
+        storage.clear(2)
+        storage.close()
+        
+        storage = SQLiteStorage(path)
+        history = storage.load_history(1, 10)
+        assert [m["content"] for m in history] == ["Сообщение 7", "Сообщение 8", "Сообщение 9"]
+        assert storage.load_history(2, 10) == []
+        storage.close()
+    
+    def test_summary_replaces_old_messages(self, tmp_path):
+        """Тест что сохранение summary удаляет сжатые сообщения."""
+        path = str(tmp_path / 'conversations.db')
+        storage = SQLiteStorage(path, flush_interval=0.01)
+        for i in range(5):
+            storage.append(1, "user", f"Сообщение {i}")
+        storage.save_summary(1, "Итог", keep_last=2)
+        storage.close()
+        
+        storage = SQLiteStorage(path)
+        assert storage.load_summary(1) == "Итог"
+        assert [m["content"] for m in storage.load_history(1, 10)] == ["Сообщение 3", "Сообщение 4"]
+        storage.close()
+    
+    def test_wal_mode_enabled(self, tmp_path):
+        """Тест что база открыта в режиме WAL."""
+        storage = SQLiteStorage(str(tmp_path / 'conversations.db'))
+        mode = storage._read_conn.execute("PRAGMA journal_mode").fetchone()[0]
+        storage.close()
+        assert mode == "wal"
+    
+    def test_memory_backend_has_no_storage(self):
+        """Тест что backend memory не создает постоянного хранилища."""
+        assert create_storage({'backend': 'memory'}) is None
+
+
+class TestMemoryWithStorage:
+    """Тесты ConversationMemory поверх SQLite."""
+    
+    def test_cold_user_is_loaded_from_storage(self, tmp_path):
+        """Тест подгрузки истории пользователя, которого нет в памяти."""
+        user_id = 777777
+        conversation_memory.storage = SQLiteStorage(str(tmp_path / 'conversations.db'), flush_interval=0.01)
+        try:
+            conversation_memory.add_message(user_id, "user", "Вопрос")
+            conversation_memory.storage.close()
+            conversation_memory.storage = SQLiteStorage(str(tmp_path / 'conversations.db'))
+            
+            # Имитируем перезапуск: в памяти истории нет
+            conversation_memory._remove(user_id)
+            assert conversation_memory.get_history(user_id) == [{"role": "user", "content": "Вопрос"}]
+        finally:
+            conversation_memory.clear_history(user_id)
+            conversation_memory.close()
+
+    def test_cleared_history_is_not_reloaded(self, tmp_path):
+        """Тест что после /clear история не возвращается из хранилища до записи очистки."""
+        user_id = 777778
+        conversation_memory.storage = SQLiteStorage(str(tmp_path / 'conversations.db'), flush_interval=0.01)
+        try:
+            conversation_memory.add_message(user_id, "user", "Старый вопрос")
+            conversation_memory.storage.close()
+            # Поток записи с большим интервалом: очистка надолго остается в очереди
+            conversation_memory.storage = SQLiteStorage(str(tmp_path / 'conversations.db'), flush_interval=60)
+            conversation_memory._remove(user_id)
+
+            conversation_memory.clear_history(user_id)
+            assert conversation_memory.get_history(user_id) == []
+            assert conversation_memory.get_summary(user_id) == ""
+        finally:
+            conversation_memory.close()
+
+        storage = SQLiteStorage(str(tmp_path / 'conversations.db'))
+        assert storage.load_history(user_id, 10) == []
+        storage.close()
+
+    def test_summary_of_cold_user_is_loaded(self, tmp_path):
+        """Тест что краткое содержание подгружается после перезапуска."""
+        user_id = 777779
+        storage = SQLiteStorage(str(tmp_path / 'conversations.db'), flush_interval=0.01)
+        storage.append(user_id, "user", "Вопрос")
+        storage.save_summary(user_id, "Клиент спрашивал про УСН", keep_last=1)
+        storage.close()
+
+        conversation_memory.storage = SQLiteStorage(str(tmp_path / 'conversations.db'))
+        try:
+            assert conversation_memory.get_summary(user_id) == "Клиент спрашивал про УСН"
+        finally:
+            conversation_memory.clear_history(user_id)
+            conversation_memory.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
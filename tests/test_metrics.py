@@ -0,0 +1,83 @@
+"""
+Тесты метрик в формате Prometheus.
+"""
+
+import pytest
+import os
+import sys
+
+from aiohttp.test_utils import TestClient, TestServer
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+import metrics
+from metrics import MetricsRegistry, create_metrics_app
+from logger import log_llm_request
+
+
+class TestMetricsRegistry:
+    """Тесты реестра метрик."""
+
+    def test_counter_and_gauge(self):
+        """Счетчик с метками и показатель, читаемый функцией."""
+        registry = MetricsRegistry()
+        requests = registry.counter("requests_total", "Запросы", ("model", "status"))
+        requests.inc("a", "success")
+        requests.inc("a", "success", amount=2)
+        depth = registry.gauge("queue_depth", "Очередь")
+        depth.set_function(lambda: 7)
+
+        text = registry.render()
+        assert "# TYPE requests_total counter" in text
+        assert 'requests_total{model="a",status="success"} 3' in text
+        assert "queue_depth 7" in text
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Корзины гистограммы накопительные, есть +Inf, сумма и число."""
+        registry = MetricsRegistry()
+        latency = registry.histogram("latency_seconds", "Задержка", ("model",), buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.7, 3):
+            latency.observe(value, "a")
+
+        text = registry.render()
+        assert 'latency_seconds_bucket{model="a",le="0.1"} 1' in text
+        assert 'latency_seconds_bucket{model="a",le="1"} 3' in text
+        assert 'latency_seconds_bucket{model="a",le="+Inf"} 4' in text
+        assert 'latency_seconds_count{model="a"} 4' in text
+        assert 'latency_seconds_sum{model="a"} 4.25' in text
+
+    def test_wrong_labels_and_duplicates(self):
+        """Неверное число меток и повторная регистрация - ошибка."""
+        registry = MetricsRegistry()
+        requests = registry.counter("requests_total", "Запросы", ("model",))
+        with pytest.raises(ValueError):
+            requests.inc()
+        with pytest.raises(ValueError):
+            registry.counter("requests_total", "Запросы")
+
+    def test_llm_request_log_updates_metrics(self):
+        """Запись о запросе к LLM увеличивает счетчики запросов и токенов."""
+        before = metrics.llm_tokens_total.value("metrics-test-model", "prompt")
+        log_llm_request(user_id=1, model="metrics-test-model", prompt_tokens=120, completion_tokens=30,
+                        response_time_ms=500, status="success")
+
+        assert metrics.llm_requests_total.value("metrics-test-model", "success") >= 1
+        assert metrics.llm_tokens_total.value("metrics-test-model", "prompt") == before + 120
+
+    @pytest.mark.asyncio
+    async def test_metrics_endpoint(self):
+        """/metrics отдает реестр процесса в текстовом формате."""
+        metrics.llm_in_flight.set_function(lambda: 3)
+        async with TestClient(TestServer(create_metrics_app())) as client:
+            response = await client.get("/metrics")
+            text = await response.text()
+
+        assert response.status == 200
+        assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert "llm_in_flight 3" in text
+        assert "# TYPE event_loop_lag_seconds histogram" in text
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,91 @@
+"""
+Тесты выбора модели и hedging.
+"""
+
+import pytest
+import asyncio
+import os
+import sys
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from model_router import ModelRouter
+from retry_policy import CircuitBreaker, CircuitOpenError
+
+
+class TestModelRouter:
+    """Тесты роутера моделей."""
+    
+    def test_prefers_faster_and_healthier_model(self):
+        """Тест порядка моделей по p95 и доле ошибок."""
+        router = ModelRouter(["slow", "fast", "broken"], min_samples=2)
+        for _ in range(5):
+            router.record_latency("slow", 4.0)
+            router.record_result("slow")
+            router.record_latency("fast", 0.5)
+            router.record_result("fast")
+            router.record_latency("broken", 0.1)
+            router.record_result("broken", asyncio.TimeoutError())
+        
+        assert router.candidates() == ["fast", "slow"]
+        assert router.get_stats()["fast"]["p50"] == 0.5
+    
+    def test_close_latencies_keep_configured_order(self):
+        """Тест что небольшая разница p95 не меняет приоритет моделей из настроек."""
+        router = ModelRouter(["primary", "secondary"], min_samples=2)
+        for _ in range(5):
+            router.record_latency("primary", 0.53)
+            router.record_result("primary")
+            router.record_latency("secondary", 0.50)
+            router.record_result("secondary")
+        
+        assert router.candidates() == ["primary", "secondary"]
+        assert router.candidates(avoid=["primary"]) == ["secondary", "primary"]
+    
+    def test_open_circuit_model_is_skipped(self):
+        """Тест что модель с разомкнутым circuit breaker не выбирается."""
+        router = ModelRouter(["a", "b"], breaker_factory=lambda: CircuitBreaker(failure_threshold=1, recovery_timeout=60))
+        router.record_result("a", asyncio.TimeoutError())
+        assert router.pick() == "b"
+        
+        router.record_result("b", asyncio.TimeoutError())
+        with pytest.raises(CircuitOpenError):
+            router.pick()
+    
+    @pytest.mark.asyncio
+    async def test_hedge_returns_first_answer(self):
+        """Тест что медленный запрос дублируется на следующую модель и берется первый ответ."""
+        router = ModelRouter(["primary", "backup"], hedge_enabled=True, hedge_delay=0.01)
+        delays = {"primary": 1.0, "backup": 0.01}
+        cancelled = []
+        
+        async def start(model):
+            try:
+                await asyncio.sleep(delays[model])
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+            return f"ответ {model}"
+        
+        result, model = await router.run(start)
+        
+        assert (result, model) == ("ответ backup", "backup")
+        assert cancelled == ["primary"]
+    
+    @pytest.mark.asyncio
+    async def test_no_hedge_when_primary_is_fast(self):
+        """Тест что быстрый ответ не порождает второго запроса."""
+        router = ModelRouter(["primary", "backup"], hedge_enabled=True, hedge_delay=0.5)
+        started = []
+        
+        async def start(model):
+            started.append(model)
+            return model
+        
+        assert await router.run(start) == ("primary", "primary")
+        assert started == ["primary"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
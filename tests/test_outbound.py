@@ -0,0 +1,153 @@
+"""
+Тесты очереди исходящих сообщений.
+"""
+
+import pytest
+import asyncio
+import os
+import sys
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from outbound import OutboundSender, split_message
+from scheduler import TokenBucket
+
+
+class FakeChat:
+    """Чат, записывающий отправленные части и время отправки."""
+
+    def __init__(self, retry_after_times=0):
+        self.sent = []
+        self.times = []
+        self.retry_after_times = retry_after_times
+
+    async def send(self, text):
+        if self.retry_after_times:
+            self.retry_after_times -= 1
+            raise TelegramRetryAfter(SendMessage(chat_id=1, text=text), "Flood control", 0)
+        self.sent.append(text)
+        self.times.append(time.monotonic())
+        return text
+
+
+class TestSplitMessage:
+    """Тесты разбиения длинных ответов."""
+
+    def test_short_text_is_one_part(self):
+        """Текст в пределах лимита не разбивается."""
+        assert split_message("Короткий ответ", limit=20) == ["Короткий ответ"]
+
+    def test_split_at_paragraph_and_sentence(self):
+        """Разрез по абзацу, а без абзацев - по концу предложения."""
+        assert split_message("Первый абзац.\n\nВторой абзац.", limit=20) == ["Первый абзац.", "Второй абзац."]
+        assert split_message("Раз два три. Четыре пять шесть.", limit=20) == ["Раз два три.", "Четыре пять шесть."]
+
+    def test_parts_fit_limit_in_utf16(self):
+        """Эмодзи занимают две единицы UTF-16, части не превышают лимит и не теряют текст."""
+        text = "😀" * 30
+        parts = split_message(text, limit=10)
+        assert all(len(part.encode('utf-16-le')) // 2 <= 10 for part in parts)
+        assert "".join(parts) == text
+
+
+class TestOutboundSender:
+    """Тесты отправки с ограничением скорости."""
+
+    def test_token_bucket_spacing(self):
+        """После исчерпания запаса каждая отправка ждет 1/rate секунд."""
+        bucket = TokenBucket(rate=10, capacity=2)
+        delays = [bucket.reserve() for _ in range(4)]
+        assert delays[:2] == [0, 0]
+        assert delays[2] == pytest.approx(0.1, abs=0.01)
+        assert delays[3] == pytest.approx(0.2, abs=0.01)
+
+    @pytest.mark.asyncio
+    async def test_chat_rate_and_order(self):
+        """Сообщения чата отправляются по порядку и не чаще лимита чата."""
+        sender = OutboundSender(global_rate=1000, global_burst=1000, chat_rate=20, chat_burst=1)
+        chat = FakeChat()
+        futures = [sender.send(1, f"сообщение {n}", chat.send) for n in range(4)]
+        await sender.close()
+
+        assert chat.sent == [f"сообщение {n}" for n in range(4)]
+        assert chat.times[-1] - chat.times[0] >= 3 / 20 * 0.9
+        assert futures[0].result() == ["сообщение 0"]
+
+    @pytest.mark.asyncio
+    async def test_retry_after_is_retried(self):
+        """После RetryAfter сообщение отправляется повторно, а сверх max_retries - ошибка."""
+        sender = OutboundSender(max_retries=2)
+        chat = FakeChat(retry_after_times=2)
+        sent = await sender.send(1, "ответ", chat.send)
+        assert sent == ["ответ"]
+
+        failing = FakeChat(retry_after_times=5)
+        with pytest.raises(TelegramRetryAfter):
+            await sender.send(2, "ответ", failing.send)
+
+    @pytest.mark.asyncio
+    async def test_chats_do_not_block_each_other(self):
+        """Пауза одного чата не задерживает другие."""
+        sender = OutboundSender(global_rate=1000, global_burst=1000, chat_rate=1, chat_burst=1)
+        slow, fast = FakeChat(), FakeChat()
+        sender.send(1, "первое", slow.send)
+        sender.send(1, "второе", slow.send)
+        await asyncio.wait_for(sender.send(2, "другой чат", fast.send), 0.5)
+
+        assert fast.sent == ["другой чат"]
+        assert slow.sent == ["первое"]
+        await sender.close()
+
+    @pytest.mark.asyncio
+    async def test_wait_sent_and_close_report_failures(self):
+        """wait_sent ждет доставки очереди чата, close отменяет и считает неотправленное."""
+        sender = OutboundSender(global_rate=1000, global_burst=1000, chat_rate=1000, chat_burst=1000)
+        chat = FakeChat()
+        sender.send(1, "ответ", chat.send)
+        assert await sender.wait_sent(1)
+        assert chat.sent == ["ответ"]
+
+        slow = OutboundSender(global_rate=1000, global_burst=1000, chat_rate=0.1, chat_burst=1)
+        for n in range(3):
+            slow.send(2, f"сообщение {n}", FakeChat().send)
+        waiting = asyncio.create_task(slow.wait_sent(2))
+        assert await slow.close(timeout=0.05) == 2
+        assert not await waiting
+
+    def test_flood_in_several_chats_pauses_everything(self):
+        """RetryAfter в одном чате ставит на паузу только его, в нескольких - всю отправку."""
+        sender = OutboundSender()
+        sender.pause(1, 5)
+        assert sender.global_bucket.reserve() == 0
+        sender.pause(2, 5)
+        assert sender.global_bucket.reserve() == pytest.approx(5, abs=0.1)
+
+    @pytest.mark.asyncio
+    async def test_edits_are_charged_to_chat_limit(self):
+        """Редактирования вне очереди расходуют лимит чата."""
+        sender = OutboundSender(global_rate=1000, global_burst=1000, chat_rate=10, chat_burst=1)
+        started = time.monotonic()
+        for _ in range(3):
+            await sender.throttle(1)
+        assert time.monotonic() - started >= 2 / 10 * 0.9
+
+    def test_global_limit_is_split_between_workers(self, monkeypatch):
+        """Каждый воркер получает свою долю общего лимита бота."""
+        import outbound
+        monkeypatch.setattr(outbound, 'get_section', lambda name: {'global_rate': 24, 'global_burst': 6})
+        try:
+            outbound.configure_outbound(workers=4)
+            assert outbound.outbound_sender.global_bucket.rate == 6
+            assert outbound.outbound_sender.global_bucket.capacity == 1.5
+        finally:
+            monkeypatch.undo()
+            outbound.configure_outbound()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
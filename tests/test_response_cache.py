@@ -0,0 +1,106 @@
+"""
+Тесты кеша ответов LLM.
+"""
+
+import pytest
+import os
+import sys
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from response_cache import ResponseCache, normalize_text
+
+MODEL = "test/model"
+CONTEXT = [{"role": "system", "content": "Ты консультант"}]
+
+
+class TestResponseCache:
+    """Тесты кеша ответов."""
+    
+    def test_exact_and_normalized_hits(self):
+        """Тест попаданий по точному и нормализованному тексту."""
+        cache = ResponseCache()
+        cache.put(MODEL, CONTEXT, "Сколько стоит бухгалтерия?", "От 10 000 руб.")
+        
+        assert cache.get(MODEL, CONTEXT, "Сколько стоит бухгалтерия?") == "От 10 000 руб."
+        assert cache.get(MODEL, CONTEXT, "  сколько СТОИТ бухгалтерия ") == "От 10 000 руб."
+        assert cache.stats["hits_exact"] == 1
+        assert cache.stats["hits_normalized"] == 1
+    
+    def test_source_model_is_kept(self):
+        """Тест что вместе с ответом хранится модель, которая его дала."""
+        cache = ResponseCache()
+        cache.put(MODEL, CONTEXT, "Вопрос", "Ответ", source="backup/model")
+        
+        assert cache.get_with_source(MODEL, CONTEXT, "вопрос") == ("Ответ", "backup/model")
+        assert cache.get_with_source(MODEL, CONTEXT, "Другой") is None
+    
+    def test_different_context_misses(self):
+        """Тест что другой контекст или модель не дают попадания."""
+        cache = ResponseCache()
+        cache.put(MODEL, CONTEXT, "Вопрос", "Ответ")
+        
+        other_context = CONTEXT + [{"role": "user", "content": "Ранее"}]
+        assert cache.get(MODEL, other_context, "Вопрос") is None
+        assert cache.get("other/model", CONTEXT, "Вопрос") is None
+        assert cache.stats["misses"] == 2
+    
+    def test_user_name_is_substituted(self):
+        """Тест что имя клиента в ответе подменяется на имя нового клиента."""
+        cache = ResponseCache()
+        cache.put(MODEL, CONTEXT, "Привет", "Здравствуйте, Иван!", user_name="Иван")
+        
+        assert cache.get(MODEL, CONTEXT, "Привет", user_name="Мария") == "Здравствуйте, Мария!"
+    
+    def test_default_name_and_ordinary_words_are_kept(self):
+        """Тест что слово "клиент" и имя вне обращения не подменяются на имя другого клиента."""
+        cache = ResponseCache()
+        reply = "Каждый клиент получает персонального бухгалтера."
+        cache.put(MODEL, CONTEXT, "Как вы работаете?", reply, user_name="клиент")
+        
+        assert cache.get(MODEL, CONTEXT, "Как вы работаете?", user_name="Мария") == reply
+        
+        # Имя осталось в тексте не как обращение - такой ответ не кешируется
+        cache.put(MODEL, CONTEXT, "Кто ведет учет?", "Ваш бухгалтер Иван Петров.", user_name="Иван")
+        assert cache.get(MODEL, CONTEXT, "Кто ведет учет?", user_name="Мария") is None
+    
+    def test_ttl_and_lru_eviction(self):
+        """Тест удаления по TTL и по лимиту записей."""
+        cache = ResponseCache(max_entries=2, ttl_seconds=-1)
+        cache.put(MODEL, CONTEXT, "Первый", "1")
+        assert cache.get(MODEL, CONTEXT, "Первый") is None
+        
+        cache = ResponseCache(max_entries=2)
+        for text in ("Первый", "Второй", "Третий"):
+            cache.put(MODEL, CONTEXT, text, text)
+        assert cache.get(MODEL, CONTEXT, "Первый") is None
+        assert cache.get(MODEL, CONTEXT, "Третий") == "Третий"
+        assert cache.stats["evictions"] == 1
+    
+    def test_semantic_layer(self):
+        """Тест поиска похожих вопросов по триграммам."""
+        cache = ResponseCache(semantic_enabled=True, semantic_threshold=0.7)
+        cache.put(MODEL, CONTEXT, "Сколько стоит бухгалтерское сопровождение?", "От 10 000 руб.")
+        
+        assert cache.get(MODEL, CONTEXT, "сколько стоит бухгалтерское сопровождение ООО") == "От 10 000 руб."
+        assert cache.get(MODEL, CONTEXT, "Нужен юрист по трудовым спорам") is None
+        assert cache.stats["hits_semantic"] == 1
+    
+    def test_semantic_layer_respects_numbers_and_negation(self):
+        """Тест что вопрос с другим числом или отрицанием не получает чужой ответ."""
+        cache = ResponseCache(semantic_enabled=True, semantic_threshold=0.85)
+        cache.put(MODEL, CONTEXT, "Сколько стоит тариф 1 для ООО?", "5 000 руб.")
+        cache.put(MODEL, CONTEXT, "Можно ли перейти на УСН с середины года?", "Нет")
+        
+        assert cache.get(MODEL, CONTEXT, "Сколько стоит тариф 2 для ООО?") is None
+        assert cache.get(MODEL, CONTEXT, "Нельзя ли перейти на УСН с середины года?") is None
+        assert cache.get(MODEL, CONTEXT, "сколько стоит тариф 1 для ООО сейчас") == "5 000 руб."
+    
+    def test_normalize_text(self):
+        """Тест нормализации текста."""
+        assert normalize_text("Ещё  раз, ПОЖАЛУЙСТА!") == "еще раз пожалуйста"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,84 @@
+"""
+Тесты политики повторов и circuit breaker.
+"""
+
+import pytest
+import asyncio
+import os
+import sys
+
+import httpx
+from openai import BadRequestError, RateLimitError
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from retry_policy import CircuitBreaker, CircuitOpenError, RetryPolicy, is_retryable
+
+
+def make_status_error(error_class, status_code, headers=None):
+    """Ошибка OpenAI SDK с заданным HTTP ответом."""
+    request = httpx.Request("POST", "https://openrouter.ai/api/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers or {}, request=request)
+    return error_class("error", response=response, body=None)
+
+
+class TestRetryPolicy:
+    """Тесты политики повторов."""
+    
+    def test_bad_request_is_not_retried(self):
+        """Тест что ошибки в запросе (4xx) не повторяются."""
+        policy = RetryPolicy()
+        error = make_status_error(BadRequestError, 400)
+        assert not is_retryable(error)
+        assert policy.get_delay(error, 0) is None
+    
+    def test_retry_after_is_honored(self):
+        """Тест что пауза берется из Retry-After."""
+        policy = RetryPolicy(max_retry_after=30)
+        assert policy.get_delay(make_status_error(RateLimitError, 429, {"retry-after": "7"}), 0) == 7
+        assert policy.get_delay(make_status_error(RateLimitError, 429, {"retry-after": "120"}), 0) is None
+    
+    def test_backoff_grows_with_jitter(self):
+        """Тест что пауза случайная и не превышает экспоненциальную границу."""
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        delays = [policy.get_delay(asyncio.TimeoutError(), 2) for _ in range(50)]
+        assert all(0 <= delay <= 4 for delay in delays)
+        assert len(set(delays)) > 1
+        assert all(policy.get_delay(asyncio.TimeoutError(), 10) <= 5 for _ in range(50))
+
+
+class TestCircuitBreaker:
+    """Тесты circuit breaker."""
+    
+    def test_opens_after_failures_and_recovers(self):
+        """Тест размыкания после серии сбоев и восстановления после пробного запроса."""
+        breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=0)
+        for _ in range(2):
+            breaker.before_call()
+            breaker.record(asyncio.TimeoutError())
+        assert breaker.state == CircuitBreaker.OPEN
+        
+        # recovery_timeout прошел: один пробный запрос, остальные ждут его результата
+        breaker.before_call()
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+        breaker.record()
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_open_circuit_fails_fast(self):
+        """Тест что разомкнутый breaker сразу отклоняет запросы."""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=60)
+        breaker.record(asyncio.TimeoutError())
+        with pytest.raises(CircuitOpenError):
+            breaker.before_call()
+    
+    def test_client_errors_do_not_open_circuit(self):
+        """Тест что ошибки в запросе не считаются сбоем апстрима."""
+        breaker = CircuitBreaker(failure_threshold=1)
+        breaker.record(make_status_error(BadRequestError, 400))
+        assert breaker.state == CircuitBreaker.CLOSED
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,87 @@
+"""
+Тесты планировщика запросов к LLM.
+"""
+
+import pytest
+import asyncio
+import os
+import sys
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from scheduler import LLMScheduler, SchedulerRejected, TokenBucket
+
+
+class TestTokenBucket:
+    """Тесты token bucket."""
+    
+    def test_burst_then_reject(self):
+        """Тест что запас расходуется и дальше запросы отклоняются."""
+        bucket = TokenBucket(rate=0.001, capacity=2)
+        assert bucket.try_consume()
+        assert bucket.try_consume()
+        assert not bucket.try_consume()
+
+
+class TestLLMScheduler:
+    """Тесты планировщика."""
+    
+    @pytest.mark.asyncio
+    async def test_fair_queue_serves_quiet_user_first(self):
+        """Тест что запрос тихого пользователя не ждет всю серию активного."""
+        scheduler = LLMScheduler(max_concurrent=1)
+        order = []
+        
+        async def request(user_id):
+            await scheduler.acquire(user_id)
+            order.append(user_id)
+            await asyncio.sleep(0.01)
+            scheduler.release()
+        
+        await scheduler.acquire(0)
+        tasks = [asyncio.create_task(request(1)) for _ in range(5)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(request(2)))
+        await asyncio.sleep(0)
+        scheduler.release()
+        await asyncio.gather(*tasks)
+        
+        assert order.index(2) <= 1
+        assert scheduler.in_flight == 0
+        assert scheduler.waiting == 0
+    
+    @pytest.mark.asyncio
+    async def test_full_queue_rejects_immediately(self):
+        """Тест что при переполненной очереди запрос сразу отклоняется."""
+        scheduler = LLMScheduler(max_concurrent=1, max_queue_size=1)
+        await scheduler.acquire(1)
+        waiter = asyncio.create_task(scheduler.acquire(2))
+        await asyncio.sleep(0)
+        
+        with pytest.raises(SchedulerRejected) as error:
+            await scheduler.acquire(3)
+        assert error.value.reason == "queue_full"
+        
+        scheduler.release()
+        await waiter
+        scheduler.release()
+        assert scheduler.in_flight == 0
+    
+    @pytest.mark.asyncio
+    async def test_queue_timeout_passes_slot_on(self):
+        """Тест отклонения по таймауту ожидания без потери слота."""
+        scheduler = LLMScheduler(max_concurrent=1, max_queue_wait=0.01)
+        await scheduler.acquire(1)
+        
+        with pytest.raises(SchedulerRejected):
+            await scheduler.acquire(2)
+        
+        scheduler.release()
+        assert scheduler.in_flight == 0
+        await scheduler.acquire(3)
+        assert scheduler.in_flight == 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
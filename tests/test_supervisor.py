@@ -0,0 +1,68 @@
+"""
+Тесты режима нескольких процессов.
+"""
+
+import pytest
+import os
+import sys
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+# Воркеры наследуют окружение супервизора
+os.environ.setdefault("OPENROUTER_API_KEY", "test-key")
+
+from supervisor import Supervisor, extract_user_id, shard_for
+
+
+def make_update(update_id, user_id):
+    """Обновление без обработчиков (edited_message) от заданного пользователя."""
+    return {
+        "update_id": update_id,
+        "edited_message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Иван"},
+            "text": "Привет"
+        }
+    }
+
+
+class TestRouting:
+    """Тесты распределения обновлений."""
+    
+    def test_extract_user_id(self):
+        """Тест извлечения отправителя из разных типов обновлений."""
+        assert extract_user_id(make_update(1, 42)) == 42
+        assert extract_user_id({"update_id": 1, "callback_query": {"id": "1", "from": {"id": 7}}}) == 7
+        assert extract_user_id({"update_id": 1}) == 0
+    
+    def test_user_always_goes_to_same_shard(self):
+        """Тест что пользователь всегда попадает к одному воркеру."""
+        assert shard_for(1001, 4) == shard_for(1001, 4)
+        assert {shard_for(user_id, 4) for user_id in range(100)} == {0, 1, 2, 3}
+
+
+class TestSupervisor:
+    """Тест запуска и остановки воркеров."""
+    
+    @pytest.mark.asyncio
+    async def test_workers_process_and_report(self):
+        """Тест что воркеры получают обновления, присылают отчеты и останавливаются."""
+        supervisor = Supervisor("123456:TEST", workers=2, health_interval=0.2, shutdown_timeout=30)
+        supervisor.start()
+        for update_id, user_id in enumerate([10, 11, 12]):
+            supervisor.route(make_update(update_id, user_id))
+        
+        await supervisor.stop()
+        
+        assert supervisor.routed == [2, 1]
+        assert supervisor.reports[0]["processed"] == 2
+        assert supervisor.reports[1]["processed"] == 1
+        assert all(not process.is_alive() for process in supervisor._processes)
+        assert len(supervisor.health_report()) == 2
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
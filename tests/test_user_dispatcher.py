@@ -0,0 +1,87 @@
+"""
+Тесты очереди сообщений пользователей.
+"""
+
+import pytest
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from user_dispatcher import UserDispatcher
+
+
+def make_message(text):
+    """Простое сообщение с текстом."""
+    return SimpleNamespace(text=text)
+
+
+class TestUserDispatcher:
+    """Тесты диспетчера сообщений."""
+    
+    @pytest.mark.asyncio
+    async def test_rapid_messages_are_merged(self):
+        """Тест объединения серии быстрых сообщений в один пакет."""
+        batches = []
+        
+        async def process(batch):
+            batches.append(batch.text)
+        
+        dispatcher = UserDispatcher(process, debounce_seconds=0.05)
+        for text in ("Здравствуйте", "Нужна бухгалтерия", "Для ООО"):
+            dispatcher.submit(1, make_message(text))
+        await dispatcher.close()
+        
+        assert batches == ["Здравствуйте\nНужна бухгалтерия\nДля ООО"]
+        assert dispatcher.active_users == 0
+    
+    @pytest.mark.asyncio
+    async def test_processing_is_serialized_per_user(self):
+        """Тест что пакеты одного пользователя не обрабатываются параллельно."""
+        active = {1: 0, 2: 0}
+        max_active = {1: 0, 2: 0}
+        order = []
+        
+        async def process(batch):
+            active[batch.user_id] += 1
+            max_active[batch.user_id] = max(max_active[batch.user_id], active[batch.user_id])
+            await asyncio.sleep(0.05)
+            order.append(batch.text)
+            active[batch.user_id] -= 1
+        
+        dispatcher = UserDispatcher(process, debounce_seconds=0)
+        dispatcher.submit(1, make_message("Первый"))
+        dispatcher.submit(2, make_message("Другой"))
+        await asyncio.sleep(0.01)
+        dispatcher.submit(1, make_message("Второй"))
+        await dispatcher.close()
+        
+        assert max_active == {1: 1, 2: 1}
+        assert order.index("Первый") < order.index("Второй")
+    
+    @pytest.mark.asyncio
+    async def test_new_message_cancels_uncommitted_processing(self):
+        """Тест отмены необработанного ответа новым сообщением."""
+        results = []
+        started = asyncio.Event()
+        
+        async def process(batch):
+            started.set()
+            await asyncio.sleep(0.1)
+            batch.commit()
+            results.append(batch.text)
+        
+        dispatcher = UserDispatcher(process, debounce_seconds=0, cancel_superseded=True)
+        dispatcher.submit(1, make_message("Первый"))
+        await started.wait()
+        dispatcher.submit(1, make_message("Уточнение"))
+        await dispatcher.close()
+        
+        assert results == ["Первый\nУточнение"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,64 @@
+"""
+Тесты прогрева соединений при запуске.
+"""
+
+import pytest
+import os
+import sys
+
+# Добавляем src и bench в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'bench'))
+
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
+
+from aiogram import Bot
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+
+from config import config_store
+from llm_client import LLMClient
+from runtime import warm_up_bot
+from fake_servers import start_fake_servers
+
+
+def make_llm_client(base_url):
+    """LLM клиент с заданным адресом API."""
+    config_store.config['llm']['base_url'] = base_url
+    try:
+        return LLMClient()
+    finally:
+        config_store.reload()
+
+
+class TestWarmUp:
+    """Тесты прогрева Telegram и OpenRouter."""
+
+    @pytest.mark.asyncio
+    async def test_warm_up_opens_connections(self):
+        """get_me и список моделей проходят до первого сообщения."""
+        runner, telegram_url, llm_url, _, fake_telegram = await start_fake_servers()
+        bot = Bot(token="123456:TEST-token", session=AiohttpSession(api=TelegramAPIServer.from_base(telegram_url)))
+        llm_client = make_llm_client(llm_url)
+        try:
+            assert await warm_up_bot(bot)
+            assert await llm_client.warm_up()
+        finally:
+            await llm_client.close()
+            await bot.session.close()
+            await runner.cleanup()
+
+        assert fake_telegram.calls == {"getMe": 1}
+
+    @pytest.mark.asyncio
+    async def test_unreachable_api_does_not_fail_startup(self):
+        """Недоступный API - предупреждение в логе, а не ошибка запуска."""
+        llm_client = make_llm_client("http://127.0.0.1:9/v1")
+        try:
+            assert not await llm_client.warm_up(timeout=2)
+        finally:
+            await llm_client.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])
@@ -0,0 +1,85 @@
+"""
+Тесты webhook сервера.
+"""
+
+import pytest
+import os
+import sys
+
+from aiogram import Bot, Dispatcher
+from aiohttp.test_utils import TestClient, TestServer
+
+# Добавляем src в путь для импортов
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from webhook import create_webhook_app
+
+
+# Обновление, для которого нет обработчиков (edited_message)
+UPDATE = {
+    "update_id": 1,
+    "edited_message": {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "Привет"}
+}
+
+WEBHOOK_CONFIG = {
+    'enabled': True,
+    'base_url': 'https://bot.example.com',
+    'path': '/telegram/webhook',
+    'host': '127.0.0.1',
+    'port': 8080,
+    'secret_token': 'secret',
+    'drop_pending_updates': False,
+    'delete_on_shutdown': True
+}
+
+
+class RecordingBot(Bot):
+    """Бот, который не ходит в Telegram, а запоминает вызовы webhook API."""
+    
+    def __init__(self):
+        super().__init__(token="123456:TEST")
+        self.calls = []
+    
+    async def set_webhook(self, **kwargs):
+        self.calls.append(("set_webhook", kwargs))
+        return True
+    
+    async def delete_webhook(self, **kwargs):
+        self.calls.append(("delete_webhook", kwargs))
+        return True
+
+
+class TestWebhook:
+    """Тесты webhook приложения."""
+    
+    @pytest.mark.asyncio
+    async def test_lifecycle_and_secret_check(self):
+        """Тест регистрации webhook, проверки секрета и удаления при остановке."""
+        bot = RecordingBot()
+        dp = Dispatcher()
+        app = create_webhook_app(bot, dp, WEBHOOK_CONFIG)
+        
+        async with TestClient(TestServer(app)) as client:
+            assert bot.calls[0][0] == "set_webhook"
+            assert bot.calls[0][1]["url"] == "https://bot.example.com/telegram/webhook"
+            assert bot.calls[0][1]["secret_token"] == "secret"
+            
+            response = await client.post('/telegram/webhook', json=UPDATE)
+            assert response.status == 401
+            
+            response = await client.post(
+                '/telegram/webhook',
+                json=UPDATE,
+                headers={"X-Telegram-Bot-Api-Secret-Token": "secret"}
+            )
+            assert response.status == 200
+            
+            response = await client.get('/healthz')
+            assert await response.text() == "ok"
+        
+        assert bot.calls[-1][0] == "delete_webhook"
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__])